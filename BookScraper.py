@@ -1,35 +1,72 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 import time
 import html
 import json
 import os
-from bs4 import BeautifulSoup
+import hashlib
+from bs4 import BeautifulSoup, Comment, NavigableString
 import requests
+from ratelimit import limited
+from retry import DEFAULT_RETRY, HTTPStatusError
+from metrics import METRICS, timed
+
+# lxml tokenises faster than Python's html.parser; fall back to the
+# standard library when it is not installed
+try:
+    import lxml  # noqa: F401
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+
+
+def book_hash(book_data):
+    """
+    Fingerprint the extracted data of one book.
+
+    Usage statistics are left out: the view and download counters change
+    all the time without the record itself changing.
+    """
+    metadata = {k: v for k, v in book_data.get('metadata', {}).items() if k != 'Usage Statistics'}
+    content = json.dumps({'links': book_data.get('links', {}), 'metadata': metadata},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
     
 class BookScraper:
-    def __init__(self, url=None, driver = None,  headless=True):
+    def __init__(self, url=None, driver = None,  headless=True, session=None, limiter=None, parser=None,
+                 cache=None, conditional=False, retry=None):
         """
         Initialize the BookScraper with optional URL.
         
         Args:
             url (str, optional): URL of the book page to scrape.
             headless (bool): Run browser in headless mode if True.
+            session (requests.Session, optional): Session used to fetch pages.
+                Pass a shared session to reuse keep-alive connections.
+            limiter (AdaptiveLimiter, optional): Throttle shared with the other
+                workers; every page request takes one of its slots.
+            parser (str, optional): BeautifulSoup tree builder, e.g. "lxml" or
+                "html.parser". Defaults to the fastest one installed.
+            cache (PageCache, optional): Where to keep a copy of every fetched
+                page so it can be re-parsed offline later.
+            conditional (bool): Send If-None-Match/If-Modified-Since with the
+                validators of the cached copy, so unchanged pages cost a 304.
+            retry (RetryPolicy, optional): How transient request failures are
+                retried. Defaults to `retry.DEFAULT_RETRY`.
         """
-        # Setup Chrome options
-        self.chrome_options = Options()
-        if headless:
-            self.chrome_options.add_argument("--headless")
-        self.chrome_options.add_argument("--no-sandbox")
-        self.chrome_options.add_argument("--disable-dev-shm-usage")
-        
-        # Initialize webdriver
+        # Chrome options are built with the driver; see _initialize_driver
+        self.headless = headless
         self.driver = driver
+        self.session = session if session is not None else requests
+        self.limiter = limiter
+        self.parser = parser or DEFAULT_PARSER
+        self.cache = cache
+        self.conditional = conditional
+        self.retry = retry or DEFAULT_RETRY
+        # Whether the last scrape found different data than the cached copy
+        self.changed = True
+        self.headers = None
+        self.previous = None
+        # The exception that made the last scrape return None, if any
+        self.error = None
         
         if url:
             self.url = url
@@ -48,6 +85,18 @@ class BookScraper:
     def _initialize_driver(self):
         """Initialize the Selenium webdriver if not already initialized."""
         if self.driver is None:
+            # Imported here so scraping over HTTP never loads Selenium
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+            from selenium.webdriver.chrome.service import Service
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            self.chrome_options = Options()
+            if self.headless:
+                self.chrome_options.add_argument("--headless")
+            self.chrome_options.add_argument("--no-sandbox")
+            self.chrome_options.add_argument("--disable-dev-shm-usage")
+
             self.service = Service(ChromeDriverManager().install())
             self.driver = webdriver.Chrome(service=self.service, options=self.chrome_options)
     
@@ -65,7 +114,8 @@ class BookScraper:
             url (str, optional): URL to scrape. If not provided, uses the URL from initialization.
             
         Returns:
-            dict: Dictionary containing book metadata and links.
+            dict: Dictionary containing book metadata and links, or None if the
+            request failed or the page was not modified (see `self.changed`).
         """
         try:
             if url:
@@ -93,43 +143,237 @@ class BookScraper:
             # )
             
 
-            response = requests.get(self.url,verify=False)
-
-            if response.status_code != 200:
-                print(f"Failed to retrieve the webpage. Status code: {response.status_code}")
+            page_source = self.fetch()
+            if page_source is None:
                 return None
-            # Parse the page content with BeautifulSoup
-            page_source = response.text
 
-            # # Get page source and parse with BeautifulSoup
-            # page_source = self.driver.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            # Extract download links
-            self._extract_download_links(soup)
-            
-            # Extract metadata
-            self._extract_metadata(soup)
-            
-            return self.book_dict
+            return self.process(page_source, self.headers, self.previous)
         
         except Exception as e:
+            self.error = e
+            METRICS.incr(f'errors.item.{type(e).__name__}')
             print(f"An error occurred in BookScraper.scrape: {e}")
             return None
         finally:
             # Don't close the driver here to allow for multiple scrapes
             pass
     
-    def _extract_download_links(self, soup):
+    def fetch(self):
+        """
+        Download the item page at `self.url` without parsing it.
+        
+        Sets `self.headers` to the validators of the response and
+        `self.previous` to the cache entry the page was compared against.
+        
+        Transient failures (connection errors, timeouts, 429 and 5xx) are
+        retried according to `self.retry`.
+        
+        Returns:
+            str: HTML of the page, or None if the page was not modified since
+            the cached copy (`self.changed` is False then).
+        Raises:
+            HTTPStatusError: The server kept answering with an unusable status.
+        """
+        headers = self.request_headers()
+        response = self.retry.call('item', self._get, headers)
+
+        self.changed = True
+        if response.status_code == 304:
+            # Same page as the cached copy, nothing to parse
+            self.changed = False
+            return None
+
+        # Plain dict so that it can be sent to a parser process
+        self.headers = {
+            'ETag': response.headers.get('ETag'),
+            'Last-Modified': response.headers.get('Last-Modified'),
+        }
+
+        # # Get page source and parse with BeautifulSoup
+        # page_source = self.driver.page_source
+        return response.text
+    
+    def request_headers(self):
+        """
+        Look up the cached copy of the page and build the request headers.
+        
+        Sets `self.previous` to the cache entry, if any.
+        
+        Returns:
+            dict: If-None-Match/If-Modified-Since headers for a conditional
+            request, or an empty dict.
+        """
+        self.previous = self.cache.meta(self.book_key) if self.cache is not None else None
+
+        headers = {}
+        if self.conditional and self.previous:
+            if self.previous.get('etag'):
+                headers['If-None-Match'] = self.previous['etag']
+            if self.previous.get('last_modified'):
+                headers['If-Modified-Since'] = self.previous['last_modified']
+        return headers
+    
+    def _get(self, headers):
+        with limited(self.limiter) as request:
+            with METRICS.timer('fetch.item.seconds'):
+                response = self.session.get(self.url, headers=headers, verify=False, timeout=30)
+            request.observe(response.status_code)
+
+        METRICS.incr(f'http.status.{response.status_code}')
+        METRICS.incr('bytes.item', len(response.content))
+
+        if response.status_code not in (200, 304):
+            raise HTTPStatusError.from_response(response)
+        return response
+    
+    def process(self, page_source, headers=None, previous=None):
+        """
+        Parse a fetched page and record it in the page cache.
+        
+        Args:
+            page_source (str): HTML returned by `fetch`.
+            headers (dict, optional): Validators returned with the page.
+            previous (dict, optional): Cache entry the page replaces.
+            
+        Returns:
+            dict: Dictionary containing book metadata and links.
+        """
+        book_dict = self.parse(page_source)
+
+        if self.cache is not None:
+            fingerprint = book_hash(book_dict[self.book_key])
+            self.changed = previous is None or previous.get('book_hash') != fingerprint
+            with METRICS.timer('cache.put.seconds'):
+                self.cache.put(self.book_key, self.url, page_source, headers, book_hash=fingerprint)
+
+        return book_dict
+    
+    @timed('parse.seconds')
+    def parse(self, page_source):
+        """
+        Extract the book information from the HTML of an item page.
+        
+        Args:
+            page_source (str): HTML of the page at `self.url`.
+            
+        Returns:
+            dict: Dictionary containing book metadata and links.
+        """
+        self.book_dict = {
+            self.book_key: {
+                'links': {},
+                'metadata': {}
+            }
+        }
+        
+        with METRICS.timer('parse.soup.seconds'):
+            soup = BeautifulSoup(page_source, self.parser)
+        
+        # Collect the cells the extractors need in a single walk
+        fields = self._index_page(soup)
+        
+        # Extract download links
+        self._extract_download_links(fields['file_rows'])
+        
+        # Extract metadata
+        self._extract_metadata(fields)
+        
+        return self.book_dict
+    
+    def _split_on_br(self, element):
+        """
+        Split the text of `element` at every <br>, at any depth.
+        
+        Args:
+            element (Tag): Element to split.
+        Returns:
+            list: Stripped text of each piece, including empty ones.
+        """
+        parts = [[]]
+        for node in element.descendants:
+            if node.name == 'br':
+                parts.append([])
+            elif isinstance(node, NavigableString) and not isinstance(node, Comment):
+                parts[-1].append(str(node))
+        
+        return ["".join(part).strip() for part in parts]
+    
+    @timed('parse.index.seconds')
+    def _index_page(self, soup):
         """
-        Extract download links from the soup object.
+        Walk the document once and index the elements the extractors read.
+        
+        Every `metadataFieldLabel`/`metadataFieldValue` cell is attached to
+        each row it is nested in, keeping the first one of each kind, which
+        is what `row.find(...)` returned for that row.
         
         Args:
             soup (BeautifulSoup): BeautifulSoup object of the page.
+        Returns:
+            dict: `title` cell, first label cell per label text (`labels`),
+            [label, value] cells of every row in document order (`rows`),
+            the cells of the analytics row (`analytics`) and the file rows
+            (`file_rows`).
+        """
+        fields = {
+            'title': None,
+            'labels': {},
+            'rows': [],
+            'analytics': None,
+            'file_rows': [],
+        }
+        row_cells = {}  # id(tr) -> [label cell, value cell]
+        
+        for tag in soup.find_all(["tr", "td", "div"]):
+            classes = tag.get("class") or []
+            
+            if tag.name == "div":
+                if "fileRow" in classes:
+                    fields['file_rows'].append(tag)
+                continue
+            
+            if tag.name == "tr":
+                cells = [None, None]
+                fields['rows'].append(cells)
+                row_cells[id(tag)] = cells
+                if fields['analytics'] is None and "analyticsTr" in classes:
+                    fields['analytics'] = cells
+                continue
+            
+            if "metadataFieldLabel" in classes:
+                slot = 0
+                if fields['title'] is None and " ".join(classes) == "metadataFieldLabel itemTitle":
+                    fields['title'] = tag
+                if tag.string is not None:
+                    fields['labels'].setdefault(str(tag.string), tag)
+            elif "metadataFieldValue" in classes:
+                slot = 1
+            else:
+                continue
+            
+            for parent in tag.parents:
+                if parent.name == "tr":
+                    cells = row_cells[id(parent)]
+                    if cells[slot] is None:
+                        cells[slot] = tag
+        
+        return fields
+    
+    def _value_cell(self, fields, label):
+        """Return the value cell next to the first label cell reading `label`."""
+        label_cell = fields['labels'].get(label)
+        if not label_cell:
+            return None
+        return label_cell.find_next_sibling("td", class_="metadataFieldValue")
+    
+    @timed('parse.download_links.seconds')
+    def _extract_download_links(self, file_rows):
         """
-        # Find all file rows
-        file_rows = soup.find_all("div", class_="fileRow")
+        Extract download links from the file rows of the page.
         
+        Args:
+            file_rows (list): `div.fileRow` elements of the page.
+        """
         for row in file_rows:
             # Get file type
             file_type_elem = row.find("span", class_="fileType")
@@ -147,42 +391,44 @@ class BookScraper:
                 if download_url:
                     self.book_dict[self.book_key]['links'][file_type] = download_url
     
-    def _extract_metadata(self, soup):
+    @timed('parse.metadata.seconds')
+    def _extract_metadata(self, fields):
         """
-        Extract metadata from the soup object.
+        Extract metadata from the indexed page.
         
         Args:
-            soup (BeautifulSoup): BeautifulSoup object of the page.
+            fields (dict): Page index built by `_index_page`.
         """
+        metadata = self.book_dict[self.book_key]['metadata']
         
          # Extract title specifically
-        title_elem = soup.find("td", class_="metadataFieldLabel itemTitle")
+        title_elem = fields['title']
         if title_elem:
-            self.book_dict[self.book_key]['metadata']['Title'] = title_elem.text.strip()
+            metadata['Title'] = title_elem.text.strip()
         
 
-        abstract = self._extract_abstract(soup)
+        abstract = self._extract_abstract(self._value_cell(fields, "Abstract:"))
         if abstract:
-            self.book_dict[self.book_key]['metadata']['Abstract'] = abstract
+            metadata['Abstract'] = abstract
             
 
-        subjects = self._extract_subjects(soup)
+        subjects = self._extract_subjects(self._value_cell(fields, "Subject:"))
         if subjects:
-            self.book_dict[self.book_key]['metadata']['Subjects'] = subjects
+            metadata['Subjects'] = subjects
         
-        keywords = self._extract_keywords(soup)
+        keywords = self._extract_keywords(self._value_cell(fields, "Keywords:"))
         if keywords:
-            self.book_dict[self.book_key]['metadata']['Keywords'] = keywords
+            metadata['Keywords'] = keywords
             
-        usage_stats = self._extract_usage_statistics(soup)
+        analytics_cell = fields['analytics'][1] if fields['analytics'] else None
+        usage_stats = self._extract_usage_statistics(analytics_cell)
         if usage_stats:
-            self.book_dict[self.book_key]['metadata']['Usage Statistics'] = usage_stats
-        # Find all metadata rows
-        metadata_rows = soup.find_all("tr")
+            metadata['Usage Statistics'] = usage_stats
+        
+        special_labels = ['Keywords', 'Abstract', 'Subject', 'Usage statistics']
         
-        for row in metadata_rows:
+        for label_elem, value_elem in fields['rows']:
             # Find label
-            label_elem = row.find("td", class_="metadataFieldLabel")
             if not label_elem:
                 continue
                 
@@ -191,163 +437,121 @@ class BookScraper:
                 label = label[:-1]  # Remove trailing colon
             
             # Find value
-            value_elem = row.find("td", class_="metadataFieldValue")
             if not value_elem:
                 continue
                 
-            # Extract text value
-            if label == "Title" and row.find("td", class_="metadataFieldLabel itemTitle"):
-                value = row.find("td", class_="metadataFieldLabel itemTitle").text.strip()
-                
-            elif label== 'License': 
-                value = value_elem.text.strip()
-                
-            special_labels = ['Keywords', 'Abstract', 'Subject', 'Usage statistics']
+            # These have their own extractors above
             if any(special_label in label for special_label in special_labels):
                 continue
 
+            # Handle links in the value
+            links = value_elem.find_all("a")
+            if links:
+                value = []
+                for link in links:
+                    link_text = link.text.strip()
+                    link_url = link.get("href", "")
+                    if link_text and link_url:
+                        value.append({"text": link_text, "url": link_url})
             else:
-                # Handle links in the value
-                links = value_elem.find_all("a")
-                if links:
-                    value = []
-                    for link in links:
-                        link_text = link.text.strip()
-                        link_url = link.get("href", "")
-                        if link_text and link_url:
-                            value.append({"text": link_text, "url": link_url})
-                else:
-                    value = value_elem.text.strip()
-                    # Split by line breaks for multi-value fields
-                    if "<br>" in str(value_elem) or "\n" in value:
-                        value = [v.strip() for v in value.split('\n') if v.strip()]
+                value = value_elem.text.strip()
+                # Split by line breaks for multi-value fields
+                if "\n" in value:
+                    value = [v.strip() for v in value.split('\n') if v.strip()]
             
             # Add to metadata dictionary
             if value:
-                self.book_dict[self.book_key]['metadata'][label] = value
+                metadata[label] = value
         
-    def _extract_abstract(self, soup):
+    @timed('parse.abstract.seconds')
+    def _extract_abstract(self, abstract_cell):
         """
-        Extract abstract from the readmore div in the soup object.
+        Extract abstract from the readmore div of the abstract value cell.
         
         Args:
-            soup (BeautifulSoup): BeautifulSoup object of the page.
+            abstract_cell (Tag): Value cell next to the "Abstract:" label, or None.
         Returns:
             str: Extracted abstract text
         """
         abstract_text = ""
         
-        # Find the abstract section by label
-        abstract_label = soup.find("td", class_="metadataFieldLabel", string="Abstract:")
-        
-        if abstract_label:
-            # Get the next sibling which contains the abstract value
-            abstract_cell = abstract_label.find_next_sibling("td", class_="metadataFieldValue")
+        if abstract_cell:
+            # Find the readmore div that contains the abstract
+            readmore_div = abstract_cell.find("div", class_="readmore")
             
-            if abstract_cell:
-                # Find the readmore div that contains the abstract
-                readmore_div = abstract_cell.find("div", class_="readmore")
+            if readmore_div:
+                # First approach: Get all text content
+                full_text = readmore_div.get_text(strip=True)
+                if full_text:
+                    abstract_text = full_text
+                else:
+                    # Second approach: Process each element
+                    paragraphs = []
+                    
+                    # Extract all text nodes and handle <br> tags as paragraph breaks
+                    current_paragraph = ""
+                    
+                    for element in readmore_div.contents:
+                        # If it's a string, add to current paragraph
+                        if isinstance(element, str):
+                            current_paragraph += element.strip() + " "
+                        # If it's a <br> tag, start a new paragraph
+                        elif element.name == 'br':
+                            if current_paragraph.strip():
+                                paragraphs.append(current_paragraph.strip())
+                                current_paragraph = ""
+                        # If it's another tag, get its text
+                        elif element.name:
+                            current_paragraph += element.get_text().strip() + " "
+                    
+                    # Add the last paragraph if not empty
+                    if current_paragraph.strip():
+                        paragraphs.append(current_paragraph.strip())
+                    
+                    # Join paragraphs with newlines
+                    abstract_text = "\n".join(paragraphs)
                 
-                if readmore_div:
-                    # First approach: Get all text content
-                    full_text = readmore_div.get_text(strip=True)
-                    if full_text:
-                        abstract_text = full_text
-                    else:
-                        # Second approach: Process each element
-                        paragraphs = []
-                        
-                        # Extract all text nodes and handle <br> tags as paragraph breaks
-                        current_paragraph = ""
-                        
-                        for element in readmore_div.contents:
-                            # If it's a string, add to current paragraph
-                            if isinstance(element, str):
-                                current_paragraph += element.strip() + " "
-                            # If it's a <br> tag, start a new paragraph
-                            elif element.name == 'br':
-                                if current_paragraph.strip():
-                                    paragraphs.append(current_paragraph.strip())
-                                    current_paragraph = ""
-                            # If it's another tag, get its text
-                            elif element.name:
-                                current_paragraph += element.get_text().strip() + " "
-                        
-                        # Add the last paragraph if not empty
-                        if current_paragraph.strip():
-                            paragraphs.append(current_paragraph.strip())
-                        
-                        # Join paragraphs with newlines
-                        abstract_text = "\n".join(paragraphs)
+                # If still empty, try another approach with HTML parsing
+                if not abstract_text:
+                    # Split the text at the <br> tags
+                    paragraphs = [text for text in self._split_on_br(readmore_div) if text]
                     
-                    # If still empty, try another approach with HTML parsing
-                    if not abstract_text:
-                        # Get the HTML content and split by <br> tags
-                        html_content = str(readmore_div)
-                        # Split by <br> or <br/> or <br />
-                        parts = html_content.replace('<br/>', '<br>').replace('<br />', '<br>').split('<br>')
-                        
-                        paragraphs = []
-                        for part in parts:
-                            # Create a new soup object for this part
-                            part_soup = BeautifulSoup(part, 'html.parser')
-                            # Get the text and strip whitespace
-                            text = part_soup.get_text().strip()
-                            if text and not text.startswith('<div') and not text.endswith('</div>'):
-                                paragraphs.append(text)
-                        
-                        abstract_text = "\n".join(paragraphs)
-        
+                    abstract_text = "\n".join(paragraphs)
+    
         return abstract_text.strip()
 
-    def _extract_keywords(self, soup):
+    @timed('parse.keywords.seconds')
+    def _extract_keywords(self, keywords_cell):
         """
-        Extract keywords from the readmore div in the soup object.
+        Extract keywords from the readmore div of the keywords value cell.
         
         Args:
-            soup (BeautifulSoup): BeautifulSoup object of the page.
+            keywords_cell (Tag): Value cell next to the "Keywords:" label, or None.
         Returns:
             list: List of extracted keywords
         """
         keywords = []
         
-        # Find the keywords section by label
-        keywords_label = soup.find("td", class_="metadataFieldLabel", string="Keywords:")
-        
-        if keywords_label:
-            # Get the next sibling which contains the keywords value
-            keywords_cell = keywords_label.find_next_sibling("td", class_="metadataFieldValue")
+        if keywords_cell:
+            # Find the readmore div that contains the keywords
+            readmore_div = keywords_cell.find("div", class_="readmore")
             
-            if keywords_cell:
-                # Find the readmore div that contains the keywords
-                readmore_div = keywords_cell.find("div", class_="readmore")
+            if readmore_div:
+                # Extract all text nodes directly under the readmore div
+                # This method gets all direct text children and handles the <br> tags
+                for element in readmore_div.contents:
+                    # Check if it's a string and not just whitespace
+                    if isinstance(element, str) and element.strip():
+                        keywords.append(element.strip())
+                    # If it's a tag but not a <br>, get its text
+                    elif element.name and element.name != 'br' and element.string and element.string.strip():
+                        keywords.append(element.string.strip())
                 
-                if readmore_div:
-                    # Extract all text nodes directly under the readmore div
-                    # This method gets all direct text children and handles the <br> tags
-                    for element in readmore_div.contents:
-                        # Check if it's a string and not just whitespace
-                        if isinstance(element, str) and element.strip():
-                            keywords.append(element.strip())
-                        # If it's a tag but not a <br>, get its text
-                        elif element.name and element.name != 'br' and element.string and element.string.strip():
-                            keywords.append(element.string.strip())
-                    
-                    # If the above didn't work well, try another approach
-                    if not keywords:
-                        # Get the HTML content and split by <br> tags
-                        html_content = str(readmore_div)
-                        # Split by <br> or <br/> or <br />
-                        parts = html_content.replace('<br/>', '<br>').replace('<br />', '<br>').split('<br>')
-                        
-                        for part in parts:
-                            # Create a new soup object for this part
-                            part_soup = BeautifulSoup(part, 'html.parser')
-                            # Get the text and strip whitespace
-                            text = part_soup.get_text().strip()
-                            if text and not text.startswith('<div') and not text.endswith('</div>'):
-                                keywords.append(text)
-        
+                # If the above didn't work well, try another approach
+                if not keywords:
+                    # Split the text at the <br> tags
+                    keywords.extend(text for text in self._split_on_br(readmore_div) if text)
+    
         # Clean up the keywords list - remove empty strings and duplicates
         keywords = [kw for kw in keywords if kw.strip()]
         keywords = list(dict.fromkeys(keywords))  # Remove duplicates while preserving order
@@ -369,117 +573,106 @@ class BookScraper:
             #     if chapters:
             #         self.book_dict[self.book_key]['metadata']['Chapters'] = chapters
         
-    def _extract_subjects(self, soup):
+    @timed('parse.subjects.seconds')
+    def _extract_subjects(self, subject_cell):
         """
-        Extract subject categories from the soup object.
+        Extract subject categories from the subject value cell.
         
         Args:
-            soup (BeautifulSoup): BeautifulSoup object of the page.
+            subject_cell (Tag): Value cell next to the "Subject:" label, or None.
         Returns:
             list: Hierarchical subject categories
         """
         subjects = []
         results = []
-        # Find the subject section by label
-        subject_label = soup.find("td", class_="metadataFieldLabel", string="Subject:")
         
-        if subject_label:
-            # Get the next sibling which contains the subject values
-            subject_cell = subject_label.find_next_sibling("td", class_="metadataFieldValue")
+        if subject_cell:
+            # Find all the subject links
+            subject_links = subject_cell.find_all("a")
             
-            if subject_cell:
-                # Find all the subject links
-                subject_links = subject_cell.find_all("a")
+            for link in subject_links:
+                # Get the text and clean it up
+                subject_text = link.get_text().strip()
                 
-                for link in subject_links:
-                    # Get the text and clean it up
-                    subject_text = link.get_text().strip()
-                    
-                    # Replace ">" with :: for hierarchical structure
-                    subject_text = subject_text.replace(" > ", "::")
-                    
-                    # Split the text by :: to get the hierarchical levels
-                    subject_hierarchy = subject_text.split("::")
-                    
-                    # Clean up each level
-                    subject_hierarchy = [level.strip() for level in subject_hierarchy]
-                    
-                    # Store as a structured object
-                    if subject_hierarchy:
-                        # subjects.append({
-                        #     "full_path": subject_text,
-                        #     "hierarchy": subject_hierarchy,
-                        #     "leaf": subject_hierarchy[-1] if subject_hierarchy else ""
-                        # })
-                        results.append(subject_hierarchy[-1] if subject_hierarchy else "")
-                    else :
-                        results.append('')
-        
-            return results
+                # Replace ">" with :: for hierarchical structure
+                subject_text = subject_text.replace(" > ", "::")
+                
+                # Split the text by :: to get the hierarchical levels
+                subject_hierarchy = subject_text.split("::")
+                
+                # Clean up each level
+                subject_hierarchy = [level.strip() for level in subject_hierarchy]
+                
+                # Store as a structured object
+                if subject_hierarchy:
+                    # subjects.append({
+                    #     "full_path": subject_text,
+                    #     "hierarchy": subject_hierarchy,
+                    #     "leaf": subject_hierarchy[-1] if subject_hierarchy else ""
+                    # })
+                    results.append(subject_hierarchy[-1] if subject_hierarchy else "")
+                else :
+                    results.append('')
     
+        return results
+
 
-            def scrape_multiple(self, urls):
-                """
-                Scrape multiple book pages.
+        def scrape_multiple(self, urls):
+            """
+            Scrape multiple book pages.
+            
+            Args:
+                urls (list): List of URLs to scrape.
                 
-                Args:
-                    urls (list): List of URLs to scrape.
-                    
-                Returns:
-                    dict: Dictionary containing all scraped book information.
-                """
-                results = {}
+            Returns:
+                dict: Dictionary containing all scraped book information.
+            """
+            results = {}
+            
+            try:
+                # Initialize driver if not already done
+                self._initialize_driver()
                 
-                try:
-                    # Initialize driver if not already done
-                    self._initialize_driver()
-                    
-                    for url in urls:
-                        print(f"Scraping {url}")
-                        book_data = self.scrape(url)
-                        if book_data:
-                            results.update(book_data)
-                        time.sleep(1)  # Be nice to the server
-                    
-                    return results
+                for url in urls:
+                    print(f"Scraping {url}")
+                    book_data = self.scrape(url)
+                    if book_data:
+                        results.update(book_data)
+                    time.sleep(1)  # Be nice to the server
                 
-                except Exception as e:
-                    print(f"An error occurred in BookScraper.scrape_multiple: {e}")
-                    return results
-                finally:
-                    self.close()
-    
-    def _extract_usage_statistics(self, soup):
+                return results
+            
+            except Exception as e:
+                print(f"An error occurred in BookScraper.scrape_multiple: {e}")
+                return results
+            finally:
+                self.close()
+
+    @timed('parse.usage_statistics.seconds')
+    def _extract_usage_statistics(self, analytics_cell):
         """
         Extract usage statistics from the analytics section.
         
         Args:
-            soup (BeautifulSoup): BeautifulSoup object of the page.
+            analytics_cell (Tag): Value cell of the analytics row, or None.
         Returns:
             dict: Dictionary with usage statistics
         """
         stats = {}
         
-        # Find the analytics row
-        analytics_row = soup.find("tr", class_="analyticsTr")
-        
-        if analytics_row:
-            # Find the analytics value cell
-            analytics_cell = analytics_row.find("td", class_="metadataFieldValue")
+        if analytics_cell:
+            # Find the bookAnalytics div
+            analytics_div = analytics_cell.find("div", class_="bookAnalytics")
             
-            if analytics_cell:
-                # Find the bookAnalytics div
-                analytics_div = analytics_cell.find("div", class_="bookAnalytics")
+            if analytics_div:
+                # Find all the individual statistic divs
+                stat_divs = analytics_div.find_all("div")
                 
-                if analytics_div:
-                    # Find all the individual statistic divs
-                    stat_divs = analytics_div.find_all("div")
-                    
-                    for div in stat_divs:
-                        # Get the text and split by colon
-                        stat_text = div.get_text().strip()
-                        if ":" in stat_text:
-                            key, value = stat_text.split(":", 1)
-                            stats[key.strip()] = value.strip()
-        
+                for div in stat_divs:
+                    # Get the text and split by colon
+                    stat_text = div.get_text().strip()
+                    if ":" in stat_text:
+                        key, value = stat_text.split(":", 1)
+                        stats[key.strip()] = value.strip()
+    
         return stats
\ No newline at end of file
@@ -0,0 +1,431 @@
+import asyncio
+import hashlib
+import os
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+import main
+import pdfs
+from BookScraper import BookScraper
+from ledger import open_ledger
+from metrics import METRICS
+from ratelimit import alimited
+from retry import DEFAULT_RETRY, HTTPStatusError
+from sessions import USER_AGENT
+
+
+def create_session(per_host=20):
+    """
+    Create the aiohttp session shared by every coroutine of a run.
+
+    Args:
+        per_host (int): Connections kept open to the repository at most.
+            Coroutines beyond that wait for a free connection.
+
+    Returns:
+        aiohttp.ClientSession: Must be created and closed on the running loop.
+    """
+    if aiohttp is None:
+        raise RuntimeError("The async engine needs aiohttp (poetry install --extras async, or pip install aiohttp)")
+
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=per_host, ssl=False)
+    timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT})
+
+
+async def _get(session, url, limiter, stage, headers=None, expected=(200,)):
+    async with alimited(limiter) as request:
+        with METRICS.timer(f"fetch.{stage}.seconds"):
+            async with session.get(url, headers=headers) as response:
+                request.observe(response.status)
+                body = await response.read()
+
+    METRICS.incr(f"http.status.{response.status}")
+    METRICS.incr(f"bytes.{stage}", len(body))
+    if response.status not in expected:
+        raise HTTPStatusError.from_response(response)
+    return response.status, body.decode(response.get_encoding(), errors="replace"), response.headers
+
+
+async def get_page_links(session, page, limiter=None, retry=None, failures=None):
+    """
+    Async `main.get_page_links`: the item links of one search page.
+
+    Returns:
+        list: The item links, False past the last page, or an empty list if
+        the page could not be fetched (it is then queued in `failures`).
+    """
+    retry = retry or DEFAULT_RETRY
+    url = main.SEARCH_URL.format(start=page*100 - 100)
+    print(url)
+
+    try:
+        _, page_source, _ = await retry.call_async("listing", _get, session, url, limiter, "listing")
+        hrefs = await asyncio.to_thread(main.parse_listing, page_source, url)
+        return main.check_links(hrefs, page)
+    except Exception as e:
+        METRICS.incr(f"errors.listing.{type(e).__name__}")
+        print(f"An error occurred in get_page_links (async) while parsing page {page}: {e}")
+        if failures is not None:
+            failures.add("listing", url, f"{type(e).__name__}: {e}", {"page": page})
+        return []
+
+
+async def fetch_item(session, scraper, limiter=None, retry=None):
+    """
+    Async `BookScraper.fetch`: download the item page of `scraper`.
+
+    Returns:
+        str: HTML of the page, or None if it was not modified since the
+        cached copy (`scraper.changed` is False then).
+    """
+    retry = retry or DEFAULT_RETRY
+    headers = scraper.request_headers()
+    status, page_source, response_headers = await retry.call_async(
+        "item", _get, session, scraper.url, limiter, "item", headers, (200, 304))
+
+    scraper.changed = status != 304
+    if not scraper.changed:
+        return None
+
+    scraper.headers = {
+        "ETag": response_headers.get("ETag"),
+        "Last-Modified": response_headers.get("Last-Modified"),
+    }
+    return page_source
+
+
+async def _fetch_to_part(session, full_url, part_path, info_path, limiter=None):
+    # The protocol of pdfs._fetch_to_part, reading the body on the loop
+    for _ in range(2):
+        part_info, offset, headers = pdfs._resume_headers(part_path, info_path)
+        hasher = hashlib.sha256()
+
+        async with alimited(limiter) as request, session.post(full_url, headers=headers) as response:
+            request.observe(response.status)
+            METRICS.observe("fetch.pdf.seconds", request.latency)
+            METRICS.incr(f"http.status.{response.status}")
+
+            action, length = pdfs._start_part(response, response.status, full_url, part_path, info_path,
+                                              part_info, offset)
+            if action == pdfs.PART_RESTART:
+                continue
+            if action != "wb":
+                await asyncio.to_thread(pdfs._hash_file, part_path, hasher)
+            if action == pdfs.PART_COMPLETE:
+                return hasher.hexdigest()
+
+            # Chunks are written as they arrive; a buffered write of at most
+            # CHUNK_SIZE bytes does not hold up the loop noticeably
+            with open(part_path, action) as f:
+                async for chunk in response.content.iter_chunked(pdfs.CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    METRICS.incr("bytes.pdf", len(chunk))
+
+            return pdfs._finish_part(part_path, length, hasher)
+
+    raise RuntimeError("content kept changing")
+
+
+async def download_pdf(session, full_url, directory, filename, limiter=None, retry=None):
+    """
+    Async `pdfs.download_pdf`, with the same .part files and object store.
+
+    Returns:
+        tuple: (success, info, message) as `pdfs.download_pdf`.
+    """
+    retry = retry or DEFAULT_RETRY
+    info, part_path, info_path = pdfs._download_paths(full_url, directory, filename)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with METRICS.timer("download.seconds"):
+            sha256 = await retry.call_async("pdf", _fetch_to_part, session, full_url, part_path, info_path, limiter)
+        return pdfs._finish_download(info, part_path, info_path, sha256)
+
+    except Exception as e:
+        return pdfs._download_failed(info, e)
+
+
+class _Downloads:
+    """
+    The PDF stage: a bounded queue of URLs and the coroutines draining it.
+
+    A URL that is queued again while it is still pending only gains another
+    destination, so it is fetched once per run.
+    """
+
+    def __init__(self, session, ledger, failures=None, workers=20, limiter=None, retry=None, on_done=None):
+        self.session = session
+        self.ledger = ledger
+        self.failures = failures
+        self.limiter = limiter
+        self.retry = retry
+        self.on_done = on_done
+        self.failed_urls = {row["target"] for row in failures.items("pdf")} if failures is not None else set()
+
+        self.queue = asyncio.Queue(maxsize=workers * 2)
+        self.destinations = {}  # URL -> (directory, filename) pairs waiting for it
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    async def add(self, download_tasks):
+        """Queue {full_url: [(directory, filename), ...]}; waits while the queue is full."""
+        for full_url, destinations in download_tasks.items():
+            await self.add_one(full_url, destinations)
+
+    async def add_one(self, full_url, destinations):
+        """Queue one URL and where it goes; waits while the queue is full."""
+        if full_url in self.destinations:
+            self.destinations[full_url].extend(destinations)
+            return
+        self.destinations[full_url] = list(destinations)
+        await self.queue.put(full_url)
+
+    async def close(self):
+        """Wait for the queued downloads to finish."""
+        for _ in self.tasks:
+            await self.queue.put(None)
+        await asyncio.gather(*self.tasks)
+
+    async def _work(self):
+        while True:
+            full_url = await self.queue.get()
+            if full_url is None:
+                return
+            directory, filename = self.destinations[full_url][0]
+            success, info, message = await download_pdf(self.session, full_url, directory, filename,
+                                                        self.limiter, self.retry)
+            pdfs.record_download(success, info, message, self.destinations.pop(full_url), self.ledger,
+                                 self.failures, self.failed_urls)
+            METRICS.gauge("queue.downloads", self.queue.qsize())
+            if self.on_done is not None:
+                self.on_done(success, info, message)
+            elif not success:
+                print(message)
+
+
+async def download_all(download_tasks, ledger, failures=None, workers=20, limiter=None, retry=None, on_done=None,
+                       per_host=None):
+    """
+    Async engine of `pdfs.main`: download the planned files on one loop.
+
+    Args:
+        download_tasks (iterable): (full_url, (directory, filename)) pairs
+            as yielded by `pdfs.iter_downloads`; consumed as the queue drains.
+        on_done (callable, optional): Called with (success, info, message)
+            after each file; failures are printed otherwise.
+        per_host (int, optional): Connections kept open, default `workers`.
+    """
+    async with create_session(per_host=per_host or workers) as session:
+        downloads = _Downloads(session, ledger, failures, workers, limiter, retry, on_done)
+        for full_url, destination in download_tasks:
+            await downloads.add_one(full_url, [destination])
+        await downloads.close()
+
+
+async def crawl(page, store, workers=10, prefetch=2, on_progress=None, limiter=None, parser=None, cache=None,
+                conditional=False, changed=None, processes=None, retry=None, failures=None, checkpoint=None,
+                shard=None, download=False, download_workers=20, batch_size=20):
+    """
+    Async engine of `main.crawl`: listing, item pages and PDFs on one loop.
+
+    `prefetch` coroutines list search pages, `workers` coroutines fetch and
+    parse item pages and, with `download`, `download_workers` coroutines
+    download the files of every new or changed book. The stages are joined
+    by bounded queues, so a slow stage holds the ones before it back instead
+    of piling up work in memory. All requests go over one connection pool
+    and share the `limiter`.
+
+    Parsing runs on a pool of `processes` worker processes, `batch_size`
+    pages per task as in `main.crawl`, or on threads with `processes=0`, so
+    the loop keeps serving connections meanwhile. Stored items are recorded
+    with `main.store_item`, as the other engines do.
+    The other arguments and the return value are those of `main.crawl`.
+    """
+    retry = retry or DEFAULT_RETRY
+    parse_executor = main.parse_pool(processes) if processes != 0 else None
+    cache_dir = cache.directory if cache is not None else None
+    failures_path = failures.path if failures is not None else None
+    loop = asyncio.get_running_loop()
+
+    items = asyncio.Queue(maxsize=workers * 2)  # (page, link) waiting for a fetch
+    pending = {}          # page -> items not done yet
+    finished = set()      # pages done but not yet contiguous
+    state = {"completed": (page or 1) - 1, "next_page": page or 1,
+             "last_page": None if page is not None else 0, "listing_failures": 0,
+             "fetching": 0}  # item pages being fetched right now
+    batch = []            # fetched pages waiting for a parse task
+    batch_items = []      # (page, link) of each of them
+    queued = set()        # links resumed from the checkpoint
+    if checkpoint is not None:
+        queued.update(link for link, _ in checkpoint.outstanding())
+        if queued:
+            print(f"Resuming {len(queued)} unfinished items from the checkpoint")
+
+    def page_done(listed_page):
+        finished.add(listed_page)
+        advanced = False
+        while state["completed"] + 1 in finished:
+            finished.remove(state["completed"] + 1)
+            state["completed"] += 1
+            advanced = True
+        if advanced and on_progress:
+            on_progress(state["completed"])
+
+    def item_done(listed_page):
+        # Items resumed from the checkpoint do not belong to a listed page
+        if listed_page is None:
+            return
+        pending[listed_page] -= 1
+        if pending[listed_page] == 0:
+            del pending[listed_page]
+            page_done(listed_page)
+
+    async def resume_items():
+        for link in queued:
+            await items.put((None, link))
+
+    async def list_pages(session):
+        while state["last_page"] is None:
+            # Pages of other shards count as done
+            while shard is not None and not shard.owns_page(state["next_page"]):
+                page_done(state["next_page"])
+                state["next_page"] += 1
+            listed_page = state["next_page"]
+            state["next_page"] += 1
+            links = await get_page_links(session, listed_page, limiter, retry, failures)
+
+            if state["last_page"] is not None and listed_page > state["last_page"]:
+                return
+            if links is False:
+                print(f"No links found on page {listed_page}. Stopping the program.")
+                state["last_page"] = listed_page
+                if checkpoint is not None:
+                    checkpoint.set_listing_complete(listed_page)
+                return
+            if not links:
+                state["listing_failures"] += 1
+                if state["listing_failures"] >= main.MAX_LISTING_FAILURES:
+                    print(f"{state['listing_failures']} search pages in a row failed. Stopping the program.")
+                    state["last_page"] = listed_page
+                else:
+                    page_done(listed_page)
+                continue
+            state["listing_failures"] = 0
+
+            if shard is not None:
+                links = [link for link in links if shard.owns_link(link)]
+            if checkpoint is not None:
+                # Items already known were scraped, failed or are resumed
+                links = [link for link in checkpoint.discover(listed_page, links, include_known=conditional)
+                         if link not in queued]
+            if not links:
+                page_done(listed_page)
+                continue
+
+            pending[listed_page] = len(links)
+            for link in links:
+                # Blocks while the item stage is behind
+                await items.put((listed_page, link))
+            METRICS.gauge("queue.items", items.qsize())
+
+    async def complete(listed_page, link, book_key, book_data_dict, book_changed, downloads):
+        stored = main.store_item(store, link, book_key, book_data_dict, book_changed,
+                                 changed=changed, checkpoint=checkpoint)
+        if stored is not None and downloads is not None:
+            download_tasks, _ = pdfs.plan_downloads([(book_key, stored)], downloads.ledger)
+            # Blocks while the download stage is behind
+            await downloads.add(download_tasks)
+        item_done(listed_page)
+        METRICS.gauge("pages.in_progress", len(pending))
+
+    async def flush(downloads, force=False):
+        # Parse the fetched pages once a batch is full, or straight away when
+        # nothing else is being fetched, as main.crawl does. The scraper that
+        # fills a batch waits for it, which bounds the batches in flight
+        if not batch or not (force or len(batch) >= batch_size or state["fetching"] == 0):
+            return
+        pages, page_items = batch[:], batch_items[:]
+        batch.clear()
+        batch_items.clear()
+        results, snapshot = await loop.run_in_executor(parse_executor, main.parse_batch, pages, parser,
+                                                       cache_dir, failures_path)
+        METRICS.merge(snapshot)
+        for (listed_page, link), result in zip(page_items, results):
+            await complete(listed_page, link, *result, downloads)
+
+    async def scrape_items(session, downloads):
+        while True:
+            entry = await items.get()
+            if entry is None:
+                return
+            listed_page, link = entry
+
+            scraper = BookScraper(url=link, parser=parser, cache=cache, conditional=conditional)
+            page_source, book_data_dict, book_changed = None, None, True
+            state["fetching"] += 1
+            try:
+                page_source = await fetch_item(session, scraper, limiter, retry)
+                book_changed = scraper.changed
+                if page_source is not None:
+                    if checkpoint is not None:
+                        checkpoint.mark(link, "fetched")
+                    if parse_executor is None:
+                        book_data_dict = await asyncio.to_thread(scraper.process, page_source, scraper.headers,
+                                                                 scraper.previous)
+                        book_changed = scraper.changed
+            except Exception as e:
+                METRICS.incr(f"errors.item.{type(e).__name__}")
+                print(f"An error occurred in BookScraper.fetch: {e}")
+                if failures is not None:
+                    failures.add("item", link, f"{type(e).__name__}: {e}")
+                page_source, book_data_dict, book_changed = None, None, True
+            finally:
+                state["fetching"] -= 1
+
+            if page_source is not None and parse_executor is not None:
+                batch.append((scraper.url, page_source, scraper.headers, scraper.previous))
+                batch_items.append((listed_page, link))
+            else:
+                # Parsed in a thread, failed, or not modified since the cached copy
+                await complete(listed_page, link, scraper.book_key, book_data_dict, book_changed, downloads)
+            await flush(downloads)
+
+    per_host = prefetch + workers + (download_workers if download else 0)
+    ledger = open_ledger("downloads.db") if download else None
+    try:
+        async with create_session(per_host=per_host) as session:
+            downloads = (_Downloads(session, ledger, failures, download_workers, limiter, retry)
+                         if download else None)
+
+            listers = [asyncio.create_task(list_pages(session)) for _ in range(max(1, prefetch))]
+            if checkpoint is not None:
+                listers.append(asyncio.create_task(resume_items()))
+            scrapers = [asyncio.create_task(scrape_items(session, downloads)) for _ in range(workers)]
+            async def finish_listing():
+                await asyncio.gather(*listers)
+                for _ in scrapers:
+                    await items.put(None)
+
+            try:
+                # Together, so a failing scraper does not leave the listers
+                # waiting on a full queue
+                await asyncio.gather(finish_listing(), *scrapers)
+                await flush(downloads, force=True)
+                if downloads is not None:
+                    await downloads.close()
+            except BaseException:
+                for task in listers + scrapers + (downloads.tasks if downloads is not None else []):
+                    task.cancel()
+                raise
+    finally:
+        if ledger is not None:
+            ledger.close()
+        if parse_executor is not None:
+            parse_executor.shutdown(cancel_futures=True)
+
+    return state["completed"]
@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from mock_repository import MockRepository, item_page, load_pages
+
+
+MODES = ('listing', 'scrape', 'parse', 'download', 'store', 'crawl', 'harvest', 'startup')
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kallipos.py')
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(q * len(values)) - 1))
+    return values[index]
+
+
+def _peak_rss():
+    """
+    Returns:
+        int: Peak resident set size of this process in bytes, or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _timed_map(function, tasks, workers):
+    """
+    Run `function` over `tasks` on `workers` threads, timing every call.
+
+    Returns:
+        tuple: The latency of every call and the wall time of the whole run.
+    """
+    def run(task):
+        start = time.perf_counter()
+        function(task)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(run, tasks))
+    return latencies, time.perf_counter() - start
+
+
+def _bytes_counter(name):
+    from metrics import METRICS
+    return METRICS.snapshot()['counters'].get(name, 0)
+
+
+def _run_listing(config, repository_url, search_url):
+    import main
+    from sessions import build_session
+
+    main.SEARCH_URL = search_url
+    session = build_session(pool_size=config['workers'])
+    pages = range(1, -(-config['items'] // 100) + 1)
+    latencies, elapsed = _timed_map(lambda page: main.get_page_links(page, session=session), pages, config['workers'])
+    return len(latencies), _bytes_counter('bytes.listing'), latencies, elapsed
+
+
+def _run_scrape(config, repository_url, search_url):
+    from BookScraper import BookScraper
+    from sessions import build_session
+
+    session = build_session(pool_size=config['workers'])
+    links = [f"{repository_url}handle/11419/{item}" for item in range(1, config['items'] + 1)]
+
+    def scrape(link):
+        BookScraper(url=link, session=session, parser=config['parser']).scrape()
+
+    latencies, elapsed = _timed_map(scrape, links, config['workers'])
+    return len(latencies), _bytes_counter('bytes.item'), latencies, elapsed
+
+
+def _run_parse(config, repository_url, search_url):
+    from BookScraper import BookScraper
+
+    if config['pages_dir']:
+        pages = load_pages(config['pages_dir'])
+        pages = [pages[i % len(pages)] for i in range(config['items'])]
+    else:
+        pages = [item_page(item) for item in range(1, config['items'] + 1)]
+
+    def parse(page_source):
+        BookScraper(url=f"{repository_url}handle/11419/1", parser=config['parser']).parse(page_source)
+
+    # Parsing is CPU bound; one thread measures the parser, not the GIL
+    latencies, elapsed = _timed_map(parse, pages, 1)
+    return len(latencies), sum(len(page.encode('utf-8')) for page in pages), latencies, elapsed
+
+
+def _run_download(config, repository_url, search_url):
+    import pdfs
+    from sessions import build_session
+
+    pdfs.BASE_URL = repository_url
+    session = build_session(pool_size=config['workers'])
+    tasks = [(f"retrieve/{item}/book.pdf", os.path.join('Files', f"11419_{item}"), "Book.pdf")
+             for item in range(1, config['items'] + 1)]
+
+    def download(task):
+        success, info, message = pdfs.download_pdf(*task, session=session)
+        if not success:
+            print(message)
+
+    latencies, elapsed = _timed_map(download, tasks, config['workers'])
+    return len(latencies), _bytes_counter('bytes.pdf'), latencies, elapsed
+
+
+def _run_store(config, repository_url, search_url):
+    from BookScraper import BookScraper
+    from storage import BookStore
+
+    # Store the same record under many keys; only the write path is measured
+    page = load_pages(config['pages_dir'])[0] if config['pages_dir'] else item_page(1)
+    book_data = BookScraper(url=f"{repository_url}handle/11419/1", parser=config['parser']).parse(page)['11419_1']
+
+    latencies = []
+    start = time.perf_counter()
+    with BookStore('books.jsonl', sync=config['sync']) as store:
+        for item in range(1, config['items'] + 1):
+            put_start = time.perf_counter()
+            store.put(f"11419_{item}", book_data)
+            latencies.append(time.perf_counter() - put_start)
+    elapsed = time.perf_counter() - start
+    return len(latencies), os.path.getsize('books.jsonl'), latencies, elapsed
+
+
+def _run_crawl(config, repository_url, search_url):
+    import main
+    from metrics import METRICS
+    from sessions import build_session
+    from storage import BookStore
+
+    main.SEARCH_URL = search_url
+    session = build_session(pool_size=config['workers'] + 2)
+    start = time.perf_counter()
+    with BookStore('books.jsonl') as store:
+        if config['engine'] == 'async':
+            import asyncio
+            import aiocrawl
+            asyncio.run(aiocrawl.crawl(1, store, workers=config['workers'], parser=config['parser'],
+                                       processes=config['processes']))
+        else:
+            main.crawl(1, store, session, workers=config['workers'], parser=config['parser'],
+                       processes=config['processes'])
+        count = len(store)
+    elapsed = time.perf_counter() - start
+
+    # No per-call timings here; use the item fetch histogram instead
+    snapshot = METRICS.snapshot()
+    fetch = snapshot['histograms'].get('fetch.item.seconds', {})
+    total = snapshot['counters'].get('bytes.listing', 0) + snapshot['counters'].get('bytes.item', 0)
+    return count, total, {'p50': fetch.get('p50'), 'p99': fetch.get('p99')}, elapsed
+
+
+def _run_harvest(config, repository_url, search_url):
+    import oai
+    from metrics import METRICS
+    from sessions import build_session
+    from storage import BookStore
+
+    # The bulk alternative to crawl mode: same books, a page of records per request
+    oai.OAI_URL = repository_url + 'oai/request'
+    session = build_session(pool_size=1)
+    start = time.perf_counter()
+    with BookStore('books.jsonl') as store:
+        count, _ = oai.harvest(store, session)
+    elapsed = time.perf_counter() - start
+
+    snapshot = METRICS.snapshot()
+    fetch = snapshot['histograms'].get('fetch.oai.seconds', {})
+    return count, snapshot['counters'].get('bytes.oai', 0), {'p50': fetch.get('p50'), 'p99': fetch.get('p99')}, elapsed
+
+
+def _run_startup(config, repository_url, search_url):
+    # Time whole interpreter runs, as a cron job would see them
+    commands = [[sys.executable, CLI, command, '--help'] for command in ('crawl', 'download', 'list', 'scrape')]
+    tasks = [commands[i % len(commands)] for i in range(min(config['items'], 40))]
+
+    latencies = []
+    start = time.perf_counter()
+    for command in tasks:
+        run_start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        latencies.append(time.perf_counter() - run_start)
+    return len(latencies), 0, latencies, time.perf_counter() - start
+
+
+def run_mode(mode, config, repository_url, search_url):
+    """
+    Run one benchmark mode; called in a fresh process so RSS is per mode.
+
+    Returns:
+        dict: Operations, bytes, seconds, rates, latency percentiles and
+        peak RSS of the run.
+    """
+    runner = globals()[f"_run_{mode}"]
+    with tempfile.TemporaryDirectory(prefix=f"bench-{mode}-") as workdir:
+        os.chdir(workdir)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            # Each runner times only its measured loop, not imports and setup
+            operations, size, latencies, elapsed = runner(config, repository_url, search_url)
+
+    if isinstance(latencies, dict):
+        p50, p99 = latencies['p50'], latencies['p99']
+    else:
+        latencies.sort()
+        p50, p99 = _percentile(latencies, 0.50), _percentile(latencies, 0.99)
+
+    return {
+        'mode': mode,
+        'operations': operations,
+        'bytes': size,
+        'seconds': elapsed,
+        'ops_per_second': operations / elapsed if elapsed else None,
+        'mb_per_second': size / elapsed / 1e6 if elapsed else None,
+        'p50_ms': p50 * 1000 if p50 is not None else None,
+        'p99_ms': p99 * 1000 if p99 is not None else None,
+        'peak_rss_mb': _peak_rss() / 1e6 if resource is not None else None,
+    }
+
+
+def _format(value, spec):
+    return format(value, spec) if value is not None else '-'
+
+
+def main(modes=MODES, items=500, workers=10, processes=0, parser=None, pages_dir=None,
+         pdf_size=1024 * 1024, latency=0.0, jitter=0.0, sync=False, output=None, engine='threads'):
+    config = {
+        'items': items,
+        'workers': workers,
+        'processes': processes,
+        'parser': parser,
+        # The modes run in a temporary working directory
+        'pages_dir': os.path.abspath(pages_dir) if pages_dir else None,
+        'sync': sync,
+        'engine': engine,
+    }
+    results = []
+
+    repository = MockRepository(items=items, pages_dir=pages_dir, pdf_size=pdf_size, latency=latency,
+                                jitter=jitter)
+    with repository:
+        print(f"Mock repository on {repository.url}: {items} items, {pdf_size} byte PDFs, "
+              f"{latency * 1000:.0f}+{jitter * 1000:.0f} ms latency")
+        print(f"{'mode':<10}{'ops':>8}{'ops/s':>10}{'MB/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>10}")
+
+        # A fresh interpreter per mode, so imports and peak RSS do not carry over
+        context = multiprocessing.get_context('spawn')
+        for mode in modes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_mode, mode, config, repository.url, repository.search_url).result()
+            results.append(result)
+            print(f"{mode:<10}{result['operations']:>8}{_format(result['ops_per_second'], '.1f'):>10}"
+                  f"{_format(result['mb_per_second'], '.2f'):>10}{_format(result['p50_ms'], '.2f'):>10}"
+                  f"{_format(result['p99_ms'], '.2f'):>10}{_format(result['peak_rss_mb'], '.1f'):>10}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'config': dict(config, pdf_size=pdf_size, latency=latency, jitter=jitter),
+                       'results': results}, f, indent=2)
+    return results
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Benchmark the scraper and downloader against a local mock repository.")
+    parser.add_argument('modes', nargs='*', metavar='mode',
+                        help=f"what to measure: {', '.join(MODES)} (default: all)")
+    parser.add_argument('--items', type=int, default=500, help="books per mode (default: 500)")
+    parser.add_argument('--workers', type=int, default=10, help="concurrent requests (default: 10)")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="parser processes in crawl mode; 0 parses on the fetch threads (default: 0)")
+    parser.add_argument('--parser', default=None, help="BeautifulSoup tree builder (default: lxml if installed)")
+    parser.add_argument('--pages', default=None,
+                        help="directory of recorded item pages to serve, e.g. cache/pages (default: synthetic pages)")
+    parser.add_argument('--pdf-size', type=int, default=1024 * 1024, help="bytes per PDF (default: 1 MiB)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response (default: 0)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds (default: 0)")
+    parser.add_argument('--sync', action='store_true', help="fsync every store write in store mode")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help="crawl engine in crawl mode (default: threads)")
+    parser.add_argument('--output', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    for mode in args.modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode!r}, choose from {', '.join(MODES)}")
+
+    main(modes=args.modes or MODES, items=args.items, workers=args.workers, processes=args.processes,
+         parser=args.parser, pages_dir=args.pages, pdf_size=args.pdf_size, latency=args.latency,
+         jitter=args.jitter, sync=args.sync, output=args.output, engine=args.engine)
+
+
+if __name__ == "__main__":
+    cli()
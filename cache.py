@@ -0,0 +1,94 @@
+import gzip
+import json
+import os
+import time
+
+
+class PageCache:
+    """
+    Compressed on-disk copies of fetched item pages, keyed by book key.
+
+    Each page is kept as `<book_key>.html.gz` next to a `<book_key>.json`
+    file holding the URL, the ETag/Last-Modified validators, the time it
+    was fetched and a fingerprint of the extracted data. The metadata can
+    be rebuilt without the network, and a recrawl can ask the server
+    whether the page changed at all.
+    """
+
+    def __init__(self, directory='cache/pages'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return sum(1 for _ in self.keys())
+
+    def __contains__(self, book_key):
+        return os.path.exists(self._html_path(book_key))
+
+    def _html_path(self, book_key):
+        return os.path.join(self.directory, f"{book_key}.html.gz")
+
+    def _meta_path(self, book_key):
+        return os.path.join(self.directory, f"{book_key}.json")
+
+    def put(self, book_key, url, page_source, headers=None, book_hash=None):
+        """
+        Store one page, replacing any previous copy.
+
+        Args:
+            book_key (str): Key of the book, e.g. "11419_14619".
+            url (str): URL the page was fetched from.
+            page_source (str): HTML of the page.
+            headers (Mapping, optional): Response headers, for the validators.
+            book_hash (str, optional): Fingerprint of the data extracted from
+                the page, see `BookScraper.book_hash`.
+        """
+        headers = headers or {}
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'book_hash': book_hash,
+        }
+
+        # Write both files under temporary names first so that a reader
+        # never sees a truncated page
+        html_path = self._html_path(book_key)
+        with gzip.open(html_path + '.tmp', 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(page_source)
+        os.replace(html_path + '.tmp', html_path)
+
+        meta_path = self._meta_path(book_key)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def get(self, book_key):
+        """
+        Returns:
+            str: The cached HTML of the book page, or None if not cached.
+        """
+        try:
+            with gzip.open(self._html_path(book_key), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def meta(self, book_key):
+        """
+        Returns:
+            dict: URL, etag, last_modified, fetched_at and book_hash of the
+            cached page, or None.
+        """
+        try:
+            with open(self._meta_path(book_key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def keys(self):
+        """Yield the book key of every cached page."""
+        for name in os.listdir(self.directory):
+            if name.endswith('.html.gz'):
+                yield name[:-len('.html.gz')]
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+from array import array
+
+from storage import iter_books
+
+
+# Fields that can be queried; each has an inverted index
+FIELDS = ('subject', 'keyword', 'license', 'link_type', 'format')
+
+# Bump when the pickled layout changes, so old index files are rebuilt
+VERSION = 1
+
+
+class BookRecord:
+    """
+    The queryable part of one book, without abstract, authors and the other
+    free text. Repeated strings (subjects, keywords, licences, file types)
+    are interned, so every record shares one copy of each.
+    """
+
+    __slots__ = ('key', 'title', 'subjects', 'keywords', 'licenses', 'links', 'offset')
+
+    def __init__(self, key, title, subjects, keywords, licenses, links, offset=None):
+        self.key = key
+        self.title = title
+        self.subjects = subjects
+        self.keywords = keywords
+        self.licenses = licenses
+        self.links = links      # ((file type, path), ...)
+        self.offset = offset    # byte offset of the full record in a .jsonl store
+
+    def __repr__(self):
+        return f"BookRecord({self.key!r}, {self.title!r})"
+
+    def values(self, field):
+        """Return the values of `field` (one of `FIELDS`) of this book."""
+        if field == 'subject':
+            return self.subjects
+        if field == 'keyword':
+            return self.keywords
+        if field == 'license':
+            return self.licenses
+        if field == 'link_type':
+            return tuple(file_type for file_type, _ in self.links)
+        if field == 'format':
+            return tuple(_format(file_type) for file_type, _ in self.links)
+        raise ValueError(f"Unknown field {field!r}, choose from {', '.join(FIELDS)}")
+
+
+def _format(file_type):
+    # "Book - Adobe PDF" -> "Adobe PDF"
+    return sys.intern(file_type.rsplit(" - ", 1)[-1])
+
+
+def _texts(value):
+    """The strings of a metadata value: a string, a list of them or of {"text", "url"} links."""
+    if not value:
+        return ()
+    if isinstance(value, (str, dict)):
+        value = [value]
+    texts = (item.get('text', '') if isinstance(item, dict) else str(item) for item in value)
+    return tuple(sys.intern(text.strip()) for text in texts if text and text.strip())
+
+
+def _record(key, book_data, offset=None):
+    metadata = book_data.get('metadata', {})
+    title = metadata.get('Title')
+    if isinstance(title, list):
+        title = title[0] if title else None
+    return BookRecord(
+        key=sys.intern(key),
+        title=title,
+        subjects=_texts(metadata.get('Subjects')),
+        keywords=_texts(metadata.get('Keywords')),
+        licenses=_texts(metadata.get('License')),
+        links=tuple((sys.intern(file_type), path) for file_type, path in book_data.get('links', {}).items()),
+        offset=offset,
+    )
+
+
+def _casefolded(wanted):
+    """The set of casefolded values of a criterion: None, a string or a list of them."""
+    if wanted is None:
+        return None
+    if isinstance(wanted, str):
+        wanted = [wanted]
+    return {value.casefold() for value in wanted}
+
+
+def _iter_jsonl_offsets(path):
+    """
+    Yield `(book_key, book_data, offset)` of every line of a `BookStore`
+    file; book_data is None for a deletion.
+    """
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                pass
+            else:
+                yield record['key'], None if record.get('deleted') else record['data'], offset
+            offset += len(line)
+
+
+class Catalogue:
+    """
+    Compact, indexed view of the books for filtering by subject, keyword,
+    licence or file type.
+
+    Every book is a `BookRecord`, and every value of the `FIELDS` maps to
+    an array of the ids of the books that have it, so a query intersects a
+    few small arrays instead of walking the nested `books.json` dict.
+    Values are matched case-insensitively.
+
+    Build it with `Catalogue.build`, or `open_catalogue` to reuse the index
+    file kept next to the books as long as they did not change.
+    """
+
+    def __init__(self, records=(), source=None):
+        self.records = []
+        self.source = source
+        self._ids = {}      # book key -> record id
+        self.indexes = {field: {} for field in FIELDS}
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def add(self, record):
+        """Add a book, replacing an earlier record with the same key."""
+        if record.key in self._ids:
+            self._remove(self._ids[record.key])
+        record_id = len(self.records)
+        self.records.append(record)
+        self._ids[record.key] = record_id
+
+        for field in FIELDS:
+            index = self.indexes[field]
+            for value in set(value.casefold() for value in record.values(field)):
+                index.setdefault(sys.intern(value), array('I')).append(record_id)
+
+    def remove(self, key):
+        """Drop the book `key`, if the catalogue has it."""
+        record_id = self._ids.pop(key, None)
+        if record_id is not None:
+            self._remove(record_id)
+
+    def _remove(self, record_id):
+        record = self.records[record_id]
+        for field in FIELDS:
+            index = self.indexes[field]
+            for value in set(value.casefold() for value in record.values(field)):
+                ids = index[value]
+                del ids[ids.index(record_id)]
+                if not ids:
+                    del index[value]
+        self.records[record_id] = None
+
+    @classmethod
+    def build(cls, path='books.jsonl'):
+        """
+        Index a `BookStore` file, or a `books.json` export.
+
+        Only a .jsonl store records where each full book is, for `book`.
+        """
+        catalogue = cls(source=path)
+        if path.endswith('.jsonl'):
+            for key, book_data, offset in _iter_jsonl_offsets(path):
+                if book_data is None:
+                    catalogue.remove(key)
+                else:
+                    catalogue.add(_record(key, book_data, offset))
+        else:
+            for key, book_data in iter_books(path):
+                catalogue.add(_record(key, book_data))
+        return catalogue
+
+    def get(self, key):
+        """Return the `BookRecord` of `key`, or None."""
+        record_id = self._ids.get(key)
+        return self.records[record_id] if record_id is not None else None
+
+    def book(self, key):
+        """
+        Read the full book data of `key` from the source file.
+
+        Returns:
+            dict: The `links`/`metadata` dict, or None if `key` is unknown.
+        """
+        record = self.get(key)
+        if record is None:
+            return None
+        if record.offset is None:
+            # books.json has no offsets: scan it
+            return next((book_data for book_key, book_data in iter_books(self.source) if book_key == key), None)
+        with open(self.source, 'rb') as f:
+            f.seek(record.offset)
+            return json.loads(f.readline())['data']
+
+    def query(self, **criteria):
+        """
+        Find the books matching every given criterion.
+
+        Args:
+            subject, keyword, license, link_type, format (str or list):
+                Value(s) the book must have; a list matches any of them.
+                E.g. `query(subject="Μαθηματικά", format="Adobe PDF")`.
+        Returns:
+            list: The matching `BookRecord`s, in the order they were added.
+        """
+        matches = None
+        for field, wanted in criteria.items():
+            if field not in self.indexes:
+                raise ValueError(f"Unknown field {field!r}, choose from {', '.join(FIELDS)}")
+            if wanted is None:
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            index = self.indexes[field]
+            ids = set()
+            for value in wanted:
+                ids.update(index.get(value.casefold(), ()))
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+
+        if matches is None:
+            return [record for record in self.records if record is not None]
+        return [self.records[record_id] for record_id in sorted(matches)]
+
+    def counts(self, field):
+        """
+        Returns:
+            list: (value, number of books) of `field`, most common first.
+            Values are as they appear in the books, not casefolded.
+        """
+        spelling = {}
+        for record in self.records:
+            if record is not None:
+                for value in record.values(field):
+                    spelling.setdefault(value.casefold(), value)
+        counts = [(spelling.get(value, value), len(ids)) for value, ids in self.indexes[field].items()]
+        return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+    def download_items(self, records, link_type=None, file_format=None):
+        """
+        Yield `(book_key, {"links": ...})` pairs for `pdfs.iter_downloads`,
+        keeping only the links of the given file type or format.
+
+        Args:
+            records (iterable): `BookRecord`s, e.g. from `query`.
+            link_type, file_format (str or list, optional): File type(s) or
+                format(s) to keep; a list keeps any of them. Matched
+                case-insensitively, as in `query`.
+        """
+        link_types = _casefolded(link_type)
+        file_formats = _casefolded(file_format)
+        for record in records:
+            links = {file_type: path for file_type, path in record.links
+                     if (link_types is None or file_type.casefold() in link_types)
+                     and (file_formats is None or _format(file_type).casefold() in file_formats)}
+            if links:
+                yield record.key, {'links': links, 'metadata': {'Title': record.title}}
+
+    def save(self, path):
+        """Write the catalogue to `path`, stamped with the state of its source."""
+        stat = os.stat(self.source)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((VERSION, self.source, stat.st_size, stat.st_mtime_ns, self), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+def open_catalogue(books_path='books.jsonl', index_path='catalogue.pickle'):
+    """
+    Load the catalogue index of `books_path`, rebuilding it when the books
+    changed since it was written.
+    """
+    stat = os.stat(books_path)
+    try:
+        with open(index_path, 'rb') as f:
+            version, source, size, mtime_ns, catalogue = pickle.load(f)
+        if (version, source, size, mtime_ns) == (VERSION, books_path, stat.st_size, stat.st_mtime_ns):
+            return catalogue
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+        pass
+
+    catalogue = Catalogue.build(books_path)
+    catalogue.save(index_path)
+    return catalogue
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Query the books by subject, keyword, licence or file type.")
+    parser.add_argument('--books', default='books.jsonl', help="book store or books.json (default: books.jsonl)")
+    parser.add_argument('--index', default='catalogue.pickle',
+                        help="where the index is kept between runs (default: catalogue.pickle)")
+    for field in FIELDS:
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, action='append', default=None,
+                            help=f"only books with this {field.replace('_', ' ')}; repeat for any of several")
+    parser.add_argument('--counts', choices=FIELDS, default=None,
+                        help="list the values of a field and how many books have each, instead")
+    parser.add_argument('--output', default=None,
+                        help="write the matching books and links in books.json form, for pdfs.py --books")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    catalogue = open_catalogue(args.books, args.index)
+    loaded = time.perf_counter()
+
+    if args.counts:
+        for value, count in catalogue.counts(args.counts):
+            print(f"{count}\t{value}")
+        return
+
+    criteria = {field: getattr(args, field) for field in FIELDS}
+    records = catalogue.query(**criteria)
+    queried = time.perf_counter()
+
+    if args.output:
+        # Only the chosen file types, so pdfs.py downloads just those
+        selected = dict(catalogue.download_items(records, link_type=args.link_type, file_format=args.format))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(selected, f, indent=4, ensure_ascii=False)
+        print(f"{len(selected)} books written to {args.output}")
+    else:
+        for record in records:
+            print(f"{record.key}\t{record.title or ''}")
+
+    print(f"{len(records)} of {len(catalogue)} books match (index loaded in {(loaded - start) * 1000:.1f} ms, "
+          f"queried in {(queried - loaded) * 1000:.2f} ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    cli()
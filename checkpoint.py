@@ -0,0 +1,254 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+
+# Life cycle of an item; "failed" items wait in the failure queue instead
+STATES = ('discovered', 'fetched', 'parsed', 'stored', 'failed')
+
+
+class Checkpoint:
+    """
+    SQLite record of crawl progress, per search page and per item handle.
+
+    Every item link found on a search page is recorded as "discovered" and
+    moves through "fetched" and "parsed" to "stored" (or to "failed"). A
+    resumed crawl re-queues exactly the items that did not reach "stored"
+    and lists only the search pages that were not listed yet. Handles are
+    keyed by URL, so an item that shifts to another page between runs is
+    not scraped twice.
+
+    State changes are buffered and committed in batches, like the download
+    ledger; discoveries are committed straight away.
+    """
+
+    def __init__(self, path='checkpoint.db', batch_size=200, batch_seconds=5.0):
+        """
+        Open (or create) the checkpoint.
+
+        Args:
+            path (str): SQLite database file.
+            batch_size (int): Commit once this many state changes are buffered.
+            batch_seconds (float): Commit once the oldest buffered change is
+                this many seconds old, whichever comes first.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS handles (
+                url TEXT PRIMARY KEY,
+                page INTEGER,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS handles_state ON handles (state)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page INTEGER PRIMARY KEY,
+                links INTEGER,
+                listed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def discover(self, page, links, include_known=False):
+        """
+        Record the item links of a listed search page.
+
+        Args:
+            page (int): The search page.
+            links (list): Item URLs found on it.
+            include_known (bool): Also return links seen before, e.g. for a
+                full recrawl.
+        Returns:
+            list: The links to scrape: new ones, or all of them with
+            `include_known`. Known links are either stored, failed (and in
+            the failure queue) or queued already by a resumed run.
+        """
+        now = time.time()
+        with self._lock:
+            known = set()
+            for start in range(0, len(links), 500):
+                chunk = links[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                known.update(row[0] for row in self.conn.execute(
+                    f"SELECT url FROM handles WHERE url IN ({placeholders})", chunk))
+
+            new = [link for link in dict.fromkeys(links) if link not in known]
+            self.conn.executemany(
+                "INSERT INTO handles (url, page, state, updated_at) VALUES (?, ?, 'discovered', ?)",
+                ((link, page, now) for link in new),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (page, links, listed_at) VALUES (?, ?, ?)",
+                (page, len(links), now),
+            )
+            self._commit()
+
+        return list(dict.fromkeys(links)) if include_known else new
+
+    def mark(self, url, state):
+        """Move the item at `url` to `state`, one of `STATES`."""
+        if state not in STATES:
+            raise ValueError(f"Unknown state {state!r}")
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO handles (url, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (url, state, time.time()),
+            )
+            self._uncommitted += 1
+            if (self._uncommitted >= self.batch_size
+                    or time.monotonic() - self._last_commit >= self.batch_seconds):
+                self._commit()
+
+    def outstanding(self):
+        """
+        Returns:
+            list: (url, page) of the items discovered but not stored or failed.
+        """
+        with self._lock:
+            return self.conn.execute(
+                "SELECT url, page FROM handles WHERE state IN ('discovered', 'fetched', 'parsed') "
+                "ORDER BY page, url"
+            ).fetchall()
+
+    def next_page(self, owns_page=None):
+        """
+        Args:
+            owns_page (callable, optional): Predicate of the pages this crawl
+                lists, e.g. `Shard.owns_page`; others count as listed.
+        Returns:
+            int: The first search page not listed yet.
+        """
+        with self._lock:
+            listed = {page for (page,) in self.conn.execute("SELECT page FROM pages")}
+        page = 1
+        while page in listed or (owns_page is not None and not owns_page(page)):
+            page += 1
+        return page
+
+    @property
+    def listing_complete(self):
+        """True once a crawl listed every search page."""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_page'").fetchone()
+        return row is not None
+
+    def set_listing_complete(self, last_page):
+        """Record that `last_page` is past the end of the catalogue."""
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_page', ?)",
+                              (str(last_page),))
+            self._commit()
+
+    def reset_listing(self):
+        """Forget which search pages were listed, so a new crawl lists them all again."""
+        with self._lock:
+            self.conn.execute("DELETE FROM pages")
+            self.conn.execute("DELETE FROM meta WHERE key = 'last_page'")
+            self._commit()
+
+    def stored_at(self):
+        """
+        Returns:
+            dict: {url: time it was stored} of every stored item.
+        """
+        with self._lock:
+            return dict(self.conn.execute("SELECT url, updated_at FROM handles WHERE state = 'stored'"))
+
+    def get_meta(self, key, default=None):
+        """Return a value saved with `set_meta`, e.g. the date of the last OAI-PMH harvest."""
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._commit()
+
+    def counts(self):
+        """
+        Returns:
+            dict: Number of items in each state.
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM handles GROUP BY state").fetchall()
+        return dict(rows)
+
+    def import_completed_pages(self, progress_path='completed_pages.txt'):
+        """Treat the pages counted in an old `completed_pages.txt` as listed and done."""
+        with open(progress_path, 'r') as f:
+            completed = int(f.read().strip())
+
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO pages (page, links, listed_at) VALUES (?, NULL, ?)",
+                ((page, now) for page in range(1, completed + 1)),
+            )
+            self._commit()
+        return completed
+
+    def _commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self.conn.close()
+
+
+def open_checkpoint(path='checkpoint.db', legacy_text='completed_pages.txt'):
+    """
+    Open the crawl checkpoint, importing `completed_pages.txt` the first time.
+    """
+    is_new = not os.path.exists(path)
+    checkpoint = Checkpoint(path)
+    if is_new and os.path.exists(legacy_text):
+        pages = checkpoint.import_completed_pages(legacy_text)
+        print(f"Imported {pages} completed pages from {legacy_text} into {path}")
+    return checkpoint
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Show the progress recorded in the crawl checkpoint.")
+    parser.add_argument('--path', default='checkpoint.db', help="checkpoint file (default: checkpoint.db)")
+    args = parser.parse_args(argv)
+
+    with Checkpoint(args.path) as checkpoint:
+        counts = checkpoint.counts()
+        for state in STATES:
+            print(f"{state}: {counts.get(state, 0)}")
+        status = "complete" if checkpoint.listing_complete else f"next page {checkpoint.next_page()}"
+        print(f"listing: {status}")
+
+
+if __name__ == "__main__":
+    cli()
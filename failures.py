@@ -0,0 +1,121 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+
+class FailureQueue:
+    """
+    Persisted dead-letter queue of work that kept failing.
+
+    Every row names what failed (`kind`: "listing", "item" or "pdf" and a
+    `target` such as the URL), the last error, how many runs it failed in
+    and any `detail` needed to repeat it alone, e.g. the search page number
+    or the destinations of a PDF. A later run can retry just these rows
+    (`main.py --retry-failed`, `pdfs.py --retry-failed`) and removes the
+    ones that succeed.
+    """
+
+    def __init__(self, path='failures.db'):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS failures (
+                kind TEXT NOT NULL,
+                target TEXT NOT NULL,
+                error TEXT,
+                detail TEXT,
+                failures INTEGER NOT NULL,
+                first_failed REAL NOT NULL,
+                last_failed REAL NOT NULL,
+                PRIMARY KEY (kind, target)
+            )
+        """)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM failures").fetchone()[0]
+
+    def add(self, kind, target, error, detail=None):
+        """
+        Record a failure, or count one more for a known target.
+
+        Args:
+            kind (str): "listing", "item" or "pdf".
+            target (str): What failed, normally the URL.
+            error (str): Description of the last error.
+            detail (dict, optional): JSON-serialisable data needed to retry.
+        """
+        now = time.time()
+        detail = json.dumps(detail, ensure_ascii=False) if detail is not None else None
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO failures (kind, target, error, detail, failures, first_failed, last_failed) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT (kind, target) DO UPDATE SET "
+                "error = excluded.error, detail = excluded.detail, "
+                "failures = failures + 1, last_failed = excluded.last_failed",
+                (kind, target, error, detail, now, now),
+            )
+            self.conn.commit()
+
+    def remove(self, kind, target):
+        """Forget a target once it succeeded."""
+        with self._lock:
+            self.conn.execute("DELETE FROM failures WHERE kind = ? AND target = ?", (kind, target))
+            self.conn.commit()
+
+    def items(self, kind=None):
+        """
+        Returns:
+            list: The failure rows as dicts, oldest first, optionally only of one kind.
+        """
+        query = "SELECT * FROM failures"
+        params = ()
+        if kind is not None:
+            query += " WHERE kind = ?"
+            params = (kind,)
+        query += " ORDER BY first_failed"
+
+        with self._lock:
+            cursor = self.conn.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        for row in rows:
+            row['detail'] = json.loads(row['detail']) if row['detail'] else None
+        return rows
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Inspect the queue of failed listing pages, items and PDFs.")
+    parser.add_argument('--path', default='failures.db', help="failure queue (default: failures.db)")
+    parser.add_argument('--kind', choices=['listing', 'item', 'pdf'], default=None,
+                        help="only show failures of this kind")
+    args = parser.parse_args(argv)
+
+    with FailureQueue(args.path) as failures:
+        rows = failures.items(args.kind)
+        for row in rows:
+            print(f"{row['kind']}\t{row['target']}\t{row['failures']}x\t{row['error']}")
+        print(f"{len(rows)} failed")
+
+
+if __name__ == "__main__":
+    cli()
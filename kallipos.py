@@ -0,0 +1,135 @@
+import argparse
+import contextlib
+import importlib
+import json
+import sys
+
+
+# Subcommands handled by the `cli` of another module: name -> (module, help).
+# The module is only imported once its subcommand is chosen, so a short job
+# does not pay for the imports of the others.
+FORWARDED = {
+    'crawl': ('main', "scrape the catalogue into books.jsonl (see crawl --help)"),
+    'harvest': ('oai', "harvest the catalogue in bulk over OAI-PMH (see harvest --help)"),
+    'download': ('pdfs', "download the files of the scraped books (see download --help)"),
+    'merge': ('shard', "merge the books and downloads of sharded runs"),
+    'query': ('catalogue', "find books by subject, keyword, licence or file type"),
+    'status': ('checkpoint', "show the crawl progress recorded in checkpoint.db"),
+    'failures': ('failures', "list the search pages, items and files that failed"),
+    'bench': ('bench', "benchmark against a local mock repository"),
+}
+
+
+def list_pages(first=1, pages=None, use_selenium=False, output=sys.stdout):
+    """
+    Write the item links of the search pages to `output`, one per line.
+
+    Args:
+        first (int): First search page to list.
+        pages (int, optional): How many pages to list. Defaults to all up to
+            the end of the catalogue, or until `main.MAX_LISTING_FAILURES`
+            pages in a row failed, as `main.crawl` stops.
+        use_selenium (bool): List with a headless Chrome instead of HTTP.
+    Returns:
+        tuple: The number of links written, and of pages that failed.
+    """
+    import main
+    from sessions import build_session
+
+    driver = main.create_driver() if use_selenium else None
+    session = build_session()
+    count = 0
+    failed = 0
+    failed_in_a_row = 0
+    try:
+        page = first
+        while pages is None or page < first + pages:
+            # Progress messages go to stderr, the links alone to `output`
+            with contextlib.redirect_stdout(sys.stderr):
+                links = main.get_page_links(page, session=session, driver=driver)
+            if links is False:
+                break
+            if not links:
+                failed += 1
+                failed_in_a_row += 1
+                if failed_in_a_row >= main.MAX_LISTING_FAILURES:
+                    print(f"{failed_in_a_row} search pages in a row failed, stopping at page {page}",
+                          file=sys.stderr)
+                    break
+            else:
+                failed_in_a_row = 0
+            for link in links:
+                print(link, file=output)
+            count += len(links)
+            page += 1
+    finally:
+        if driver is not None:
+            driver.quit()
+    return count, failed
+
+
+def scrape(urls, parser=None, output=sys.stdout):
+    """
+    Scrape single item pages and write their books to `output` as JSON.
+
+    Returns:
+        int: The number of items that could not be scraped.
+    """
+    from BookScraper import BookScraper
+    from sessions import build_session
+
+    session = build_session()
+    books = {}
+    failed = 0
+    for url in urls:
+        with contextlib.redirect_stdout(sys.stderr):
+            book_data_dict = BookScraper(url=url, session=session, parser=parser).scrape()
+        if book_data_dict:
+            books.update(book_data_dict)
+        else:
+            failed += 1
+    json.dump(books, output, indent=4, ensure_ascii=False)
+    print(file=output)
+    return failed
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(prog='kallipos', description="Scrape and download the Kallipos repository.")
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    for name, (_, description) in FORWARDED.items():
+        # The module's own parser handles the arguments, --help included
+        subparsers.add_parser(name, help=description, add_help=False)
+
+    list_parser = subparsers.add_parser('list', help="print the item links of the search pages")
+    list_parser.add_argument('--first', type=int, default=1, help="first search page (default: 1)")
+    list_parser.add_argument('--pages', type=int, default=None, help="number of search pages (default: all)")
+    list_parser.add_argument('--selenium', action='store_true',
+                             help="list search pages with a headless Chrome instead of plain HTTP")
+
+    scrape_parser = subparsers.add_parser('scrape', help="scrape item pages and print their books as JSON")
+    scrape_parser.add_argument('urls', nargs='+', metavar='url', help="item page, e.g. .../handle/11419/123")
+    scrape_parser.add_argument('--parser', default=None,
+                               help="BeautifulSoup backend, e.g. lxml or html.parser (default: fastest installed)")
+
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command in FORWARDED:
+        module = importlib.import_module(FORWARDED[args.command][0])
+        return module.cli(rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    if args.command == 'list':
+        _, failed = list_pages(first=args.first, pages=args.pages, use_selenium=args.selenium)
+        if failed:
+            print(f"{failed} search pages could not be listed", file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'scrape':
+        if scrape(args.urls, parser=args.parser):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
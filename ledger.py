@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class DownloadLedger:
+    """
+    SQLite record of every PDF download attempt.
+
+    Rows are keyed by the same `<directory>_<filename>` string that
+    `downloaded_files.txt` used, and carry the source URL, local path, byte
+    size, SHA-256 and status of the file. Writes are buffered and committed
+    in batches, so bookkeeping does not cost an fsync per download.
+    """
+
+    def __init__(self, path='downloads.db', batch_size=200, batch_seconds=5.0):
+        """
+        Open (or create) the ledger.
+
+        Args:
+            path (str): SQLite database file.
+            batch_size (int): Commit once this many downloads are buffered.
+            batch_seconds (float): Commit once the oldest buffered download
+                is this many seconds old, whichever comes first.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                path TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS downloads_url ON downloads (url)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def is_done(self, key):
+        """Return True if the file stored under `key` finished downloading."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM downloads WHERE key = ? AND status = 'done'", (key,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, key):
+        """
+        Returns:
+            dict: The ledger row for `key`, or None if it was never recorded.
+        """
+        with self._lock:
+            cursor = self.conn.execute("SELECT * FROM downloads WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def find_done_by_url(self, url):
+        """
+        Returns:
+            dict: A finished download of `url` with a known hash, or None.
+        """
+        with self._lock:
+            cursor = self.conn.execute(
+                "SELECT * FROM downloads WHERE url = ? AND status = 'done' AND sha256 IS NOT NULL LIMIT 1",
+                (url,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def items(self):
+        """
+        Returns:
+            list: Every ledger row as a dict.
+        """
+        with self._lock:
+            cursor = self.conn.execute("SELECT * FROM downloads ORDER BY key")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def record(self, key, status, url=None, path=None, size=None, sha256=None):
+        """
+        Insert or update the row for `key`.
+
+        Args:
+            key (str): `<directory>_<filename>` name of the download.
+            status (str): "done" or "failed".
+            url (str, optional): Absolute URL the file was fetched from.
+            path (str, optional): Local path of the file.
+            size (int, optional): Size in bytes.
+            sha256 (str, optional): Hex digest of the content.
+        """
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO downloads (key, url, path, size, sha256, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, path, size, sha256, status, time.time()),
+            )
+            self._uncommitted += 1
+            if (self._uncommitted >= self.batch_size
+                    or time.monotonic() - self._last_commit >= self.batch_seconds):
+                self._commit()
+
+    def import_text(self, progress_path='downloaded_files.txt'):
+        """Import the keys of an old `downloaded_files.txt` as finished downloads."""
+        with open(progress_path, 'r', encoding='utf-8') as progress_file:
+            keys = [line.strip() for line in progress_file if line.strip()]
+
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO downloads (key, status, updated_at) VALUES (?, 'done', ?)",
+                ((key, now) for key in keys),
+            )
+            self._commit()
+        return len(keys)
+
+    def _commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self.conn.close()
+
+
+def open_ledger(path='downloads.db', legacy_text='downloaded_files.txt'):
+    """
+    Open the download ledger, importing `downloaded_files.txt` the first time.
+    """
+    is_new = not os.path.exists(path)
+    ledger = DownloadLedger(path)
+    if is_new and os.path.exists(legacy_text):
+        count = ledger.import_text(legacy_text)
+        print(f"Imported {count} entries from {legacy_text} into {path}")
+    return ledger
@@ -1,126 +1,718 @@
 import requests
-from BookScraper import BookScraper 
-import json
-import requests
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from BookScraper import BookScraper
+from sessions import build_session
+from storage import BookStore, open_store
+from ratelimit import AdaptiveLimiter, limited
+from cache import PageCache
+from metrics import METRICS, Reporter
+from retry import DEFAULT_RETRY, RetryPolicy, HTTPStatusError
+from failures import FailureQueue
+from checkpoint import open_checkpoint
+from shard import Shard
 import time
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import repeat
 import urllib3
+from urllib.parse import urljoin
 
 # Suppress only the InsecureRequestWarning
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def get_page_links(page):
-    results = []
-    
+SEARCH_URL = 'https://repository.kallipos.gr/simple-search?query=&filter_field_1=lang&filter_type_1=equals&filter_value_1=el&sort_by=score&order=desc&rpp=100&etal=0&start={start}'
+
+# A crawl stops after this many search pages in a row failed for good
+MAX_LISTING_FAILURES = 3
+
+
+def create_driver(headless=True):
+    """Start the Chrome webdriver used by the Selenium listing fallback."""
+    # Selenium takes longer to import than everything else here together;
+    # only runs with --selenium pay for it
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    options = Options()
+    if headless:
+        options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+
+    with METRICS.timer('selenium.startup.seconds'):
+        return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+
+def _fetch_links_http(url, session, limiter=None):
+    with limited(limiter) as request:
+        with METRICS.timer('fetch.listing.seconds'):
+            response = session.get(url, verify=False, timeout=30)
+        request.observe(response.status_code)
+
+    METRICS.incr(f'http.status.{response.status_code}')
+    METRICS.incr('bytes.listing', len(response.content))
+    if response.status_code != 200:
+        raise HTTPStatusError.from_response(response)
+    return parse_listing(response.text, url)
+
+
+def parse_listing(page_source, url):
+    """
+    Returns:
+        list: The absolute item links of a search page's HTML.
+    """
+    soup = BeautifulSoup(page_source, 'html.parser')
+
+    hrefs = []
+    for column in soup.find_all(class_='itemListValt2'):
+        for link in column.find_all('a', href=True):
+            # Selenium reports absolute hrefs, keep the same shape here
+            hrefs.append(urljoin(url, link['href']))
+    return hrefs
+
+
+def _fetch_links_selenium(url, driver):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver.get(url)
+    wait = WebDriverWait(driver, 30)
+    columns = wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'itemListValt2')))
+
+    hrefs = []
+    for column in columns:
+        links = column.find_elements(By.TAG_NAME, 'a')
+        for link in links:
+            href = link.get_attribute('href')
+            if href:
+                hrefs.append(href)
+    return hrefs
+
+
+def check_links(hrefs, page):
+    """
+    Report unusual link counts of a search page.
+
+    Returns:
+        list: `hrefs`, or False if there are none (past the last page).
+    """
+    if len(hrefs) > 100:
+        print(f"Found {len(hrefs)} links on page {page}. More than 100 links found.")
+    elif len(hrefs) == 0:
+        print(f"Fatal error: No links found on page {page}.")
+        print('Stopping the program.')
+        return False
+    elif len(hrefs) < 100:
+        print(f"Found {len(hrefs)} links on page {page}. Less than 100 links found.")
+
+    return hrefs
+
+
+def get_page_links(page, session=None, driver=None, limiter=None, retry=None, failures=None):
+    """
+    Collect the item links of one 100-item search page.
+
+    The page is fetched over plain HTTP unless a Selenium driver is given,
+    in which case the (shared) browser is used instead. Transient failures
+    are retried according to `retry`; a page that still fails is recorded
+    in the `failures` queue.
+
+    Returns:
+        list: The item links, False if the page has none (past the last
+        page), or an empty list if it could not be fetched.
+    """
+    retry = retry or DEFAULT_RETRY
     # For paginated pages:
-    url = f'https://repository.kallipos.gr/simple-search?query=&filter_field_1=lang&filter_type_1=equals&filter_value_1=el&sort_by=score&order=desc&rpp=100&etal=0&start={page*100 - 100}'
-    
+    url = SEARCH_URL.format(start=page*100 - 100)
+
     # Static page (for testing):
     # url = 'https://repository.kallipos.gr/handle/11419/14619'
     print(url)
 
-    options = Options()
-     
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm -usage")
-    service = Service()
-    
+    try:
+        if driver is not None:
+            hrefs = retry.call('listing', _fetch_links_selenium, url, driver)
+        else:
+            hrefs = retry.call('listing', _fetch_links_http, url, session or requests, limiter)
+        return check_links(hrefs, page)
 
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    wait = WebDriverWait(driver, 30)
-    
+    except Exception as e:
+        mode = 'selenium' if driver is not None else 'http'
+        METRICS.incr(f'errors.listing.{type(e).__name__}')
+        print(f"An error occurred in get_page_links ({mode}) while parsing page {page}: {e}")
+        if failures is not None:
+            failures.add('listing', url, f"{type(e).__name__}: {e}", {'page': page})
+        return []
+
+
+
+def _scrape_one(link, session, limiter=None, parser=None, cache=None, conditional=False, retry=None,
+                failures=None):
+    scraper = BookScraper(url=link, session=session, limiter=limiter, parser=parser, cache=cache,
+                          conditional=conditional, retry=retry)
+    book_data_dict = scraper.scrape()
+    if scraper.error is not None and failures is not None:
+        failures.add('item', link, f"{type(scraper.error).__name__}: {scraper.error}")
+    return scraper.book_key, book_data_dict, scraper.changed
+
+
+def _fetch_one(link, session, limiter=None, cache=None, conditional=False, retry=None, failures=None):
+    scraper = BookScraper(url=link, session=session, limiter=limiter, cache=cache, conditional=conditional,
+                          retry=retry)
     try:
-        driver.get(url)
+        page_source = scraper.fetch()
+    except Exception as e:
+        METRICS.incr(f'errors.item.{type(e).__name__}')
+        print(f"An error occurred in BookScraper.fetch: {e}")
+        if failures is not None:
+            failures.add('item', link, f"{type(e).__name__}: {e}")
+        page_source = None
+    return scraper.url, page_source, scraper.headers, scraper.previous, scraper.changed
 
-        columns = wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'itemListValt2')))
 
-        hrefs = []
-        for column in columns:
-            links = column.find_elements(By.TAG_NAME, 'a')
-            for link in links:
-                href = link.get_attribute('href')
-                if href:
-                    hrefs.append(href)
+def parse_pool(processes=None):
+    """
+    Create the process pool item pages are parsed on.
 
-        
+    Workers are started by a fork server (spawned where there is none), not
+    forked from the crawl: a fork copies every lock another thread holds at
+    that moment, such as the `METRICS` lock the fetch and reporter threads
+    keep taking, and a worker that inherits it locked hangs on its first
+    metric.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method))
 
-        if len(hrefs) > 100:
-            print(f"Found {len(results)} links on page {page}. More than 100 links found.")
-        elif len(hrefs) == 0:
-            print(f"Fatal error: No links found on page {page}.")
-            print('Stopping the program.')
-            return False
-        elif len(hrefs) < 100:
-            print(f"Found {len(results)} links on page {page}. Less than 100 links found.")
 
-        return hrefs
+def parse_batch(pages, parser=None, cache_dir=None, failures_path=None):
+    """
+    Parse a batch of fetched item pages; runs in a worker process.
 
+    Args:
+        pages (list): (url, page_source, headers, previous cache meta) tuples
+            as returned by `BookScraper.fetch`.
+        parser (str, optional): BeautifulSoup tree builder.
+        cache_dir (str, optional): Page cache to record the pages in.
+        failures_path (str, optional): Failure queue to record unparseable
+            pages in.
+    Returns:
+        tuple: A list of (book_key, book_data_dict, changed) for each page, in
+        order, and the metrics snapshot of the batch.
+    """
+    # Only this batch's timings go back to the parent, which merges them
+    METRICS.reset()
+    cache = PageCache(cache_dir) if cache_dir else None
+
+    results = []
+    for url, page_source, headers, previous in pages:
+        scraper = BookScraper(url=url, parser=parser, cache=cache)
+        try:
+            book_data_dict = scraper.process(page_source, headers, previous)
+        except Exception as e:
+            print(f"An error occurred in parse_batch while parsing {url}: {e}")
+            if failures_path:
+                with FailureQueue(failures_path) as failures:
+                    failures.add('item', url, f"{type(e).__name__}: {e}")
+            book_data_dict = None
+        results.append((scraper.book_key, book_data_dict, scraper.changed))
+    return results, METRICS.snapshot()
+
+
+def _reparse_one(cache_dir, book_key, parser=None):
+    cache = PageCache(cache_dir)
+    try:
+        meta = cache.meta(book_key)
+        if meta is None:
+            raise ValueError("no cached metadata")
+        scraper = BookScraper(url=meta['url'], parser=parser)
+        return book_key, scraper.parse(cache.get(book_key))[scraper.book_key], None
     except Exception as e:
-        print(f"An error occurred in get_page_links (selenium) while parsing page {page}: {e}")
-        return []
+        # One bad page must not abort the rebuild of all the others
+        return book_key, None, f"{type(e).__name__}: {e}"
+
+
+def reparse(cache, store, processes=None, parser=None):
+    """
+    Rebuild every cached book page into `store` without any network access.
+
+    Pages are parsed on a pool of `processes` worker processes (default: one
+    per CPU). Pages that cannot be parsed, or whose URL is not cached with
+    them, are reported and skipped.
+
+    Returns:
+        tuple: (pages stored, pages skipped)
+    """
+    count = 0
+    skipped = 0
+    with parse_pool(processes) as executor:
+        results = executor.map(_reparse_one, repeat(cache.directory), cache.keys(), repeat(parser),
+                               chunksize=32)
+        for book_key, book_data, error in results:
+            if error is not None:
+                print(f"An error occurred in reparse while parsing the cached page of {book_key}: {error}")
+                skipped += 1
+                continue
+            store.put(book_key, book_data)
+            count += 1
+    return count, skipped
+
+
+def store_item(store, link, book_key=None, book_data_dict=None, book_changed=True, changed=None, checkpoint=None):
+    """
+    Record the outcome of one item of a crawl; shared by every engine.
+
+    A new or changed book is written to `store` (and `changed`), and the
+    `checkpoint` marks the item parsed, then stored, or failed.
+
+    Args:
+        link (str): The item page.
+        book_key (str): Its book key.
+        book_data_dict (dict): {book_key: book_data}, or None if the item
+            failed or was not modified.
+        book_changed (bool): False if the page was unchanged since it was
+            cached.
+    Returns:
+        dict: The book data if it was written, else None.
+    """
+    stored = None
+    if book_data_dict and (book_changed or book_key not in store):
+        stored = book_data_dict[book_key]
+        if checkpoint is not None:
+            checkpoint.mark(link, 'parsed')
+        with METRICS.timer('store.put.seconds'):
+            store.put(book_key, stored)
+        if changed is not None:
+            changed.put(book_key, stored)
+
+    if checkpoint is not None:
+        # Unchanged pages need nothing more; failures are in the failure queue
+        checkpoint.mark(link, 'stored' if book_data_dict or not book_changed else 'failed')
+    return stored
+
+
+def crawl(page, store, session, driver=None, workers=10, prefetch=2, on_progress=None, limiter=None,
+          parser=None, cache=None, conditional=False, changed=None, processes=None, batch_size=20,
+          retry=None, failures=None, checkpoint=None, shard=None):
+    """
+    Stream the catalogue starting at search page `page`.
+
+    Listing pages are fetched up to `prefetch` pages ahead of the scrape and
+    their item links are queued on a pool of `workers` threads as soon as
+    they arrive, so listing and item requests overlap. Pages can finish out
+    of order; `on_progress(last_page)` is only called when every page up to
+    and including `last_page` has all of its items scraped.
+
+    With `processes` set, the threads only download the item pages and the
+    HTML is parsed on a pool of that many worker processes, `batch_size`
+    pages per task, so parsing is not serialised by the GIL. With
+    `processes=0` each thread parses the page it fetched.
+
+    When a `limiter` is given, listing and item requests share its rate
+    and concurrency limits.
+
+    With a page `cache`, a book is only written to the store when its data
+    differs from the cached copy (or the store lacks it); `conditional`
+    additionally lets the server answer 304 for unchanged pages. Books that
+    were written are also put in the `changed` BookStore when given, so the
+    change set survives an interrupted run.
+
+    Requests are retried according to `retry`. Search pages and items that
+    still fail are recorded in the `failures` queue and skipped; the crawl
+    only gives up after `MAX_LISTING_FAILURES` search pages in a row failed.
+
+    With a `checkpoint`, the items a previous run left unfinished are queued
+    first and every item's progress is recorded; listed links that the
+    checkpoint already knows are skipped unless `conditional` (a recrawl).
+    `page=None` lists nothing and only finishes the outstanding items.
+
+    With a `shard`, only the search pages and items it owns are crawled;
+    see `shard.Shard`.
+    """
+    # A single Selenium driver cannot be shared between threads
+    listing_executor = ThreadPoolExecutor(max_workers=1 if driver is not None else prefetch)
+    item_executor = ThreadPoolExecutor(max_workers=workers)
+    parse_executor = parse_pool(processes) if processes != 0 else None
+    cache_dir = cache.directory if cache is not None else None
+    failures_path = failures.path if failures is not None else None
+
+    listing_futures = {}  # future -> page
+    item_futures = {}     # future -> (page the item was listed on, link)
+    parse_futures = {}    # future -> (page, link) of the items in the batch
+    batch = []            # fetched pages waiting for a parse task
+    batch_items = []
+    pending = {}          # page -> items not scraped yet
+    finished = set()      # pages fully scraped but not yet contiguous
+    completed = (page or 1) - 1
+    next_page = page or 1
+    last_page = None if page is not None else 0  # first page that returned no links
+    listing_failures = 0  # search pages in a row that could not be fetched
+    queued = set()        # links resumed from the checkpoint
+
+    def submit_item(listed_page, link):
+        if parse_executor is None:
+            future = item_executor.submit(_scrape_one, link, session, limiter, parser, cache,
+                                          conditional, retry, failures)
+        else:
+            future = item_executor.submit(_fetch_one, link, session, limiter, cache, conditional,
+                                          retry, failures)
+        item_futures[future] = (listed_page, link)
+
+    def item_done(listed_page, link, book_key=None, book_data_dict=None, book_changed=True):
+        store_item(store, link, book_key, book_data_dict, book_changed, changed=changed, checkpoint=checkpoint)
+
+        # Items resumed from the checkpoint do not belong to a listed page
+        if listed_page is None:
+            return
+        pending[listed_page] -= 1
+        if pending[listed_page] == 0:
+            del pending[listed_page]
+            finished.add(listed_page)
+
+    try:
+        if checkpoint is not None:
+            for link, _ in checkpoint.outstanding():
+                submit_item(None, link)
+                queued.add(link)
+            if queued:
+                print(f"Resuming {len(queued)} unfinished items from the checkpoint")
+
+        while True:
+            # Keep the listing stage ahead of the scraping stage, but bounded
+            while last_page is None and len(listing_futures) + len(pending) <= prefetch:
+                # Pages of other shards count as done
+                while shard is not None and not shard.owns_page(next_page):
+                    finished.add(next_page)
+                    next_page += 1
+                print(f"Scraping page {next_page}...")
+                future = listing_executor.submit(get_page_links, next_page, session=session,
+                                                 driver=driver, limiter=limiter, retry=retry,
+                                                 failures=failures)
+                listing_futures[future] = next_page
+                next_page += 1
+
+            # Hand fetched pages to the parsers once a batch is full, or
+            # straight away when nothing else is being fetched
+            if batch and (len(batch) >= batch_size or not item_futures):
+                future = parse_executor.submit(parse_batch, batch, parser, cache_dir, failures_path)
+                parse_futures[future] = batch_items
+                batch, batch_items = [], []
+
+            if not listing_futures and not item_futures and not parse_futures:
+                break
+
+            done, _ = wait(list(listing_futures) + list(item_futures) + list(parse_futures),
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future in listing_futures:
+                    listed_page = listing_futures.pop(future)
+                    links = future.result()
+                    if last_page is not None and listed_page > last_page:
+                        continue
+                    if links is False:
+                        print(f"No links found on page {listed_page}. Stopping the program.")
+                        last_page = listed_page
+                        if checkpoint is not None:
+                            checkpoint.set_listing_complete(listed_page)
+                        continue
+                    if not links:
+                        # Already queued as a failure; move on to the next pages
+                        listing_failures += 1
+                        if listing_failures >= MAX_LISTING_FAILURES:
+                            print(f"{listing_failures} search pages in a row failed. Stopping the program.")
+                            last_page = listed_page
+                        else:
+                            finished.add(listed_page)
+                        continue
+                    listing_failures = 0
+
+                    if shard is not None:
+                        links = [link for link in links if shard.owns_link(link)]
+                    if checkpoint is not None:
+                        # Items already known were scraped, failed or are resumed above
+                        links = [link for link in checkpoint.discover(listed_page, links, include_known=conditional)
+                                 if link not in queued]
+                    if not links:
+                        finished.add(listed_page)
+                        continue
+
+                    pending[listed_page] = len(links)
+                    for link in links:
+                        submit_item(listed_page, link)
+
+                elif future in item_futures:
+                    listed_page, link = item_futures.pop(future)
+                    if parse_executor is None:
+                        item_done(listed_page, link, *future.result())
+                        continue
+
+                    url, page_source, headers, previous, page_changed = future.result()
+                    if page_source is None:
+                        # Failed, or not modified since the cached copy
+                        item_done(listed_page, link, book_changed=page_changed)
+                    else:
+                        if checkpoint is not None:
+                            checkpoint.mark(link, 'fetched')
+                        batch.append((url, page_source, headers, previous))
+                        batch_items.append((listed_page, link))
+
+                else:
+                    results, snapshot = future.result()
+                    METRICS.merge(snapshot)
+                    for (listed_page, link), result in zip(parse_futures.pop(future), results):
+                        item_done(listed_page, link, *result)
+
+            METRICS.gauge('queue.listing_pages', len(listing_futures))
+            METRICS.gauge('queue.item_fetches', len(item_futures))
+            METRICS.gauge('queue.parse_batches', len(parse_futures))
+            METRICS.gauge('queue.batch', len(batch))
+            METRICS.gauge('pages.in_progress', len(pending))
+            if limiter is not None:
+                for name, value in limiter.limits().items():
+                    METRICS.gauge(f'limiter.{name}', value)
+
+            # Advance the checkpoint over the contiguous run of finished pages
+            advanced = False
+            while completed + 1 in finished:
+                finished.remove(completed + 1)
+                completed += 1
+                advanced = True
+
+            if advanced and on_progress:
+                on_progress(completed)
+
     finally:
-        driver.quit()
+        listing_executor.shutdown(cancel_futures=True)
+        item_executor.shutdown(cancel_futures=True)
+        if parse_executor is not None:
+            parse_executor.shutdown(cancel_futures=True)
+
+    return completed
+
+
+def retry_failed(store, failures, session, workers=10, driver=None, limiter=None, parser=None, cache=None,
+                 retry=None, checkpoint=None, changed=None):
+    """
+    Retry the search pages and items in the `failures` queue on their own.
+
+    Items that now scrape are written to `store` (and `changed`) and removed
+    from the queue (and marked stored in the `checkpoint`), as are search
+    pages that could be listed again.
+
+    Returns:
+        tuple: (items recovered, items tried)
+    """
+    links = []
+    for row in failures.items('listing'):
+        page_links = get_page_links(row['detail']['page'], session=session, driver=driver, limiter=limiter,
+                                    retry=retry, failures=failures)
+        if page_links is not False and not page_links:
+            continue
+        # Listed again, or the page no longer exists
+        failures.remove('listing', row['target'])
+        if page_links and checkpoint is not None:
+            checkpoint.discover(row['detail']['page'], page_links)
+        links.extend(page_links or [])
+
+    links.extend(row['target'] for row in failures.items('item'))
+    links = list(dict.fromkeys(links))
+
+    recovered = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_scrape_one, links, repeat(session), repeat(limiter), repeat(parser), repeat(cache),
+                               repeat(False), repeat(retry), repeat(failures))
+        for link, (book_key, book_data_dict, _) in zip(links, results):
+            if book_data_dict:
+                store_item(store, link, book_key, book_data_dict, changed=changed, checkpoint=checkpoint)
+                failures.remove('item', link)
+                recovered += 1
+    return recovered, len(links)
+
+
+def main(use_selenium=False, workers=10, prefetch=2, max_rate=20.0, parser=None,
+         cache_dir='cache/pages', reparse_only=False, processes=None, incremental=False, download=False,
+         metrics_interval=60.0, metrics_file='metrics.json', retries=4, retry_failed_only=False,
+         engine='threads', shard=None):
+    if shard is not None:
+        # All the files below are the shard's own; shard.py merges them
+        shard.enter()
+
+    cache = PageCache(cache_dir) if cache_dir else None
+
+    if engine == 'async' and use_selenium:
+        print("The async engine lists search pages over HTTP only; drop --selenium or use --engine threads.")
+        return
+
+    if incremental and cache is None:
+        print("An incremental recrawl needs the page cache (--cache-dir).")
+        return
+
+    if reparse_only and cache is None:
+        print("Re-parsing needs the page cache (--cache-dir).")
+        return
 
+    if reparse_only:
+        # Offline: rebuild books.jsonl/books.json from the cached pages
+        with open_store('books.jsonl') as store:
+            count, skipped = reparse(cache, store, processes=processes, parser=parser)
+            store.compact()
+            store.export('books.json')
+        print(f"Re-parsed {count} cached pages" + (f", skipped {skipped} that could not be parsed" if skipped else ""))
+        return
 
+    reporter = Reporter(interval=metrics_interval, path=metrics_file)
+    reporter.start()
+
+    # One browser for the whole run, and only when explicitly requested
+    driver = create_driver() if use_selenium else None
+    session = build_session(pool_size=workers + prefetch)
+    # The worker count is only the ceiling; the limiter finds the actual pace
+    limiter = AdaptiveLimiter(max_concurrency=workers + prefetch, max_rate=max_rate)
+    # Transient errors are retried in place; what still fails is queued for later
+    retry = RetryPolicy(attempts=retries)
+    failures = FailureQueue('failures.db')
+    # Per-item progress; replaces completed_pages.txt, which is imported once
+    checkpoint = open_checkpoint('checkpoint.db')
+    # The books stored since the last targeted download. Kept on disk as they
+    # are stored, so an interrupted run's books are downloaded by the next one
+    changed = BookStore('changed_books.jsonl')
 
-def main():
     try:
-        # Initialize page from file or start at 1
-        try:
-            with open('completed_pages.txt', 'r') as f:
-                page = int(f.read().strip()) + 1  # Start from next page
-        except FileNotFoundError:
+        if retry_failed_only:
+            with open_store('books.jsonl') as store:
+                recovered, tried = retry_failed(store, failures, session, workers=workers, driver=driver,
+                                                limiter=limiter, parser=parser, cache=cache, retry=retry,
+                                                checkpoint=checkpoint, changed=changed)
+            store.export('books.json')
+            changed.export('changed_books.json')
+            print(f"Recovered {recovered} of {tried} failed items, {len(failures)} failures left in failures.db")
+            return
+
+        if incremental:
+            # A recrawl revisits the whole catalogue, asking only for changed pages
+            checkpoint.reset_listing()
             page = 1
+        elif checkpoint.listing_complete:
+            # Only finish the items an interrupted run left behind
+            page = None
+        else:
+            page = checkpoint.next_page(shard.owns_page if shard is not None else None)
+
+        # Books are appended to the store as soon as they are scraped
+        store = open_store('books.jsonl')
+
+        def save(completed_page):
+            # The checkpoint records progress as it happens; just report it
+            checkpoint.commit()
+            print(f"Saved and Scraped {len(store)} books so far ({len(changed)} new or changed, pages up to {completed_page} done), limits: {limiter.limits()}")
 
-        # Load existing data
         try:
-            with open('books.json', 'r') as json_file:
-                all_books_dict = json.load(json_file)
-        except FileNotFoundError:
-            all_books_dict = {}
+            if engine == 'async':
+                # Listing, items and (with --download) PDFs on one event loop
+                import asyncio
+                import aiocrawl
+                asyncio.run(aiocrawl.crawl(page, store, workers=workers, prefetch=prefetch, on_progress=save,
+                                           limiter=limiter, parser=parser, cache=cache, conditional=incremental,
+                                           changed=changed, processes=processes, retry=retry,
+                                           failures=failures, checkpoint=checkpoint, shard=shard,
+                                           download=download))
+            else:
+                crawl(page, store, session, driver=driver, workers=workers,
+                      prefetch=prefetch, on_progress=save, limiter=limiter, parser=parser, cache=cache,
+                      conditional=incremental, changed=changed, processes=processes, retry=retry,
+                      failures=failures, checkpoint=checkpoint, shard=shard)
+        finally:
+            store.close()
 
-        while True:
-            print(f"Scraping page {page}...")
-            links = get_page_links(page)
-            if not links:
-                print(f"No links found on page {page}. Stopping the program.")
-                break
-            
-            for link in links:
-                scraper = BookScraper(url = link)
-                book_data_dict = scraper.scrape()
-
-                all_books_dict[scraper.book_key] = book_data_dict[scraper.book_key]
-
-            # Save progress
-            with open('completed_pages.txt', 'w') as f:
-                f.write(str(page))
-                
-            # Save data
-            with open('books.json', 'w') as json_file:
-                json.dump(all_books_dict, json_file, indent=4, ensure_ascii=False)
-                
-            print(f"Saved and Scraped {len(all_books_dict)} books so far")
-            page += 1 
+        # Refresh the books.json snapshot that pdfs.main reads
+        with METRICS.timer('store.export.seconds'):
+            store.export('books.json')
+
+        # The new and changed books alone, for a targeted pdfs.main run
+        changed.export('changed_books.json')
+        print(f"{len(changed)} books new or changed since the last download written to changed_books.json")
+        if len(failures):
+            print(f"{len(failures)} failed search pages or items in failures.db, retry them with --retry-failed")
+
+        if download and len(changed):
+            # After --engine async too: the ledger skips what the crawl fetched,
+            # and files an interrupted run never got to are downloaded now
+            import pdfs
+            pdfs.main(books_path='changed_books.json')
+            changed.clear()
 
     except Exception as e:
         print(f"An error occurred in main.py main: {e}")
+    finally:
+        if driver is not None:
+            driver.quit()
+        checkpoint.close()
+        changed.close()
+        failures.close()
+        reporter.stop()
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Scrape the Kallipos repository catalogue.")
+    parser.add_argument('--selenium', action='store_true',
+                        help="list search pages with a headless Chrome instead of plain HTTP")
+    parser.add_argument('--workers', type=int, default=10,
+                        help="number of item pages fetched concurrently (default: 10)")
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help="number of search pages listed ahead of the scrape (default: 2)")
+    parser.add_argument('--max-rate', type=float, default=20.0,
+                        help="upper bound of requests per second (default: 20)")
+    parser.add_argument('--parser', default=None,
+                        help="BeautifulSoup backend for item pages, e.g. lxml or html.parser (default: fastest installed)")
+    parser.add_argument('--cache-dir', default='cache/pages',
+                        help="where fetched item pages are kept, empty to disable (default: cache/pages)")
+    parser.add_argument('--reparse', action='store_true',
+                        help="rebuild the books from the page cache instead of crawling")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="processes parsing item pages, 0 to parse in the fetch threads (default: one per CPU)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="recrawl every page with conditional requests and store only changed books")
+    parser.add_argument('--download', action='store_true',
+                        help="afterwards, download the files of the new and changed books")
+    parser.add_argument('--metrics-interval', type=float, default=60.0,
+                        help="seconds between metric summaries (default: 60)")
+    parser.add_argument('--metrics-file', default='metrics.json',
+                        help="where the metrics are written as JSON (default: metrics.json)")
+    parser.add_argument('--retries', type=int, default=4,
+                        help="attempts per request before it counts as failed (default: 4)")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="only retry the search pages and items recorded in failures.db")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help="thread pools, or one asyncio event loop (needs aiohttp) (default: threads)")
+    parser.add_argument('--shard', default=None, metavar='I/N',
+                        help="crawl only shard I of N, in shards/I-of-N/ (merge with shard.py)")
+    parser.add_argument('--shard-by', choices=['page', 'handle'], default=None,
+                        help="split the shards by search page or by item handle hash "
+                             "(default: as the shard ran before, else page)")
+    parser.add_argument('--shard-block', type=int, default=None,
+                        help="consecutive search pages per slice with --shard-by page "
+                             "(default: as the shard ran before, else 1)")
+    args = parser.parse_args(argv)
+
+    shard = None
+    if args.shard:
+        try:
+            shard = Shard.parse(args.shard, by=args.shard_by, block=args.shard_block)
+        except ValueError as e:
+            parser.error(str(e))
 
+    main(use_selenium=args.selenium, workers=args.workers, prefetch=args.prefetch, max_rate=args.max_rate,
+         parser=args.parser, cache_dir=args.cache_dir, reparse_only=args.reparse, processes=args.processes,
+         incremental=args.incremental, download=args.download, metrics_interval=args.metrics_interval,
+         metrics_file=args.metrics_file, retries=args.retries, retry_failed_only=args.retry_failed,
+         engine=args.engine, shard=shard)
 
 
 if __name__ == "__main__":
-    main()
-    
+    cli()
@@ -0,0 +1,213 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+# Histogram buckets grow by 2**(1/4), i.e. quantiles are accurate to ~19%
+BUCKET_BASE = 2 ** 0.25
+
+
+class Histogram:
+    """Count, sum, min, max and log-spaced buckets of observed values."""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = defaultdict(int)  # bucket index -> count
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        index = math.ceil(math.log(value, BUCKET_BASE)) if value > 0 else None
+        self.buckets[index] += 1
+
+    def quantile(self, q):
+        """Estimate the q-quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets, key=lambda i: -math.inf if i is None else i):
+            seen += self.buckets[index]
+            if seen >= rank:
+                value = 0.0 if index is None else BUCKET_BASE ** index
+                return min(value, self.max)
+        return self.max
+
+    def merge(self, data):
+        """Add the values of a histogram exported with `to_dict`."""
+        self.count += data['count']
+        self.total += data['sum']
+        if data['min'] is not None:
+            self.min = data['min'] if self.min is None else min(self.min, data['min'])
+            self.max = data['max'] if self.max is None else max(self.max, data['max'])
+        for index, count in data['buckets']:
+            self.buckets[index] += count
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': sorted(self.buckets.items(), key=lambda item: -math.inf if item[0] is None else item[0]),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and histograms.
+
+    Names are dotted paths such as `fetch.item.seconds` or
+    `http.status.404`. `snapshot()` returns everything as plain data, which
+    can be written to a file or merged into another registry (the parser
+    processes send theirs back this way).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters = defaultdict(float)
+            self.gauges = {}
+            self.histograms = defaultdict(Histogram)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Record the wall time of the block in the histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Counters, gauges and histogram summaries as plain data.
+        """
+        with self._lock:
+            return {
+                'started': self.started,
+                'elapsed': time.time() - self.started,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def merge(self, snapshot):
+        """Add the counters and histograms of another registry's snapshot."""
+        with self._lock:
+            for name, value in snapshot['counters'].items():
+                self.counters[name] += value
+            for name, data in snapshot['histograms'].items():
+                self.histograms[name].merge(data)
+
+    def summary(self):
+        """
+        Returns:
+            str: Human-readable multi-line summary of the current values.
+        """
+        snapshot = self.snapshot()
+        lines = [f"--- metrics after {snapshot['elapsed']:.0f}s ---"]
+
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"{name}: {value:g}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"{name}: {value:g} (current)")
+        for name, h in sorted(snapshot['histograms'].items()):
+            lines.append(
+                f"{name}: n={h['count']} mean={h['mean']:.4g} p50={h['p50']:.4g} "
+                f"p99={h['p99']:.4g} max={h['max']:.4g}"
+            )
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Write the snapshot as JSON, replacing `path` atomically."""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+# Registry shared by all modules of the process
+METRICS = Metrics()
+
+
+def timed(name):
+    """Decorator recording the run time of every call in the histogram `name`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Reporter:
+    """
+    Background thread that prints `METRICS.summary()` and writes the JSON
+    snapshot every `interval` seconds, and once more when stopped.
+    """
+
+    def __init__(self, interval=60.0, path='metrics.json', metrics=METRICS):
+        self.interval = interval
+        self.path = path
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-reporter', daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.report()
+
+    def report(self):
+        print(self.metrics.summary())
+        if self.path:
+            self.metrics.write(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
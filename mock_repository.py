@@ -0,0 +1,420 @@
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+# Same layout as the DSpace item pages BookScraper reads
+ITEM_TEMPLATE = """<html><head><title>{title}</title></head><body>
+<div class="itemMetaSection">
+<table class="table itemDisplayTable">
+<tr><td class="metadataFieldLabel itemTitle">{title}</td></tr>
+<tr><td class="metadataFieldLabel">Title:</td><td class="metadataFieldValue">{title}</td></tr>
+<tr><td class="metadataFieldLabel">Authors:</td><td class="metadataFieldValue"><a href="/browse?type=author&amp;value=a{item}">Συγγραφέας {item}, Α.</a><br/><a href="/browse?type=author&amp;value=b{item}">Συγγραφέας {item}, Β.</a></td></tr>
+<tr><td class="metadataFieldLabel">Subject:</td><td class="metadataFieldValue"><a href="/s{subject}">ΕΠΙΣΤΗΜΕΣ &gt; Θεματική {subject}</a><br/><a href="/s{subject}a">ΕΠΙΣΤΗΜΕΣ &gt; Θεματική {subject} &gt; Ενότητα {item}</a></td></tr>
+<tr><td class="metadataFieldLabel">Keywords:</td><td class="metadataFieldValue"><div class="readmore">Λέξη {subject}<br/>Όρος {item}<br/>Έννοια {item}</div></td></tr>
+<tr><td class="metadataFieldLabel">Abstract:</td><td class="metadataFieldValue"><div class="readmore">{abstract}</div></td></tr>
+<tr><td class="metadataFieldLabel">Publisher:</td><td class="metadataFieldValue">Κάλλιπος, Ανοικτές Ακαδημαϊκές Εκδόσεις</td></tr>
+<tr><td class="metadataFieldLabel">License:</td><td class="metadataFieldValue"><a href="http://creativecommons.org/licenses/by-nc-sa/4.0/">CC BY-NC-SA 4.0</a></td></tr>
+<tr><td class="metadataFieldLabel">ISBN:</td><td class="metadataFieldValue">978-618-5726-{item:02d}-0</td></tr>
+<tr class="analyticsTr"><td class="metadataFieldLabel">Usage statistics:</td><td class="metadataFieldValue"><div class="bookAnalytics"><div>Views: {views}</div><div>Downloads: {downloads}</div></div></td></tr>
+</table>
+</div>
+<div class="fileRow"><span class="fileType">Table of Contents - Adobe PDF</span><form method="post" action="/retrieve/{item}/toc.pdf"></form></div>
+<div class="fileRow"><span class="fileType">Book - Adobe PDF</span><form method="post" action="/retrieve/{item}/book.pdf"></form></div>
+</body></html>
+"""
+
+
+def item_page(item):
+    """
+    Returns:
+        str: A synthetic item page for handle 11419/<item>.
+    """
+    sentence = f"Το σύγγραμμα {item} καλύπτει τη θεματική του με παραδείγματα και ασκήσεις. "
+    return ITEM_TEMPLATE.format(
+        item=item,
+        title=f"Σύγγραμμα {item}",
+        subject=item % 20,
+        abstract=escape(sentence * 20) + "<br/>" + escape(sentence * 10),
+        views=item * 7 % 5000,
+        downloads=item * 3 % 2000,
+    )
+
+
+# Item n was last modified this many minutes after the start of 2020,
+# unless `MockRepository.touch` moved it
+BASE_DATESTAMP = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+
+OAI_RECORD_TEMPLATE = """<record><header><identifier>oai:repository.kallipos.gr:11419/{item}</identifier><datestamp>{datestamp}</datestamp><setSpec>com_11419_1</setSpec></header>
+<metadata><metadata xmlns="http://www.lyncode.com/xoai">
+<element name="dc">
+<element name="title"><element name="el"><field name="value">{title}</field></element></element>
+<element name="contributor"><element name="author"><element name="none"><field name="value">Συγγραφέας {item}, Α.</field><field name="value">Συγγραφέας {item}, Β.</field></element></element></element>
+<element name="subject"><element name="el"><field name="value">Λέξη {subject}</field><field name="value">Όρος {item}</field><field name="value">Έννοια {item}</field></element>
+<element name="classification"><element name="el"><field name="value">ΕΠΙΣΤΗΜΕΣ::Θεματική {subject}</field><field name="value">ΕΠΙΣΤΗΜΕΣ::Θεματική {subject}::Ενότητα {item}</field></element></element></element>
+<element name="description"><element name="abstract"><element name="el"><field name="value">{abstract}</field></element></element></element>
+<element name="publisher"><element name="el"><field name="value">Κάλλιπος, Ανοικτές Ακαδημαϊκές Εκδόσεις</field></element></element>
+<element name="rights"><element name="el"><field name="value">CC BY-NC-SA 4.0</field></element><element name="uri"><element name="none"><field name="value">http://creativecommons.org/licenses/by-nc-sa/4.0/</field></element></element></element>
+<element name="identifier"><element name="isbn"><element name="none"><field name="value">978-618-5726-{item:02d}-0</field></element></element><element name="uri"><element name="none"><field name="value">http://hdl.handle.net/11419/{item}</field></element></element></element>
+</element>
+<element name="bundles"><element name="bundle"><field name="name">ORIGINAL</field><element name="bitstreams">
+<element name="bitstream"><field name="name">toc.pdf</field><field name="description">Table of Contents</field><field name="format">application/pdf</field><field name="url">{base_url}retrieve/{item}/toc.pdf</field></element>
+<element name="bitstream"><field name="name">book.pdf</field><field name="description">Book</field><field name="format">application/pdf</field><field name="url">{base_url}retrieve/{item}/book.pdf</field></element>
+</element></element></element>
+<element name="others"><field name="handle">11419/{item}</field></element>
+</metadata></metadata></record>
+"""
+
+
+DELETED_RECORD_TEMPLATE = """<record><header status="deleted"><identifier>oai:repository.kallipos.gr:11419/{item}</identifier><datestamp>{datestamp}</datestamp><setSpec>com_11419_1</setSpec></header></record>
+"""
+
+
+def oai_record(item, datestamp, base_url='/', deleted=False):
+    """
+    Returns:
+        str: The xoai record of handle 11419/<item>, with the same data as
+        `item_page`, or just its header marked deleted.
+    """
+    if deleted:
+        return DELETED_RECORD_TEMPLATE.format(item=item, datestamp=_utc(datestamp))
+    sentence = f"Το σύγγραμμα {item} καλύπτει τη θεματική του με παραδείγματα και ασκήσεις. "
+    return OAI_RECORD_TEMPLATE.format(
+        item=item,
+        datestamp=_utc(datestamp),
+        title=f"Σύγγραμμα {item}",
+        subject=item % 20,
+        abstract=escape(sentence * 30),
+        base_url=escape(base_url),
+    )
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _parse_utc(value):
+    """Parse an OAI-PMH date, YYYY-MM-DD or YYYY-MM-DDThh:mm:ssZ."""
+    layout = '%Y-%m-%d' if len(value) == 10 else '%Y-%m-%dT%H:%M:%SZ'
+    return datetime.strptime(value, layout).replace(tzinfo=timezone.utc).timestamp()
+
+
+def load_pages(directory):
+    """
+    Read recorded item pages, e.g. a `PageCache` directory.
+
+    Returns:
+        list: The HTML of every `*.html` and `*.html.gz` file, sorted by name.
+    """
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith('.html.gz'):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                pages.append(f.read())
+        elif name.endswith('.html'):
+            with open(path, 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+    return pages
+
+
+def _search_page(items):
+    rows = "".join(
+        f'<tr><td class="itemListValt2"><a href="/handle/11419/{item}">Σύγγραμμα {item}</a></td></tr>'
+        for item in items
+    )
+    return f'<html><body><table class="table">{rows}</table></body></html>'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        repository = self.server.repository
+        repository.delay()
+        if repository.fail():
+            self._send(503, b'Service unavailable')
+            return
+        url = urlsplit(self.path)
+
+        if url.path == '/oai/request':
+            body = repository.oai(parse_qs(url.query)).encode('utf-8')
+            self._send(200, body, {'Content-Type': 'text/xml; charset=utf-8'})
+            return
+
+        if url.path == '/simple-search':
+            query = parse_qs(url.query)
+            start = int(query.get('start', ['0'])[0])
+            rpp = int(query.get('rpp', ['100'])[0])
+            items = range(start + 1, min(start + rpp, repository.items) + 1)
+            self._send(200, _search_page(items).encode('utf-8'))
+            return
+
+        match = re.fullmatch(r'/handle/11419/(\d+)', url.path)
+        if match and 1 <= int(match.group(1)) <= repository.items:
+            body = repository.page(int(match.group(1))).encode('utf-8')
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', {'ETag': etag})
+            else:
+                self._send(200, body, {'ETag': etag})
+            return
+
+        self._send(404, b'Not found')
+
+    def do_POST(self):
+        # Bitstreams are fetched with a form POST, as on the real site
+        repository = self.server.repository
+        repository.delay()
+        if repository.fail():
+            self._send(503, b'Service unavailable')
+            return
+        if not self.path.startswith('/retrieve/'):
+            self._send(404, b'Not found')
+            return
+
+        body = repository.pdf(self.path)
+        etag = '"%s"' % hashlib.md5(self.path.encode('utf-8')).hexdigest()
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Content-Type': 'application/pdf'}
+
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and repository.accept_ranges and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            if start >= len(body):
+                self._send(416, b'', {'Content-Range': f'bytes */{len(body)}'})
+                return
+            headers['Content-Range'] = f'bytes {start}-{len(body) - 1}/{len(body)}'
+            self._send(206, body[start:], headers)
+        else:
+            self._send(200, body, headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        headers = headers or {}
+        if status == 200 and self.command == 'GET' and 'Content-Type' not in headers:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients closing idle keep-alive connections are not errors
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockRepository:
+    """
+    Local stand-in for repository.kallipos.gr.
+
+    Serves `items` books: search pages at `/simple-search?start=N` (100
+    links each, as on the site), item pages at `/handle/11419/<n>` and
+    PDFs of `pdf_size` bytes for the download forms. Item pages are the
+    recorded pages in `pages_dir` (cycled) or synthetic ones. Every
+    response waits `latency` seconds, plus up to `jitter` more, before it
+    is sent, and a share `error_rate` of them are 503s.
+
+    The same books are also served in bulk by a DSpace-style OAI-PMH
+    endpoint at `/oai/request` (ListRecords in the xoai format, `oai_page_size`
+    records per response, resumption tokens and from/until filters).
+    `touch` marks books as modified now, `delete` withdraws them.
+    """
+
+    def __init__(self, items=1000, pages_dir=None, pdf_size=1024 * 1024, latency=0.0, jitter=0.0,
+                 error_rate=0.0, host='127.0.0.1', port=0, oai_page_size=100):
+        self.items = items
+        self.oai_page_size = oai_page_size
+        self.modified = {}  # item -> timestamp of its last change, see `touch`
+        self.deleted = set()
+        self.pdf_size = pdf_size
+        self.accept_ranges = True  # False answers Range requests with the whole file
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.pages = load_pages(pages_dir) if pages_dir else None
+
+        # One shared block of filler; each PDF only differs in its header
+        self._filler = os.urandom(min(pdf_size, 1024 * 1024))
+
+        self.server = _Server((host, port), _Handler)
+        self.server.repository = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def search_url(self):
+        """A `main.SEARCH_URL` that points at this server."""
+        return self.url + 'simple-search?query=&rpp=100&start={start}'
+
+    @property
+    def oai_url(self):
+        """An `oai.OAI_URL` that points at this server."""
+        return self.url + 'oai/request'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mock-repository', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def page(self, item):
+        if self.pages:
+            return self.pages[(item - 1) % len(self.pages)]
+        return item_page(item)
+
+    def touch(self, *items):
+        """Mark the given books as modified now, for incremental harvests."""
+        now = time.time()
+        for item in items:
+            self.modified[item] = now
+
+    def delete(self, *items):
+        """Withdraw the given books: OAI-PMH reports them as deleted records."""
+        self.deleted.update(items)
+        self.touch(*items)
+
+    def datestamp(self, item):
+        return self.modified.get(item, BASE_DATESTAMP + item * 60)
+
+    def oai(self, query):
+        """
+        Answer an OAI-PMH request.
+
+        Returns:
+            str: The XML response to the `query` parameters.
+        """
+        params = {name: values[0] for name, values in query.items()}
+        verb = params.get('verb')
+        response_date = _utc(time.time())
+
+        def respond(body, request=''):
+            return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+                    f'<responseDate>{response_date}</responseDate>'
+                    f'<request verb="{escape(verb or "")}"{request}>{escape(self.oai_url)}</request>'
+                    f'{body}</OAI-PMH>')
+
+        def error(code, message):
+            return respond(f'<error code="{code}">{escape(message)}</error>')
+
+        if verb == 'Identify':
+            return respond('<Identify><repositoryName>Kallipos</repositoryName>'
+                           f'<baseURL>{escape(self.oai_url)}</baseURL><protocolVersion>2.0</protocolVersion>'
+                           f'<earliestDatestamp>{_utc(BASE_DATESTAMP)}</earliestDatestamp>'
+                           '<deletedRecord>transient</deletedRecord>'
+                           '<granularity>YYYY-MM-DDThh:mm:ssZ</granularity></Identify>')
+        if verb != 'ListRecords':
+            return error('badVerb', f"Unsupported verb {verb!r}")
+
+        if 'resumptionToken' in params:
+            try:
+                offset, since, until = params['resumptionToken'].split('|')
+                offset = int(offset)
+            except ValueError:
+                return error('badResumptionToken', "Unknown resumption token")
+        else:
+            if params.get('metadataPrefix') != 'xoai':
+                return error('cannotDisseminateFormat', "Only xoai is served")
+            offset, since, until = 0, params.get('from', ''), params.get('until', '')
+
+        try:
+            low = _parse_utc(since) if since else float('-inf')
+            high = _parse_utc(until) if until else float('inf')
+        except ValueError:
+            return error('badArgument', "Dates are YYYY-MM-DD or YYYY-MM-DDThh:mm:ssZ")
+        if len(until) == 10:
+            high += 24 * 3600 - 1  # A day includes all of its seconds
+
+        matching = [item for item in range(1, self.items + 1) if low <= self.datestamp(item) <= high]
+        if not matching:
+            return error('noRecordsMatch', "No records match the request")
+
+        page = matching[offset:offset + self.oai_page_size]
+        records = "".join(oai_record(item, self.datestamp(item), self.url, deleted=item in self.deleted)
+                          for item in page)
+        token = ''
+        if offset + self.oai_page_size < len(matching):
+            token = f'{offset + self.oai_page_size}|{since}|{until}'
+        resumption = (f'<resumptionToken completeListSize="{len(matching)}" cursor="{offset}">'
+                      f'{escape(token)}</resumptionToken>')
+        return respond(f'<ListRecords>{records}{resumption}</ListRecords>', ' metadataPrefix="xoai"')
+
+    def pdf(self, path):
+        header = f"%PDF-1.4\n% {path}\n".encode('utf-8')
+        size = max(self.pdf_size, len(header))
+        filler = self._filler * (size // len(self._filler) + 1) if self._filler else b''
+        return (header + filler)[:size]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the Kallipos repository.")
+    parser.add_argument('--port', type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument('--items', type=int, default=1000, help="number of books served (default: 1000)")
+    parser.add_argument('--pages', default=None,
+                        help="directory of recorded item pages (*.html or *.html.gz) to serve")
+    parser.add_argument('--pdf-size', type=int, default=1024 * 1024,
+                        help="size of every PDF in bytes (default: 1 MiB)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds every response is delayed (default: 0)")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="up to this many extra seconds of delay per response (default: 0)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="share of responses answered with a 503 (default: 0)")
+    parser.add_argument('--oai-page-size', type=int, default=100,
+                        help="records per OAI-PMH ListRecords response (default: 100)")
+    args = parser.parse_args()
+
+    repository = MockRepository(items=args.items, pages_dir=args.pages, pdf_size=args.pdf_size,
+                                latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                port=args.port, oai_page_size=args.oai_page_size)
+    print(f"Serving {args.items} books on {repository.url}")
+    print(f"Point main.SEARCH_URL at {repository.search_url}, oai.OAI_URL at {repository.oai_url} "
+          f"and pdfs.BASE_URL at {repository.url}")
+    try:
+        repository.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,298 @@
+import argparse
+import xml.etree.ElementTree as ET
+from urllib.parse import quote, urlsplit
+
+import urllib3
+
+from sessions import build_session
+from storage import BookStore, open_store
+from ratelimit import AdaptiveLimiter, limited
+from metrics import METRICS, Reporter
+from retry import DEFAULT_RETRY, RetryPolicy, HTTPStatusError
+from checkpoint import open_checkpoint
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+# DSpace serves OAI-PMH next to the web interface
+OAI_URL = 'https://repository.kallipos.gr/oai/request'
+
+# DSpace's own format: all metadata fields plus the bundles and bitstreams,
+# which oai_dc leaves out
+METADATA_PREFIX = 'xoai'
+
+OAI = '{http://www.openarchives.org/OAI/2.0/}'
+XOAI = '{http://www.lyncode.com/xoai}'
+
+# Metadata fields copied as text, under the label the item page shows them with
+TEXT_FIELDS = {
+    'dc.title': 'Title',
+    'dc.description.abstract': 'Abstract',
+    'dc.publisher': 'Publisher',
+    'dc.identifier.isbn': 'ISBN',
+}
+
+# How the item page names the file formats next to a file's description
+FORMATS = {
+    'application/pdf': 'Adobe PDF',
+    'application/epub+zip': 'EPUB',
+}
+
+
+class OAIError(Exception):
+    """An OAI-PMH error response, e.g. badResumptionToken."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+def _fetch(session, url, params, limiter=None):
+    with limited(limiter) as request:
+        with METRICS.timer('fetch.oai.seconds'):
+            response = session.get(url, params=params, verify=False, timeout=120)
+        request.observe(response.status_code)
+
+    METRICS.incr(f'http.status.{response.status_code}')
+    METRICS.incr('bytes.oai', len(response.content))
+    if response.status_code != 200:
+        raise HTTPStatusError.from_response(response)
+
+    root = ET.fromstring(response.content)
+    error = root.find(f'{OAI}error')
+    # An empty result is an error in OAI-PMH; the caller just stops
+    if error is not None and error.get('code') != 'noRecordsMatch':
+        raise OAIError(error.get('code'), (error.text or '').strip())
+    return root
+
+
+def _field_values(element):
+    """
+    Collect the metadata values under an xoai `dc` element.
+
+    Returns:
+        dict: Values per field name, e.g. {"dc.contributor.author": [...]}.
+        The innermost element level is the language and is left out.
+    """
+    fields = {}
+
+    def walk(element, path):
+        values = [(field.text or '').strip() for field in element.findall(f'{XOAI}field')
+                  if field.get('name') == 'value']
+        if values:
+            fields.setdefault('.'.join(path[:-1]), []).extend(value for value in values if value)
+        for child in element.findall(f'{XOAI}element'):
+            walk(child, path + [child.get('name')])
+
+    walk(element, ['dc'])
+    return fields
+
+
+def _bitstream_links(metadata):
+    """
+    Returns:
+        dict: {file type: path} of the files in the ORIGINAL bundle, keyed
+        like the file rows of the item page, e.g. "Book - Adobe PDF".
+    """
+    links = {}
+    for bundle in metadata.iterfind(f"{XOAI}element[@name='bundles']/{XOAI}element[@name='bundle']"):
+        fields = {field.get('name'): field.text for field in bundle.findall(f'{XOAI}field')}
+        if fields.get('name') != 'ORIGINAL':
+            continue
+        for bitstream in bundle.iterfind(f"{XOAI}element[@name='bitstreams']/{XOAI}element[@name='bitstream']"):
+            fields = {field.get('name'): (field.text or '').strip() for field in bitstream.findall(f'{XOAI}field')}
+            if not fields.get('url'):
+                continue
+            description = fields.get('description') or fields.get('name', '')
+            file_type = f"{description} - {FORMATS.get(fields.get('format'), fields.get('format', ''))}"
+            # BookScraper keeps the path; pdfs.py joins it with BASE_URL
+            links[file_type] = urlsplit(fields['url']).path
+    return links
+
+
+def record_to_book(record):
+    """
+    Map an xoai record to the book structure `BookScraper` produces.
+
+    Usage statistics are not part of the record, and author links point at
+    the author browse page of the name.
+
+    Returns:
+        tuple: (book_key, book_data), with book_data None for a deleted record.
+    """
+    header = record.find(f'{OAI}header')
+    # oai:repository.kallipos.gr:11419/123 -> 11419_123, as BookScraper names it
+    handle = header.findtext(f'{OAI}identifier').rsplit(':', 1)[-1]
+    book_key = "_".join(handle.split('/')[-2:])
+    if header.get('status') == 'deleted':
+        return book_key, None
+
+    book_data = {'links': {}, 'metadata': {}}
+    xoai = record.find(f'{OAI}metadata/{XOAI}metadata')
+    if xoai is None:
+        return book_key, book_data
+
+    dc = xoai.find(f"{XOAI}element[@name='dc']")
+    fields = _field_values(dc) if dc is not None else {}
+    metadata = book_data['metadata']
+
+    for name, label in TEXT_FIELDS.items():
+        values = fields.get(name)
+        if values:
+            metadata[label] = " ".join(values) if label == 'Abstract' else values[0] if len(values) == 1 else values
+
+    if fields.get('dc.subject.classification'):
+        # Hierarchical like "ΕΠΙΣΤΗΜΕΣ::Θεματική"; the item page shows the leaf
+        metadata['Subjects'] = [value.replace(" > ", "::").split("::")[-1].strip()
+                                for value in fields['dc.subject.classification']]
+    if fields.get('dc.subject'):
+        metadata['Keywords'] = fields['dc.subject']
+    if fields.get('dc.contributor.author'):
+        metadata['Authors'] = [{"text": name, "url": f"/browse?type=author&value={quote(name)}"}
+                               for name in fields['dc.contributor.author']]
+    if fields.get('dc.rights.uri'):
+        names = fields.get('dc.rights') or fields['dc.rights.uri']
+        metadata['License'] = [{"text": name, "url": uri} for name, uri in zip(names, fields['dc.rights.uri'])]
+
+    book_data['links'] = _bitstream_links(xoai)
+    return book_key, book_data
+
+
+def harvest(store, session=None, from_date=None, until=None, limiter=None, retry=None, changed=None):
+    """
+    Harvest the repository's records over OAI-PMH into `store`.
+
+    One ListRecords response carries a page of records (100 on DSpace),
+    and resumption tokens are followed to the end of the list, so the
+    whole catalogue costs a few dozen requests instead of one per book.
+    Books whose record was deleted are deleted from `store` (and `changed`).
+
+    Args:
+        store (BookStore): Where the books are written.
+        session (requests.Session, optional): Session the pages are fetched with.
+        from_date (str, optional): Only records changed since this OAI-PMH
+            date (YYYY-MM-DD or YYYY-MM-DDThh:mm:ssZ).
+        until (str, optional): Only records changed up to this date.
+        limiter (AdaptiveLimiter, optional): Throttle for the requests.
+        retry (RetryPolicy, optional): How transient failures are retried.
+        changed (BookStore, optional): Receives every harvested book.
+    Returns:
+        tuple: The number of books stored, and the responseDate of the
+        first response, from which the next incremental harvest can start.
+    """
+    session = session or build_session(pool_size=1)
+    retry = retry or DEFAULT_RETRY
+    params = {'verb': 'ListRecords', 'metadataPrefix': METADATA_PREFIX}
+    if from_date:
+        params['from'] = from_date
+    if until:
+        params['until'] = until
+
+    stored = 0
+    response_date = None
+    while True:
+        root = retry.call('oai', _fetch, session, OAI_URL, params, limiter)
+        response_date = response_date or root.findtext(f'{OAI}responseDate')
+        list_records = root.find(f'{OAI}ListRecords')
+        if list_records is None:
+            break  # noRecordsMatch
+
+        for record in list_records.findall(f'{OAI}record'):
+            book_key, book_data = record_to_book(record)
+            if book_data is None:
+                METRICS.incr('oai.deleted')
+                # Withdrawn from the repository: drop it, unless it was never stored
+                if book_key in store:
+                    store.delete(book_key)
+                if changed is not None and book_key in changed:
+                    changed.delete(book_key)
+                continue
+            with METRICS.timer('store.put.seconds'):
+                store.put(book_key, book_data)
+            if changed is not None:
+                changed.put(book_key, book_data)
+            stored += 1
+
+        token = list_records.find(f'{OAI}resumptionToken')
+        total = token.get('completeListSize') if token is not None else None
+        print(f"Harvested {stored} of {total or stored} records")
+        if token is None or not (token.text or '').strip():
+            break
+        params = {'verb': 'ListRecords', 'resumptionToken': token.text.strip()}
+
+    return stored, response_date
+
+
+def main(from_date=None, until=None, full=False, download=False, max_rate=5.0, retries=4,
+         metrics_interval=60.0, metrics_file='metrics.json'):
+    reporter = Reporter(interval=metrics_interval, path=metrics_file)
+    reporter.start()
+    # The date the next incremental harvest starts from is kept with the crawl progress
+    checkpoint = open_checkpoint('checkpoint.db')
+    # Shared with main.py: the books stored since the last targeted download
+    changed = BookStore('changed_books.jsonl')
+
+    try:
+        if from_date is None and not full:
+            from_date = checkpoint.get_meta('oai_from')
+        print(f"Harvesting records changed since {from_date}" if from_date else "Harvesting all records")
+
+        session = build_session(pool_size=1)
+        limiter = AdaptiveLimiter(max_concurrency=1, max_rate=max_rate)
+        store = open_store('books.jsonl')
+        try:
+            count, response_date = harvest(store, session, from_date=from_date, until=until, limiter=limiter,
+                                           retry=RetryPolicy(attempts=retries), changed=changed)
+        finally:
+            store.close()
+
+        # By the server's clock, so records changed during this run are harvested again next time
+        if response_date and until is None:
+            checkpoint.set_meta('oai_from', response_date)
+
+        with METRICS.timer('store.export.seconds'):
+            store.export('books.json')
+        changed.export('changed_books.json')
+        print(f"Harvested {count} books; {len(changed)} new or changed since the last download "
+              f"written to changed_books.json")
+
+        if download and len(changed):
+            import pdfs
+            pdfs.main(books_path='changed_books.json')
+            changed.clear()
+
+    except Exception as e:
+        print(f"An error occurred in oai.py main: {e}")
+    finally:
+        checkpoint.close()
+        changed.close()
+        reporter.stop()
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Harvest the catalogue in bulk over OAI-PMH.")
+    parser.add_argument('--from', dest='from_date', default=None,
+                        help="only records changed since this date, YYYY-MM-DD "
+                             "(default: since the last harvest)")
+    parser.add_argument('--until', default=None, help="only records changed up to this date, YYYY-MM-DD")
+    parser.add_argument('--full', action='store_true', help="harvest every record, not just the changed ones")
+    parser.add_argument('--download', action='store_true',
+                        help="afterwards, download the files of the new and changed books")
+    parser.add_argument('--max-rate', type=float, default=5.0,
+                        help="upper bound of requests per second (default: 5)")
+    parser.add_argument('--retries', type=int, default=4,
+                        help="attempts per request before the harvest stops (default: 4)")
+    parser.add_argument('--metrics-interval', type=float, default=60.0,
+                        help="seconds between metric summaries (default: 60)")
+    parser.add_argument('--metrics-file', default='metrics.json',
+                        help="where the metrics are written as JSON (default: metrics.json)")
+    args = parser.parse_args(argv)
+
+    main(from_date=args.from_date, until=args.until, full=args.full, download=args.download,
+         max_rate=args.max_rate, retries=args.retries, metrics_interval=args.metrics_interval,
+         metrics_file=args.metrics_file)
+
+
+if __name__ == "__main__":
+    cli()
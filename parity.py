@@ -0,0 +1,62 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+
+from BookScraper import BookScraper
+
+
+def parse_page(path, parser):
+    """Parse one saved item page with the given tree builder."""
+    # Saved pages are named after the book key, e.g. 11419_14619.html, or
+    # 11419_14619.html.gz in a page cache directory
+    book_key = os.path.basename(path).split('.')[0]
+    url = "https://repository.kallipos.gr/handle/" + book_key.replace('_', '/', 1)
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        page_source = f.read()
+
+    return BookScraper(url=url, parser=parser).parse(page_source)
+
+
+def check_parity(paths, parsers):
+    """
+    Parse every page with each backend and compare the results.
+
+    Args:
+        paths (list): Saved item pages.
+        parsers (list): Tree builder names; the first one is the reference.
+    Returns:
+        list: (path, parser) pairs whose `book_dict` differs from the reference.
+    """
+    mismatches = []
+    reference, others = parsers[0], parsers[1:]
+
+    for path in paths:
+        expected = parse_page(path, reference)
+        for parser in others:
+            # Compare the serialised form so that key order counts as well
+            if json.dumps(parse_page(path, parser), ensure_ascii=False) != json.dumps(expected, ensure_ascii=False):
+                mismatches.append((path, parser))
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that all HTML parser backends extract the same book data.")
+    parser.add_argument('pages', help="directory of saved item pages (<book_key>.html), or a page cache")
+    parser.add_argument('--parsers', nargs='+', default=['html.parser', 'lxml'],
+                        help="backends to compare, the first is the reference (default: html.parser lxml)")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.pages, '*.html')) + glob.glob(os.path.join(args.pages, '*.html.gz')))
+    mismatches = check_parity(paths, args.parsers)
+
+    for path, backend in mismatches:
+        print(f"{backend} differs from {args.parsers[0]} on {path}")
+    print(f"Checked {len(paths)} pages, {len(mismatches)} mismatches")
+
+    sys.exit(1 if mismatches else 0)
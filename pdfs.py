@@ -1,82 +1,512 @@
-import requests
 from urllib.parse import urljoin
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import os
+import argparse
+import hashlib
+import shutil
 import urllib3
 from tqdm import tqdm
+from sessions import build_session
+from ledger import open_ledger
+from ratelimit import AdaptiveLimiter, limited
+from metrics import METRICS, Reporter, timed
+from retry import DEFAULT_RETRY, RetryPolicy, HTTPStatusError, IncompleteDownload
+from failures import FailureQueue
+from storage import iter_books
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+BASE_URL = "https://repository.kallipos.gr/"
 
-def download_pdf(partial_pdf_url, directory, filename):
-    base_url = "https://repository.kallipos.gr/"
-    full_url = urljoin(base_url, partial_pdf_url)
-    session = requests.Session()
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
-    })
+# Bytes read from the socket per write, i.e. the memory a worker holds at once
+CHUNK_SIZE = 1024 * 1024
 
+# Every distinct file is stored once here, named by its SHA-256, and the
+# Files/<item_id>/ entries are hard links to it
+OBJECTS_DIR = os.path.join("Files", ".objects")
+
+
+def _read_part_info(info_path):
     try:
-        response = session.post(full_url, verify=False, timeout=30)
+        with open(info_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _discard_part(part_path, info_path):
+    for path in (part_path, info_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _total_length(response):
+    # "Content-Range: bytes 100-199/200" on a 206, Content-Length on a 200
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    # requests calls it status_code, aiohttp status
+    status = getattr(response, "status_code", None) or response.status
+    if status == 200 and "Content-Length" in response.headers:
+        return int(response.headers["Content-Length"])
+    return None
+
+
+def _hash_file(path, hasher):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+
+
+def object_path(sha256):
+    return os.path.join(OBJECTS_DIR, sha256[:2], f"{sha256}.pdf")
+
+
+def _store_object(path, sha256):
+    """Move a finished file into the object store, dropping it if already there."""
+    target = object_path(sha256)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return target
+
+
+def link_object(sha256, filepath):
+    """Make `filepath` point at the stored object with the given hash."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = filepath + ".link"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    try:
+        os.link(object_path(sha256), tmp_path)
+    except OSError:
+        # No hard links on this filesystem; fall back to a private copy
+        shutil.copyfile(object_path(sha256), tmp_path)
+    os.replace(tmp_path, filepath)
+
+
+def _resume_headers(part_path, info_path):
+    """
+    Work out how much of a file an earlier run left in its .part file.
+
+    Returns:
+        tuple: The sidecar of the .part file (or None), the number of bytes
+        to resume from, and the Range/If-Range headers asking for the rest.
+    """
+    part_info = _read_part_info(info_path)
+    offset = os.path.getsize(part_path) if part_info and os.path.exists(part_path) else 0
+
+    headers = {}
+    if offset:
+        METRICS.incr("download.resumed")
+        headers["Range"] = f"bytes={offset}-"
+        validator = part_info.get("etag") or part_info.get("last_modified")
+        if validator:
+            headers["If-Range"] = validator
+    return part_info, offset, headers
+
+
+# What `_start_part` tells the engine to do with a response
+PART_COMPLETE = "complete"  # the .part already holds the whole file
+PART_RESTART = "restart"    # the .part was stale and is gone; request the file again
+
+
+def _start_part(response, status, full_url, part_path, info_path, part_info, offset):
+    """
+    Check the response to a request from `_resume_headers` before its body
+    is read, and record its validators in the sidecar when it is used.
+
+    Args:
+        response: The requests or aiohttp response.
+        status (int): Its status code.
+    Returns:
+        tuple: (action, length): `PART_COMPLETE`, `PART_RESTART`, or the
+        mode the body is written to the .part file with, "ab" to append or
+        "wb" to start over; and the total length of the file, if known.
+    Raises:
+        HTTPStatusError: The server answered with an unusable status.
+    """
+    if status == 416 and offset:
+        if offset == part_info.get("length"):
+            # Everything was already received before the last run stopped
+            return PART_COMPLETE, offset
+        # The range starts past the end of the file: the partial bytes are stale
+        _discard_part(part_path, info_path)
+        METRICS.incr("download.restarts")
+        return PART_RESTART, None
+
+    if status not in (200, 206):
+        raise HTTPStatusError.from_response(response)
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    length = _total_length(response)
+
+    if status == 206:
+        changed = (
+            not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+            or (etag and part_info.get("etag") and etag != part_info["etag"])
+            or (length and part_info.get("length") and length != part_info["length"])
+        )
+        if changed:
+            # The server ignored If-Range; the partial bytes are stale
+            _discard_part(part_path, info_path)
+            METRICS.incr("download.restarts")
+            return PART_RESTART, None
+        mode = "ab"
+    else:
+        # A full response: the range was not honoured or the file changed
+        mode = "wb"
+
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump({"url": full_url, "etag": etag, "last_modified": last_modified, "length": length}, f)
+    return mode, length
+
+
+def _finish_part(part_path, length, hasher):
+    """
+    Returns:
+        str: SHA-256 of the complete .part file.
+    Raises:
+        IncompleteDownload: The connection closed early; retrying resumes.
+    """
+    size = os.path.getsize(part_path)
+    if length is not None and size != length:
+        raise IncompleteDownload(f"{size} of {length} bytes")
+    return hasher.hexdigest()
+
+
+def _fetch_to_part(full_url, part_path, info_path, session, limiter=None):
+    """
+    Fetch `full_url` into `part_path`, resuming the bytes already there.
+
+    Returns:
+        str: SHA-256 of the complete file.
+    Raises:
+        HTTPStatusError: The server answered with an unusable status.
+        IncompleteDownload: The connection closed early; retrying resumes.
+    """
+    # The second pass only happens when the file changed on the server
+    for _ in range(2):
+        part_info, offset, headers = _resume_headers(part_path, info_path)
+        hasher = hashlib.sha256()
+
+        with limited(limiter) as request, \
+                session.post(full_url, headers=headers, verify=False, timeout=30, stream=True) as response:
+            request.observe(response.status_code)
+            METRICS.observe("fetch.pdf.seconds", request.latency)
+            METRICS.incr(f"http.status.{response.status_code}")
+
+            action, length = _start_part(response, response.status_code, full_url, part_path, info_path,
+                                         part_info, offset)
+            if action == PART_RESTART:
+                continue
+            if action != "wb":
+                _hash_file(part_path, hasher)
+            if action == PART_COMPLETE:
+                return hasher.hexdigest()
+
+            # Stream into the .part file and only rename it once it is complete,
+            # so an interrupted transfer never looks like a finished PDF
+            with open(part_path, action) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    METRICS.incr("bytes.pdf", len(chunk))
+
+            return _finish_part(part_path, length, hasher)
 
-        if response.status_code == 200:
-            os.makedirs(directory, exist_ok=True)
-            filepath = os.path.join(directory, filename)
-            with open(filepath, "wb") as f:
-                f.write(response.content)
-            return True, f"{directory}_{filename}", f"Downloaded {filename} from {full_url}"
+    raise RuntimeError("content kept changing")
 
-        else:
-            return False, None, f"Failed to download {filename}. Status code: {response.status_code}"
+
+def _download_paths(full_url, directory, filename):
+    """
+    Returns:
+        tuple: The ledger fields of the download (key, url, path, size and
+        sha256, the last two still None), the .part path and its sidecar.
+    """
+    filepath = os.path.join(directory, filename)
+    info = {"key": f"{directory}_{filename}", "url": full_url, "path": filepath, "size": None, "sha256": None}
+    # Bytes received so far live in <file>.part, and the validators of the
+    # response they came from in <file>.part.json, so a later run can resume
+    part_path = filepath + ".part"
+    return info, part_path, part_path + ".json"
+
+
+def _finish_download(info, part_path, info_path, sha256):
+    """Move a complete .part file into the object store and link it into place."""
+    info["size"] = os.path.getsize(part_path)
+    info["sha256"] = sha256
+
+    _store_object(part_path, sha256)
+    link_object(sha256, info["path"])
+    os.remove(info_path)
+
+    return True, info, f"Downloaded {os.path.basename(info['path'])} from {info['url']}"
+
+
+def _download_failed(info, error):
+    METRICS.incr(f"errors.pdf.{type(error).__name__}")
+    return False, info, f"Error downloading {os.path.basename(info['path'])}: {error}"
+
+
+@timed("download.seconds")
+def download_pdf(partial_pdf_url, directory, filename, session=None, limiter=None, retry=None):
+    """
+    Download one file into `directory`.
+
+    Interrupted transfers and transient errors are retried according to
+    `retry`, resuming from the bytes already received.
+
+    Returns:
+        tuple: (success, info, message) where `info` holds the ledger fields
+        of the download: key, url, path, size and sha256.
+    """
+    full_url = urljoin(BASE_URL, partial_pdf_url)
+    if session is None:
+        session = build_session(pool_size=1)
+    retry = retry or DEFAULT_RETRY
+    info, part_path, info_path = _download_paths(full_url, directory, filename)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        sha256 = retry.call("pdf", _fetch_to_part, full_url, part_path, info_path, session, limiter)
+        return _finish_download(info, part_path, info_path, sha256)
 
     except Exception as e:
-        return False, None, f"Error downloading {filename}: {e}"
+        return _download_failed(info, e)
 
 
-def main():
-    # Load JSON data from file
-    with open("books.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
+def record_download(success, info, message, destinations, ledger, failures=None, failed_urls=()):
+    """
+    Book the outcome of `download_pdf` for every destination of its URL.
 
-    # Track progress to avoid re-downloading
-    downloaded_files = set()
+    Args:
+        success, info, message: What `download_pdf` returned.
+        destinations (list): (directory, filename) pairs listing the URL; the
+            first one is where it was downloaded to, the others get links.
+        ledger (DownloadLedger): Where finished downloads are recorded.
+        failures (FailureQueue, optional): Where failed downloads are queued.
+        failed_urls (set): URLs queued as failed by an earlier run.
+    """
+    METRICS.incr("download.done" if success else "download.failed")
+    ledger.record(info["key"], "done" if success else "failed", url=info["url"],
+                  path=info["path"], size=info["size"], sha256=info["sha256"])
+    if not success:
+        if failures is not None:
+            failures.add("pdf", info["url"], message, {"destinations": destinations})
+        return
+    if failures is not None and info["url"] in failed_urls:
+        failures.remove("pdf", info["url"])
+
+    # Other items that list the same URL share the downloaded object
+    for directory, filename in destinations[1:]:
+        filepath = os.path.join(directory, filename)
+        link_object(info["sha256"], filepath)
+        ledger.record(f"{directory}_{filename}", "done", url=info["url"], path=filepath,
+                      size=info["size"], sha256=info["sha256"])
 
-    # Check for already downloaded files from a progress file
-    if os.path.exists("downloaded_files.txt"):
-        with open("downloaded_files.txt", "r", encoding="utf-8") as progress_file:
-            downloaded_files = set(progress_file.read().splitlines())
 
-    download_tasks = []
-    for item_id, item_data in data.items():
+def iter_downloads(items, ledger, counts=None):
+    """
+    Yield the files of the given books that still need downloading.
+
+    Files already fetched from the same URL are skipped, and files another
+    item already has in the object store are linked straight away. Books
+    are consumed one at a time, so downloads can start while `items` is
+    still being read.
+
+    Args:
+        items (iterable): (item_id, book_data) pairs, e.g. from `storage.iter_books`.
+        ledger (DownloadLedger): Record of finished downloads.
+        counts (dict, optional): Its "reused" entry is increased for every
+            file linked from the store.
+    Yields:
+        tuple: (full_url, (directory, filename)) of every file to fetch.
+    """
+    for item_id, item_data in items:
         links = item_data.get("links", {})
         for link_key, partial_url in links.items():
             safe_link_key = link_key.replace(" ", "_").replace("-", "_")
             directory = os.path.join("Files", item_id)
             filename = f"{safe_link_key}.pdf"
-            if f"{directory}_{filename}" not in downloaded_files:
-                download_tasks.append((partial_url, directory, filename))
+            key = f"{directory}_{filename}"
+            full_url = urljoin(BASE_URL, partial_url)
+
+            # Skip files already fetched from this URL; entries imported from
+            # downloaded_files.txt have no URL and count as current
+            row = ledger.get(key)
+            if row and row["status"] == "done" and row["url"] in (None, full_url):
+                continue
+
+            previous = ledger.find_done_by_url(full_url)
+            if previous and os.path.exists(object_path(previous["sha256"])):
+                # Fetched before for another item: just link the stored copy
+                filepath = os.path.join(directory, filename)
+                link_object(previous["sha256"], filepath)
+                ledger.record(key, "done", url=full_url, path=filepath,
+                              size=previous["size"], sha256=previous["sha256"])
+                if counts is not None:
+                    counts["reused"] = counts.get("reused", 0) + 1
+                continue
 
-    print(f"Total pending downloads: {len(download_tasks)}")
+            yield full_url, (directory, filename)
 
-    # Download in parallel using 10 threads
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = [
-            executor.submit(download_pdf, partial_url, directory, filename)
-            for partial_url, directory, filename in download_tasks
-        ]
 
-        for future in tqdm(as_completed(futures), total=len(download_tasks), desc="Downloading PDFs"):
-            success, result, message = future.result()
-            # print(message)
+def plan_downloads(items, ledger):
+    """
+    Work out which files of the given books still need downloading.
 
-            if success:
-                downloaded_files.add(result)
-                with open("downloaded_files.txt", "a", encoding="utf-8") as progress_file:
-                    progress_file.write(result + "\n")
+    Returns:
+        tuple: The files to fetch as {full_url: [(directory, filename), ...]},
+        grouped by URL so a file linked from several items or under several
+        names is only downloaded once, and the number of files linked.
+        See `iter_downloads` for the arguments.
+    """
+    counts = {"reused": 0}
+    download_tasks = {}
+    for full_url, destination in iter_downloads(items, ledger, counts):
+        download_tasks.setdefault(full_url, []).append(destination)
+    return download_tasks, counts["reused"]
 
+
+def main(workers=20, pool_size=None, max_rate=20.0, books_path="books.json", retries=4, retry_failed_only=False,
+         engine="threads", shard=None):
+    if shard is not None:
+        # The books, ledger and files of a `main.py --shard` run
+        shard.enter()
+
+    # Track progress to avoid re-downloading
+    ledger = open_ledger("downloads.db")
+    # Downloads that kept failing, kept for a later --retry-failed run
+    failures = FailureQueue("failures.db")
+    failed_urls = {row["target"] for row in failures.items("pdf")}
+
+    counts = {"reused": 0}
+    if retry_failed_only:
+        download_tasks = (
+            (row["target"], tuple(destination))
+            for row in failures.items("pdf") for destination in row["detail"]["destinations"]
+        )
+    else:
+        # Books are read and planned as the downloads go, so the first file
+        # starts straight away and memory does not grow with the catalogue
+        download_tasks = iter_downloads(iter_books(books_path), ledger, counts)
+
+    # `workers` is the ceiling; the limiter backs off when the server slows down
+    limiter = AdaptiveLimiter(max_concurrency=workers, max_rate=max_rate)
+    retry = RetryPolicy(attempts=retries)
+
+    if engine == "async":
+        # `workers` coroutines on one event loop instead of threads
+        import asyncio
+        import aiocrawl
+
+        progress = tqdm(desc="Downloading PDFs", unit="file")
+
+        def on_done(success, info, message):
+            progress.update()
+            progress.set_postfix(limiter.limits())
+            if not success:
+                tqdm.write(message)
+
+        asyncio.run(aiocrawl.download_all(download_tasks, ledger, failures, workers=workers, limiter=limiter,
+                                          retry=retry, on_done=on_done, per_host=pool_size))
+        progress.close()
+    else:
+        # One keep-alive pool shared by all workers, so each connection is
+        # reused for many files instead of paying a TLS handshake per file
+        session = build_session(pool_size=pool_size or workers)
+
+        # Download in parallel using `workers` threads
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}    # future -> URL it downloads
+            in_flight = {}  # URL -> (directory, filename) pairs waiting for it
+            progress = tqdm(desc="Downloading PDFs", unit="file")
+
+            def collect(done):
+                for future in done:
+                    full_url = futures.pop(future)
+                    success, info, message = future.result()
+                    progress.update()
+                    limits = limiter.limits()
+                    progress.set_postfix(limits)
+                    for name, value in limits.items():
+                        METRICS.gauge(f"limiter.{name}", value)
+                    METRICS.gauge("queue.downloads", len(futures))
+
+                    if not success:
+                        tqdm.write(message)
+                    record_download(success, info, message, in_flight.pop(full_url), ledger, failures,
+                                    failed_urls)
+
+            for full_url, destination in download_tasks:
+                if full_url in in_flight:
+                    # Listed again while its download is pending: link it afterwards
+                    in_flight[full_url].append(destination)
+                    continue
+                # Only a couple of files per worker wait in the executor
+                while len(futures) >= 2 * workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[full_url] = [destination]
+                futures[executor.submit(download_pdf, full_url, *destination, session, limiter, retry)] = full_url
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+            progress.close()
+
+    print(f"Linked {counts['reused']} files already in the store")
+    ledger.close()
+    failed = len(failures.items("pdf"))
+    failures.close()
+    if failed:
+        print(f"{failed} downloads failed; they are kept in failures.db, retry them with --retry-failed")
     print("✅ All downloads finished.")
 
 
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(description="Download the PDFs listed in books.json.")
+    parser.add_argument("--books", default="books.json",
+                        help="books file to read the links from, e.g. changed_books.json (default: books.json)")
+    parser.add_argument("--workers", type=int, default=20,
+                        help="number of concurrent downloads (default: 20)")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="keep-alive connections kept open to the server (default: --workers)")
+    parser.add_argument("--max-rate", type=float, default=20.0,
+                        help="upper bound of requests started per second (default: 20)")
+    parser.add_argument("--metrics-interval", type=float, default=60.0,
+                        help="seconds between metric summaries (default: 60)")
+    parser.add_argument("--metrics-file", default="metrics.json",
+                        help="where the metrics are written as JSON (default: metrics.json)")
+    parser.add_argument("--retries", type=int, default=4,
+                        help="attempts per file before it counts as failed (default: 4)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="only retry the downloads recorded in failures.db")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                        help="thread pool, or one asyncio event loop (needs aiohttp) (default: threads)")
+    parser.add_argument("--shard", default=None, metavar="I/N",
+                        help="download the books of shard I of N, in shards/I-of-N/ (partitioned as its crawl was)")
+    args = parser.parse_args(argv)
+
+    shard = None
+    if args.shard:
+        from shard import Shard
+        try:
+            shard = Shard.parse(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+
+    with Reporter(interval=args.metrics_interval, path=args.metrics_file):
+        main(workers=args.workers, pool_size=args.pool_size, max_rate=args.max_rate, books_path=args.books,
+             retries=args.retries, retry_failed_only=args.retry_failed, engine=args.engine, shard=shard)
+
+
 if __name__ == "__main__":
-    main()
+    cli()
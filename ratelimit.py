@@ -0,0 +1,188 @@
+import asyncio
+import threading
+import time
+
+
+class AdaptiveLimiter:
+    """
+    Shared throttle for requests to the repository.
+
+    Two limits apply to every request:
+
+    * a token bucket caps the request rate (requests per second), and
+    * an AIMD window caps the number of requests in flight.
+
+    Each successful, fast response grows the window by 1/window (about one
+    extra slot per round trip). A 429, a 5xx, a connection error or a
+    response slower than `latency_target` halves it, at most once per
+    `cooldown` seconds. A 429 halves the rate as well. Both recover
+    additively while the server keeps answering quickly.
+    """
+
+    def __init__(self, max_concurrency=20, initial_concurrency=None, min_concurrency=1,
+                 max_rate=20.0, min_rate=0.5, latency_target=5.0, cooldown=2.0):
+        """
+        Args:
+            max_concurrency (int): Upper bound of the in-flight window, normally
+                the number of worker threads.
+            initial_concurrency (int, optional): Starting window. Defaults to
+                half of `max_concurrency`.
+            min_concurrency (int): Lower bound of the in-flight window.
+            max_rate (float): Upper bound of requests started per second.
+            min_rate (float): Lower bound of requests started per second.
+            latency_target (float): Seconds to response headers above which a
+                request counts as a sign of congestion.
+            cooldown (float): Minimum seconds between two decreases.
+        """
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+
+        self.concurrency = float(initial_concurrency or max(min_concurrency, max_concurrency // 2))
+        self.rate = float(max_rate)
+        self.in_flight = 0
+
+        self._tokens = float(max_concurrency)
+        self._last_refill = time.monotonic()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def request(self):
+        """
+        Return a context manager that holds one slot for the duration of a request.
+
+        Call `observe(status_code)` on it once the response headers arrived;
+        an exception leaving the block is counted as a failed request.
+        """
+        return LimitedRequest(self)
+
+    def limits(self):
+        """
+        Returns:
+            dict: The current window, rate and number of requests in flight.
+        """
+        with self._cond:
+            return {
+                "concurrency": int(self.concurrency),
+                "rate": round(self.rate, 2),
+                "in_flight": self.in_flight,
+            }
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                self._cond.wait(wait)
+
+    def try_acquire(self):
+        """
+        Take a slot if one is free, without blocking.
+
+        Returns:
+            float: 0 if a slot was taken, otherwise the seconds until a token
+            is due, or None when the window is full until a release.
+        """
+        with self._cond:
+            return self._try_acquire()
+
+    async def acquire_async(self, poll=0.05):
+        """`acquire` for coroutines: waits on the event loop instead of a lock."""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait if wait is not None else poll)
+
+    def _try_acquire(self):
+        if self.in_flight >= max(1, int(self.concurrency)):
+            return None
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.in_flight += 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def release(self, latency, status_code=None, error=False):
+        with self._cond:
+            self.in_flight -= 1
+
+            congested = (
+                error
+                or status_code == 429
+                or (status_code is not None and status_code >= 500)
+                or (latency is not None and latency > self.latency_target)
+            )
+            now = time.monotonic()
+            if congested:
+                if now - self._last_decrease >= self.cooldown:
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    if status_code == 429:
+                        self.rate = max(self.min_rate, self.rate / 2)
+                    self._last_decrease = now
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        burst = max(1.0, float(self.max_concurrency))
+        self._tokens = min(burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+
+class LimitedRequest:
+    """One request slot of an `AdaptiveLimiter`; a no-op when the limiter is None."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.status_code = None
+        self.latency = None
+
+    def __enter__(self):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        self._start = time.monotonic()
+        return self
+
+    def observe(self, status_code):
+        """Record the response status and the time it took to arrive."""
+        self.status_code = status_code
+        self.latency = time.monotonic() - self._start
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.limiter is not None:
+            if self.latency is None:
+                self.latency = time.monotonic() - self._start
+            self.limiter.release(self.latency, self.status_code, error=exc_type is not None)
+        return False
+
+
+class AsyncLimitedRequest(LimitedRequest):
+    """`LimitedRequest` for `async with`; waiting for a slot does not block the loop."""
+
+    async def __aenter__(self):
+        if self.limiter is not None:
+            await self.limiter.acquire_async()
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def limited(limiter):
+    """Shorthand for `limiter.request()` that also accepts `limiter=None`."""
+    return LimitedRequest(limiter)
+
+
+def alimited(limiter):
+    """`limited` for coroutines: use with `async with`."""
+    return AsyncLimitedRequest(limiter)
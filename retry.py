@@ -0,0 +1,134 @@
+import asyncio
+import random
+import sys
+import time
+
+import requests
+
+from metrics import METRICS
+
+
+# Statuses that usually go away on their own: timeouts, throttling and
+# overloaded or restarting servers
+TRANSIENT_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class HTTPStatusError(Exception):
+    """A response whose status code the caller cannot use."""
+
+    def __init__(self, status_code, url=None, retry_after=None):
+        message = f"status code {status_code}"
+        if url:
+            message += f" for {url}"
+        super().__init__(message)
+        self.status_code = status_code
+        self.url = url
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, response):
+        """Build the error from a `requests` or an `aiohttp` response."""
+        retry_after = response.headers.get("Retry-After")
+        # Only the delay-seconds form; an HTTP date just gets the usual backoff
+        if retry_after is not None and retry_after.strip().isdigit():
+            retry_after = float(retry_after)
+        else:
+            retry_after = None
+        status_code = getattr(response, "status_code", None) or response.status
+        return cls(status_code, str(response.url), retry_after)
+
+
+class IncompleteDownload(Exception):
+    """The connection closed before the whole body arrived."""
+
+
+def is_transient(error):
+    """Return True if the request that raised `error` is worth repeating."""
+    if isinstance(error, HTTPStatusError):
+        return error.status_code in TRANSIENT_STATUSES
+
+    # Only the async engine imports aiohttp; its errors cannot occur before
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp is not None and isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return True
+
+    return isinstance(error, (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        IncompleteDownload,
+        ConnectionError,
+        TimeoutError,
+    ))
+
+
+class RetryPolicy:
+    """
+    Repeat a call that failed with a transient error.
+
+    The n-th retry waits a random time between 0 and
+    `min(max_delay, base_delay * 2**n)` seconds ("full jitter"), so workers
+    that failed together do not all come back at the same moment. A
+    Retry-After header sent with a 429 or 503 is honoured when it asks
+    for longer. Errors that are not transient are raised straight away.
+    """
+
+    def __init__(self, attempts=4, base_delay=1.0, max_delay=60.0, retry_on=is_transient):
+        """
+        Args:
+            attempts (int): Calls in total, including the first one.
+            base_delay (float): Upper bound of the first backoff, in seconds.
+            max_delay (float): Upper bound of any backoff, in seconds.
+            retry_on (callable): Predicate telling whether an exception is
+                worth another attempt.
+        """
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def backoff(self, retry, error=None):
+        """
+        Returns:
+            float: Seconds to wait before retry number `retry` (0-based).
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            delay = max(delay, min(self.max_delay, retry_after))
+        return delay
+
+    def call(self, stage, function, *args, **kwargs):
+        """
+        Call `function(*args, **kwargs)`, retrying transient failures.
+
+        Args:
+            stage (str): Name used in the `retries.<stage>` metric, e.g. "item".
+
+        Returns:
+            The return value of `function`. The last exception is raised once
+            the attempts are used up or when it is not transient.
+        """
+        for retry in range(self.attempts):
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if retry + 1 >= self.attempts or not self.retry_on(e):
+                    raise
+                METRICS.incr(f"retries.{stage}")
+                time.sleep(self.backoff(retry, e))
+
+    async def call_async(self, stage, function, *args, **kwargs):
+        """`call` for coroutine functions; backs off without blocking the loop."""
+        for retry in range(self.attempts):
+            try:
+                return await function(*args, **kwargs)
+            except Exception as e:
+                if retry + 1 >= self.attempts or not self.retry_on(e):
+                    raise
+                METRICS.incr(f"retries.{stage}")
+                await asyncio.sleep(self.backoff(retry, e))
+
+
+# Used when a caller does not pass its own policy
+DEFAULT_RETRY = RetryPolicy()
@@ -0,0 +1,26 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+
+
+def build_session(pool_size=10):
+    """
+    Create a keep-alive session that can be shared between worker threads.
+
+    Args:
+        pool_size (int): Number of connections kept open per host. Should be
+            at least the number of threads using the session, otherwise
+            urllib3 discards the surplus connections after each request.
+
+    Returns:
+        requests.Session: Session with a connection pool of the given size.
+    """
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
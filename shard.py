@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import re
+import zlib
+
+from BookScraper import book_hash
+from checkpoint import Checkpoint
+from ledger import DownloadLedger
+from storage import iter_books
+
+
+# Every shard works in its own directory below this one
+SHARDS_DIR = 'shards'
+
+SHARD_SPEC = re.compile(r'(\d+)/(\d+)')
+
+
+def book_key(link):
+    """The `BookScraper.book_key` of an item link, e.g. 11419_123."""
+    return "_".join(link.rstrip('/').split('/')[-2:])
+
+
+class Shard:
+    """
+    One of `count` deterministic slices of the catalogue.
+
+    Shards split the work either by search page (`by="page"`: every shard
+    lists and scrapes its own pages, in blocks of `block` consecutive pages
+    dealt out in turn) or by item handle (`by="handle"`: every shard lists
+    all pages but only scrapes and downloads the items whose handle hashes
+    to it, which stays balanced when pages shift). Any node given the same
+    index and count makes the same choice, so shards can run on separate
+    machines without talking to each other.
+
+    A shard keeps its store, checkpoint, ledger, failure queue, page cache
+    and files in its own `directory`; `merge` combines them afterwards.
+    """
+
+    def __init__(self, index, count, by='page', block=1):
+        """
+        Args:
+            index (int): This shard, from 0 to `count - 1`.
+            count (int): Number of shards.
+            by (str): "page" or "handle".
+            block (int): Consecutive search pages per slice with `by="page"`.
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index} does not exist out of {count}")
+        if by not in ('page', 'handle'):
+            raise ValueError(f"Unknown partitioning {by!r}")
+        self.index = index
+        self.count = count
+        self.by = by
+        self.block = max(1, block)
+
+    @classmethod
+    def parse(cls, spec, by=None, block=None):
+        """
+        Build a shard from an "<index>/<count>" string such as "0/4".
+
+        `by` and `block` default to what an earlier run of the shard
+        recorded in its directory, else to "page" and 1.
+
+        Raises:
+            ValueError: For a malformed `spec`, or a partitioning that
+                differs from the one the shard already ran with.
+        """
+        match = SHARD_SPEC.fullmatch(spec.strip())
+        if not match:
+            raise ValueError(f"Expected <index>/<count>, e.g. 0/4, not {spec!r}")
+        shard = cls(int(match.group(1)), int(match.group(2)))
+        recorded = _read_shard(shard.directory)
+        shard.by = by or (recorded.by if recorded is not None else 'page')
+        shard.block = max(1, block or (recorded.block if recorded is not None else 1))
+        shard.check(recorded)
+        return shard
+
+    def check(self, recorded):
+        """Raise ValueError if `recorded` (a Shard or None) partitions differently."""
+        if recorded is not None and (recorded.by, recorded.block) != (self.by, self.block):
+            raise ValueError(f"{self.directory} was crawled by {recorded.by} (block {recorded.block}), "
+                             f"not by {self.by} (block {self.block}); its output would not merge")
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count}, by={self.by!r}, block={self.block})"
+
+    @property
+    def directory(self):
+        return os.path.join(SHARDS_DIR, f"{self.index}-of-{self.count}")
+
+    def owns_page(self, page):
+        """Return True if this shard lists search page `page`."""
+        if self.by == 'handle':
+            return True
+        return (page - 1) // self.block % self.count == self.index
+
+    def owns_key(self, key):
+        """Return True if this shard scrapes and downloads the book `key`."""
+        if self.by == 'page':
+            return True
+        # crc32, not hash(): it must not change between processes and machines
+        return zlib.crc32(key.encode('utf-8')) % self.count == self.index
+
+    def owns_link(self, link):
+        return self.owns_key(book_key(link))
+
+    def enter(self):
+        """
+        Switch to the shard's directory, creating it and recording the
+        partitioning there for `merge`.
+
+        Raises:
+            ValueError: If the directory holds a shard partitioned differently.
+        """
+        self.check(_read_shard(self.directory))
+        os.makedirs(self.directory, exist_ok=True)
+        os.chdir(self.directory)
+        if not os.path.exists('shard.json'):
+            with open('shard.json', 'w', encoding='utf-8') as f:
+                json.dump({'index': self.index, 'count': self.count, 'by': self.by, 'block': self.block}, f)
+        print(f"Working in {self.directory} as shard {self.index} of {self.count} (by {self.by})")
+
+
+def _read_shard(directory):
+    try:
+        with open(os.path.join(directory, 'shard.json'), 'r', encoding='utf-8') as f:
+            return Shard(**json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def merge(directories, output='books.json', manifest='manifest.json'):
+    """
+    Combine the output of several shards.
+
+    A book scraped by more than one shard (pages shift while the shards
+    run, or the shard count changed between runs) is taken from the shard
+    that stored it last, according to the shard checkpoints; without
+    timestamps, from the shard that owns its handle, then the lowest
+    shard. File rows are merged the same way, preferring finished
+    downloads over failed ones.
+
+    Args:
+        directories (list): Shard directories, e.g. shards/0-of-4.
+        output (str): Where the merged `books.json` is written.
+        manifest (str): Where the merged download manifest is written:
+            {key: {url, path, size, sha256, status, shard}}, with paths
+            relative to the current directory.
+    Returns:
+        tuple: (books written, conflicting books, files in the manifest)
+    """
+    books = {}       # key -> (rank, book_data)
+    differing = set()
+    files = {}       # key -> (rank, row)
+
+    for position, directory in enumerate(directories):
+        shard = _read_shard(directory)
+        index = shard.index if shard is not None else position
+
+        stored_at = {}
+        checkpoint_path = os.path.join(directory, 'checkpoint.db')
+        if os.path.exists(checkpoint_path):
+            with Checkpoint(checkpoint_path) as checkpoint:
+                stored_at = {book_key(url): when for url, when in checkpoint.stored_at().items()}
+
+        # Later lines of a store replace earlier ones
+        shard_books = dict(iter_books(os.path.join(directory, 'books.jsonl')))
+        for key, book_data in shard_books.items():
+            owner = shard is not None and shard.by == 'handle' and shard.owns_key(key)
+            rank = (stored_at.get(key, 0), owner, -index)
+            if key in books:
+                if book_hash(books[key][1]) != book_hash(book_data):
+                    differing.add(key)
+                if books[key][0] >= rank:
+                    continue
+            books[key] = (rank, book_data)
+
+        ledger_path = os.path.join(directory, 'downloads.db')
+        if os.path.exists(ledger_path):
+            with DownloadLedger(ledger_path) as ledger:
+                for row in ledger.items():
+                    rank = (row['status'] == 'done', row['updated_at'], -index)
+                    if row['key'] in files and files[row['key']][0] >= rank:
+                        continue
+                    if row['path'] and not os.path.isabs(row['path']):
+                        row['path'] = os.path.join(directory, row['path'])
+                    row['shard'] = directory
+                    files[row['key']] = (rank, row)
+
+    # Written next to the destination and renamed, like BookStore.export
+    for path, content in ((output, {key: book_data for key, (_, book_data) in sorted(books.items())}),
+                          (manifest, {key: {name: row[name] for name in ('url', 'path', 'size', 'sha256',
+                                                                          'status', 'shard')}
+                                      for key, (_, row) in sorted(files.items())})):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    return len(books), len(differing), len(files)
+
+
+def cli(argv=None):
+    """Command line entry point; `argv` defaults to `sys.argv[1:]`."""
+    parser = argparse.ArgumentParser(
+        description="Merge the books and downloads of sharded runs (main.py/pdfs.py --shard I/N).")
+    parser.add_argument('directories', nargs='*', metavar='directory',
+                        help=f"shard directories (default: all in {SHARDS_DIR}/)")
+    parser.add_argument('--output', default='books.json', help="merged books file (default: books.json)")
+    parser.add_argument('--manifest', default='manifest.json',
+                        help="merged download manifest (default: manifest.json)")
+    args = parser.parse_args(argv)
+
+    directories = args.directories
+    if not directories and os.path.isdir(SHARDS_DIR):
+        directories = sorted(os.path.join(SHARDS_DIR, name) for name in os.listdir(SHARDS_DIR)
+                             if os.path.isdir(os.path.join(SHARDS_DIR, name)))
+    if not directories:
+        parser.error("no shard directories given or found")
+
+    count, conflicts, files = merge(directories, output=args.output, manifest=args.manifest)
+    print(f"Merged {len(directories)} shards: {count} books in {args.output} "
+          f"({conflicts} scraped differently by several shards), {files} files in {args.manifest}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import threading
+
+
+def _iter_jsonl(path):
+    """Yield the `(book_key, book_data)` of every line; book_data is None for a deletion."""
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield record['key'], None if record.get('deleted') else record['data']
+
+
+def _latest(records):
+    """The last version of every book of `(book_key, book_data)` pairs, without deleted ones."""
+    books = {}
+    for book_key, book_data in records:
+        if book_data is None:
+            books.pop(book_key, None)
+        else:
+            books[book_key] = book_data
+    return books
+
+
+class BookStore:
+    """
+    Append-only JSON Lines store of scraped books, keyed by `BookScraper.book_key`.
+
+    Every `put` appends a single line, so storing a book costs the same no
+    matter how large the catalogue is. When a key is stored twice the last
+    line wins; `delete` appends a tombstone line that hides the book from
+    then on. `export` rebuilds the nested `books.json` layout that
+    `pdfs.main` reads.
+    """
+
+    def __init__(self, path='books.jsonl', sync=False):
+        """
+        Open (or create) the store.
+
+        Args:
+            path (str): Path of the JSON Lines file.
+            sync (bool): fsync after every write. Slower, but a record that
+                `put` returned for survives a power loss.
+        """
+        self.path = path
+        self.sync = sync
+        self._lock = threading.Lock()
+        self._keys = set(_latest(self.iter_records()))
+
+        self._repair_tail()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, book_key):
+        return book_key in self._keys
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _repair_tail(self):
+        """Drop a half-written last line left behind by a crash."""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+
+            # Walk back to the last newline
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                idx = chunk.rfind(b'\n')
+                if idx != -1:
+                    pos = pos - step + idx + 1
+                    break
+                pos -= step
+
+            if pos != size:
+                f.truncate(pos)
+
+    def put(self, book_key, book_data):
+        """
+        Append one book to the store.
+
+        Args:
+            book_key (str): Key of the book, e.g. "11419_14619".
+            book_data (dict): The book's `links`/`metadata` dictionary.
+        """
+        self._append({'key': book_key, 'data': book_data})
+        with self._lock:
+            self._keys.add(book_key)
+
+    def delete(self, book_key):
+        """
+        Remove a book from the store, e.g. one withdrawn from the repository.
+
+        A tombstone line is appended; `load`, `export` and `compact` leave
+        the book out from then on, until it is `put` again.
+        """
+        self._append({'key': book_key, 'deleted': True})
+        with self._lock:
+            self._keys.discard(book_key)
+
+    def _append(self, record):
+        data = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            while data:
+                written = os.write(self._fd, data)
+                data = data[written:]
+            if self.sync:
+                os.fsync(self._fd)
+
+    def iter_records(self):
+        """
+        Yield every stored `(book_key, book_data)` pair in write order.
+
+        A deletion is yielded as `(book_key, None)`. Lines that cannot be
+        decoded (a torn write at the end of the file) are skipped.
+        """
+        return _iter_jsonl(self.path)
+
+    def load(self):
+        """
+        Returns:
+            dict: The latest version of every book that was not deleted,
+            keyed by book key.
+        """
+        return _latest(self.iter_records())
+
+    def import_json(self, json_path):
+        """Seed the store from an existing `books.json` file."""
+        with open(json_path, 'r', encoding='utf-8') as json_file:
+            all_books_dict = json.load(json_file)
+
+        for book_key, book_data in all_books_dict.items():
+            self.put(book_key, book_data)
+
+    def compact(self):
+        """Rewrite the file so that each book appears exactly once."""
+        with self._lock:
+            all_books_dict = self.load()
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for book_key, book_data in all_books_dict.items():
+                    f.write(json.dumps({'key': book_key, 'data': book_data}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.close(self._fd)
+            os.replace(tmp_path, self.path)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def clear(self):
+        """Remove every book from the store."""
+        with self._lock:
+            os.ftruncate(self._fd, 0)
+            if self.sync:
+                os.fsync(self._fd)
+            self._keys.clear()
+
+    def export(self, json_path='books.json'):
+        """
+        Write the store out in the `books.json` shape consumed by `pdfs.main`.
+
+        The file is written next to its destination and renamed into place,
+        so readers never see a partially written export.
+        """
+        all_books_dict = self.load()
+
+        tmp_path = json_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as json_file:
+            json.dump(all_books_dict, json_file, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
+
+        return len(all_books_dict)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def iter_books(path='books.json', chunk_size=1024 * 1024):
+    """
+    Yield the `(book_key, book_data)` pairs of a books file one at a time.
+
+    `books.json` (one JSON object) is decoded incrementally, one book per
+    step, so only the book being decoded and a chunk of the file are held
+    in memory. A `.jsonl` path is read as a `BookStore` file instead, in
+    write order (a book stored twice is yielded twice); books it deleted
+    are left out.
+
+    Args:
+        path (str): `books.json`, `changed_books.json` or a JSON Lines store.
+        chunk_size (int): Characters read from the file at a time.
+    """
+    if path.endswith('.jsonl'):
+        # A first pass finds the books whose last line is a tombstone
+        deleted = set()
+        for book_key, book_data in _iter_jsonl(path):
+            if book_data is None:
+                deleted.add(book_key)
+            else:
+                deleted.discard(book_key)
+        for book_key, book_data in _iter_jsonl(path):
+            if book_data is not None and book_key not in deleted:
+                yield book_key, book_data
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def more():
+            # Drop what was decoded already and append the next chunk
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return not eof
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or not more():
+                    return
+
+        def expect(chars):
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] not in chars:
+                raise ValueError(f"{path}: expected one of {chars!r}, found {buffer[pos:pos + 20]!r}")
+            pos += 1
+            return buffer[pos - 1]
+
+        def decode():
+            nonlocal pos
+            skip_whitespace()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number at the end of the buffer may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                more()
+
+        expect('{')
+        skip_whitespace()
+        if buffer[pos:pos + 1] == '}':
+            return
+        while True:
+            book_key = decode()
+            expect(':')
+            yield book_key, decode()
+            if expect(',}') == '}':
+                return
+
+
+def open_store(path='books.jsonl', legacy_json='books.json'):
+    """
+    Open the book store, importing a pre-existing `books.json` the first time.
+    """
+    is_new = not os.path.exists(path)
+    store = BookStore(path)
+    if is_new and os.path.exists(legacy_json):
+        print(f"Importing {legacy_json} into {path}...")
+        store.import_json(legacy_json)
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the append-only book store.")
+    parser.add_argument('command', choices=['compact', 'export'])
+    parser.add_argument('--store', default='books.jsonl', help="JSON Lines store (default: books.jsonl)")
+    parser.add_argument('--output', default='books.json', help="export destination (default: books.json)")
+    args = parser.parse_args()
+
+    with BookStore(args.store) as store:
+        if args.command == 'compact':
+            store.compact()
+            print(f"Compacted {args.store} to {len(store)} books")
+        else:
+            count = store.export(args.output)
+            print(f"Exported {count} books to {args.output}")
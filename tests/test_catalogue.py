@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+import catalogue
+from catalogue import Catalogue, open_catalogue
+from storage import BookStore
+
+
+def _book(title, subjects=(), keywords=(), links=None):
+    return {
+        'metadata': {'Title': title, 'Subjects': [{'text': subject, 'url': '/'} for subject in subjects],
+                     'Keywords': list(keywords), 'License': 'CC BY-NC-SA 4.0'},
+        'links': links or {},
+    }
+
+
+BOOKS = {
+    "11419_1": _book("Στατιστική", ["Μαθηματικά"], ["Δειγματοληψία"],
+                     {"Book - Adobe PDF": "/retrieve/1/book.pdf", "Exercises - EPUB": "/retrieve/1/ex.epub"}),
+    "11419_2": _book("Φυσική", ["Φυσική"], ["Κρύσταλλοι"],
+                     {"Book - Adobe PDF": "/retrieve/2/book.pdf"}),
+    "11419_3": _book("Άλγεβρα", ["Μαθηματικά"], ["Ομάδες"],
+                     {"Slides - Adobe PDF": "/retrieve/3/slides.pdf"}),
+}
+
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with BookStore('books.jsonl') as store:
+        for key, book_data in BOOKS.items():
+            store.put(key, book_data)
+    return 'books.jsonl'
+
+
+def _keys(records):
+    return [record.key for record in records]
+
+
+def test_query(store_path):
+    books = Catalogue.build(store_path)
+
+    assert _keys(books.query(subject="μαθηματικά")) == ["11419_1", "11419_3"]
+    # Criteria are intersected; the values of a list are alternatives
+    assert _keys(books.query(subject="Μαθηματικά", format="adobe pdf")) == ["11419_1", "11419_3"]
+    assert _keys(books.query(subject="Μαθηματικά", link_type="Exercises - EPUB")) == ["11419_1"]
+    assert _keys(books.query(keyword=["Κρύσταλλοι", "Ομάδες"])) == ["11419_2", "11419_3"]
+    assert books.query(subject="Χημεία") == []
+    assert len(books.query()) == 3
+    with pytest.raises(ValueError):
+        books.query(author="Παπαδόπουλος")
+
+
+def test_remove_and_tombstones(store_path):
+    with BookStore(store_path) as store:
+        store.delete("11419_1")
+        # Replaced: only the latest version is indexed
+        store.put("11419_2", _book("Φυσική", ["Μαθηματικά"]))
+
+    books = Catalogue.build(store_path)
+    assert "11419_1" not in books and len(books) == 2
+    # A replaced book counts as added again
+    assert _keys(books.query(subject="Μαθηματικά")) == ["11419_3", "11419_2"]
+    assert books.query(subject="Φυσική") == []
+    assert books.query(link_type="Exercises - EPUB") == []
+
+    books.remove("11419_3")
+    books.remove("11419_3")
+    assert _keys(books.query()) == ["11419_2"]
+    assert ("μαθηματικά", 1) in [(value.casefold(), count) for value, count in books.counts('subject')]
+
+
+def test_download_items_keeps_the_chosen_files(store_path):
+    books = Catalogue.build(store_path)
+    records = books.query()
+
+    selected = dict(books.download_items(records, file_format="EPUB"))
+    assert selected == {"11419_1": {'links': {"Exercises - EPUB": "/retrieve/1/ex.epub"},
+                                    'metadata': {'Title': "Στατιστική"}}}
+
+    # A list keeps any of its values, as repeated --format options give
+    selected = dict(books.download_items(records, link_type=["book - adobe pdf", "Slides - Adobe PDF"]))
+    assert {key: list(book['links']) for key, book in selected.items()} == {
+        "11419_1": ["Book - Adobe PDF"], "11419_2": ["Book - Adobe PDF"], "11419_3": ["Slides - Adobe PDF"]}
+
+
+def test_output_writes_only_the_chosen_formats(store_path, capsys):
+    catalogue.cli(['--books', store_path, '--subject', 'Μαθηματικά', '--format', 'EPUB', '--format', 'adobe pdf',
+                   '--output', 'selected.json'])
+
+    with open('selected.json', encoding='utf-8') as f:
+        selected = json.load(f)
+    assert {key: sorted(book['links']) for key, book in selected.items()} == {
+        "11419_1": ["Book - Adobe PDF", "Exercises - EPUB"], "11419_3": ["Slides - Adobe PDF"]}
+    assert "2 books written to selected.json" in capsys.readouterr().out
+
+
+def test_book_reads_the_record_at_its_offset(store_path):
+    with BookStore(store_path) as store:
+        store.put("11419_2", _book("Φυσική, 2η έκδοση"))
+
+    books = Catalogue.build(store_path)
+    assert books.get("11419_2").offset > books.get("11419_3").offset
+    assert books.book("11419_2") == _book("Φυσική, 2η έκδοση")
+    assert books.book("11419_1") == BOOKS["11419_1"]
+    assert books.book("11419_9") is None
+
+    # An export has no offsets and is scanned instead
+    with BookStore(store_path) as store:
+        store.export('books.json')
+    assert Catalogue.build('books.json').book("11419_3") == BOOKS["11419_3"]
+
+
+def test_open_catalogue_rebuilds_when_the_books_change(store_path, monkeypatch):
+    builds = []
+    build = Catalogue.build.__func__
+    monkeypatch.setattr(Catalogue, 'build', classmethod(lambda cls, path: builds.append(path) or build(cls, path)))
+
+    assert len(open_catalogue(store_path)) == 3
+    assert len(open_catalogue(store_path)) == 3
+    assert len(builds) == 1
+
+    with BookStore(store_path) as store:
+        store.put("11419_4", _book("Χημεία", ["Χημεία"]))
+    assert _keys(open_catalogue(store_path).query(subject="Χημεία")) == ["11419_4"]
+    assert len(builds) == 2
+
+    # Same size, newer modification time
+    stat = os.stat(store_path)
+    os.utime(store_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    open_catalogue(store_path)
+    assert len(builds) == 3
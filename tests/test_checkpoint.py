@@ -0,0 +1,116 @@
+import asyncio
+import re
+from collections import Counter
+
+import pytest
+
+import main
+import mock_repository
+from checkpoint import Checkpoint
+from mock_repository import MockRepository
+from retry import RetryPolicy
+from sessions import build_session
+from storage import BookStore
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingStore(BookStore):
+    """A store whose run is cut short after `limit` books."""
+
+    def __init__(self, path, limit):
+        super().__init__(path)
+        self.limit = limit
+
+    def put(self, book_key, book_data):
+        if self.limit == 0:
+            raise Interrupted()
+        self.limit -= 1
+        super().put(book_key, book_data)
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Four search pages of items; the fifth is past the end
+    with MockRepository(items=350) as repository:
+        monkeypatch.setattr(main, 'SEARCH_URL', repository.search_url)
+        repository.requests = []
+        handle_get = mock_repository._Handler.do_GET
+
+        def do_GET(handler):
+            repository.requests.append(handler.path)
+            handle_get(handler)
+
+        monkeypatch.setattr(mock_repository._Handler, 'do_GET', do_GET)
+        yield repository
+
+
+def _run(engine, page, store, checkpoint):
+    # One listing at a time, so the pages listed before an interruption are 1..n
+    options = dict(workers=4, prefetch=1, processes=1, batch_size=5, retry=RetryPolicy(attempts=1),
+                   checkpoint=checkpoint)
+    if engine == 'threads':
+        main.crawl(page, store, build_session(), **options)
+    else:
+        aiocrawl = pytest.importorskip('aiocrawl')
+        asyncio.run(aiocrawl.crawl(page, store, **options))
+
+
+def _requested(repository):
+    """The search pages and the item handles requested so far."""
+    pages, items = [], Counter()
+    for path in repository.requests:
+        if match := re.search(r'[?&]start=(\d+)', path):
+            pages.append(int(match.group(1)) // 100 + 1)
+        elif match := re.fullmatch(r'/handle/11419/(\d+)', path):
+            items[int(match.group(1))] += 1
+    return pages, items
+
+
+def _item(url):
+    return int(url.rsplit('/', 1)[1])
+
+
+@pytest.mark.parametrize('engine', ['threads', 'async'])
+def test_resume_after_interruption(repository, engine, monkeypatch):
+    if engine == 'async':
+        pytest.importorskip('aiohttp')
+    checkpoint = Checkpoint('checkpoint.db')
+    store = InterruptingStore('books.jsonl', limit=30)
+    with pytest.raises(Interrupted):
+        _run(engine, 1, store, checkpoint)
+    store.close()
+    checkpoint.commit()
+
+    outstanding = {_item(url) for url, _ in checkpoint.outstanding()}
+    stored = {_item(url) for url in checkpoint.stored_at()}
+    listed = {page for (page,) in checkpoint.conn.execute("SELECT page FROM pages")}
+    assert outstanding and len(stored) == 30
+    assert listed == set(range(1, max(listed) + 1)) and max(listed) < 4
+
+    # Between the runs a stored and an unfinished item move to the unlisted pages
+    moved = [min(stored), min(outstanding)]
+    search_page = mock_repository._search_page
+    monkeypatch.setattr(mock_repository, '_search_page',
+                        lambda items: search_page([*moved, *items] if items else items))
+
+    repository.requests.clear()
+    store = BookStore('books.jsonl')
+    _run(engine, checkpoint.next_page(), store, checkpoint)
+    pages, items = _requested(repository)
+
+    # Only the pages not listed before, up to the empty one past the end
+    assert sorted(pages) == [page for page in range(1, 6) if page not in listed]
+    # Exactly the unfinished items and those of the new pages, each once
+    new = set(range(max(listed) * 100 + 1, 351))
+    assert set(items) == outstanding | new
+    assert max(items.values()) == 1
+    assert not stored & set(items)
+
+    assert checkpoint.outstanding() == []
+    assert len(store) == 350
+    store.close()
+    checkpoint.close()
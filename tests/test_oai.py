@@ -0,0 +1,68 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import oai
+from BookScraper import BookScraper
+from mock_repository import MockRepository, item_page
+from storage import BookStore
+
+
+@pytest.fixture
+def repository():
+    with MockRepository(items=250, oai_page_size=100) as repository:
+        yield repository
+
+
+def _records(repository):
+    root = ET.fromstring(repository.oai({'verb': ['ListRecords'], 'metadataPrefix': ['xoai']}))
+    return root.findall(f'{oai.OAI}ListRecords/{oai.OAI}record')
+
+
+@pytest.mark.parametrize('item', [1, 7, 42])
+def test_record_matches_item_page(repository, item):
+    book_key, book_data = oai.record_to_book(_records(repository)[item - 1])
+    scraped = BookScraper(url=f"{repository.url}handle/11419/{item}").parse(item_page(item))
+
+    assert book_key == f"11419_{item}"
+    expected = scraped[book_key]
+    assert book_data['links'] == expected['links']
+
+    metadata, expected_metadata = book_data['metadata'], expected['metadata']
+    for field in ('Title', 'Subjects', 'Keywords', 'Publisher', 'License', 'ISBN'):
+        assert metadata[field] == expected_metadata[field], field
+    # The item page breaks the abstract into paragraphs with <br>, which the
+    # scraper joins without a space; the record has it as one value
+    assert "".join(metadata['Abstract'].split()) == "".join(expected_metadata['Abstract'].split())
+    # Author links point elsewhere in the record, and it has no usage statistics
+    assert [author['text'] for author in metadata['Authors']] == \
+        [author['text'] for author in expected_metadata['Authors']]
+
+
+def test_deleted_record(repository):
+    repository.delete(3)
+    book_key, book_data = oai.record_to_book(_records(repository)[2])
+    assert (book_key, book_data) == ("11419_3", None)
+
+
+def test_harvest_deletes_withdrawn_books(repository, tmp_path, monkeypatch):
+    monkeypatch.setattr(oai, 'OAI_URL', repository.oai_url)
+    store = BookStore(str(tmp_path / 'books.jsonl'))
+    changed = BookStore(str(tmp_path / 'changed_books.jsonl'))
+
+    stored, response_date = oai.harvest(store, changed=changed)
+    assert stored == 250 and len(store) == 250
+
+    repository.delete(5, 120)
+    stored, _ = oai.harvest(store, from_date=response_date, changed=changed)
+    assert stored == 0
+    assert "11419_5" not in store and "11419_120" not in changed
+    assert len(store.load()) == 248
+
+    store.export(str(tmp_path / 'books.json'))
+    store.compact()
+    store.close()
+    changed.close()
+    reopened = BookStore(str(tmp_path / 'books.jsonl'))
+    assert len(reopened) == 248 and "11419_5" not in reopened.load()
+    reopened.close()
@@ -0,0 +1,28 @@
+import glob
+import os
+
+import pytest
+
+from parity import check_parity, parse_page
+
+pytest.importorskip('lxml')
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+PAGES = sorted(glob.glob(os.path.join(PAGES_DIR, '*.html')))
+
+
+@pytest.mark.parametrize('path', PAGES, ids=os.path.basename)
+def test_lxml_matches_html_parser(path):
+    assert check_parity([path], ['html.parser', 'lxml']) == []
+
+
+@pytest.mark.parametrize('parser', ['html.parser', 'lxml'])
+def test_keywords_split_on_br(parser):
+    # Keywords inside one inline tag are only found by splitting at <br>
+    metadata = parse_page(os.path.join(PAGES_DIR, '11419_900.html'), parser)['11419_900']['metadata']
+    assert metadata['Keywords'] == ["Γράφοι", "Δυναμικός προγραμματισμός", "NP-πληρότητα"]
+
+    # Comments are not keywords, and an abstract of line breaks is no abstract
+    metadata = parse_page(os.path.join(PAGES_DIR, '11419_901.html'), parser)['11419_901']['metadata']
+    assert metadata['Keywords'] == ["Κρύσταλλοι", "Ημιαγωγοί και μέταλλα", "Φωνόνια"]
+    assert 'Abstract' not in metadata
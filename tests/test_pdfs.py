@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import os
+
+import pytest
+
+import pdfs
+from metrics import METRICS
+from mock_repository import MockRepository
+from retry import RetryPolicy
+
+PATH = '/retrieve/1/book.pdf'
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockRepository(items=1, pdf_size=1000) as repository:
+        monkeypatch.setattr(pdfs, 'BASE_URL', repository.url)
+        yield repository
+
+
+@pytest.fixture(params=['threads', 'async'])
+def download(request):
+    """Download PATH into Files/11419_1/Book.pdf with the engine under test."""
+    if request.param == 'threads':
+        def run(repository):
+            return pdfs.download_pdf(PATH, os.path.join('Files', '11419_1'), 'Book.pdf',
+                                     retry=RetryPolicy(attempts=1))
+    else:
+        aiocrawl = pytest.importorskip('aiocrawl')
+        pytest.importorskip('aiohttp')
+
+        def run(repository):
+            async def go():
+                async with aiocrawl.create_session() as session:
+                    return await aiocrawl.download_pdf(session, repository.url + PATH[1:],
+                                                       os.path.join('Files', '11419_1'), 'Book.pdf',
+                                                       retry=RetryPolicy(attempts=1))
+            return asyncio.run(go())
+    return run
+
+
+def _leave_part(data, **part_info):
+    """Leave the state an interrupted run leaves behind: a .part and its sidecar."""
+    os.makedirs(os.path.join('Files', '11419_1'), exist_ok=True)
+    part_path = os.path.join('Files', '11419_1', 'Book.pdf.part')
+    with open(part_path, 'wb') as f:
+        f.write(data)
+    with open(part_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'url': None, 'etag': None, 'last_modified': None, 'length': None, **part_info}, f)
+    return part_path
+
+
+def _statuses():
+    counters = METRICS.snapshot()['counters']
+    return {status: counters.get(f'http.status.{status}', 0) for status in (200, 206, 416)}
+
+
+def _check_downloaded(result, body, part_path):
+    success, info, message = result
+    assert success, message
+    with open(os.path.join('Files', '11419_1', 'Book.pdf'), 'rb') as f:
+        assert f.read() == body
+    assert info['sha256'] == hashlib.sha256(body).hexdigest() and info['size'] == len(body)
+    assert not os.path.exists(part_path) and not os.path.exists(part_path + '.json')
+
+
+def _etag():
+    return '"%s"' % hashlib.md5(PATH.encode('utf-8')).hexdigest()
+
+
+def test_resume_appends_206(repository, download):
+    body = repository.pdf(PATH)
+    part_path = _leave_part(body[:400], etag=_etag(), length=len(body))
+    before = _statuses()
+
+    _check_downloaded(download(repository), body, part_path)
+    after = _statuses()
+    assert after[206] == before[206] + 1 and after[200] == before[200]
+
+
+def test_if_range_mismatch_restarts(repository, download):
+    body = repository.pdf(PATH)
+    # Bytes of an older version of the file
+    part_path = _leave_part(b'x' * 400, etag='"older"', length=len(body))
+    before = _statuses()
+
+    _check_downloaded(download(repository), body, part_path)
+    assert _statuses()[200] == before[200] + 1
+
+
+def test_range_ignored_restarts_with_200(repository, download):
+    repository.accept_ranges = False
+    body = repository.pdf(PATH)
+    part_path = _leave_part(body[:400], etag=_etag(), length=len(body))
+
+    _check_downloaded(download(repository), body, part_path)
+
+
+def test_changed_length_restarts(repository, download):
+    body = repository.pdf(PATH)
+    # No validators, and a length the file no longer has
+    part_path = _leave_part(b'x' * 400, length=len(body) + 500)
+
+    _check_downloaded(download(repository), body, part_path)
+
+
+def test_complete_part_is_not_fetched_again(repository, download):
+    body = repository.pdf(PATH)
+    part_path = _leave_part(body, etag=_etag(), length=len(body))
+    before = _statuses()
+
+    _check_downloaded(download(repository), body, part_path)
+    after = _statuses()
+    assert after[416] == before[416] + 1 and after[200] == before[200]
+
+
+def test_stale_part_past_the_end_restarts(repository, download):
+    body = repository.pdf(PATH)
+    # Longer than the file and without validators: the server answers 416
+    part_path = _leave_part(b'x' * 1500)
+    before = _statuses()
+
+    _check_downloaded(download(repository), body, part_path)
+    after = _statuses()
+    assert after[416] == before[416] + 1 and after[200] == before[200] + 1
@@ -0,0 +1,34 @@
+import json
+import os
+
+import main
+from cache import PageCache
+from mock_repository import item_page
+
+
+def test_reparse_skips_bad_pages(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    cache = PageCache('cache/pages')
+    for item in range(1, 6):
+        cache.put(f"11419_{item}", f"https://repository.kallipos.gr/handle/11419/{item}", item_page(item))
+    # A page cached without its metadata, and one that cannot be read
+    os.remove(os.path.join('cache', 'pages', '11419_2.json'))
+    with open(os.path.join('cache', 'pages', '11419_4.html.gz'), 'wb') as f:
+        f.write(b'not gzip')
+
+    main.main(cache_dir='cache/pages', reparse_only=True, processes=1)
+
+    output = capsys.readouterr().out
+    assert "Re-parsed 3 cached pages, skipped 2" in output
+    assert "11419_2" in output and "11419_4" in output
+    with open('books.json', encoding='utf-8') as f:
+        assert sorted(json.load(f)) == ["11419_1", "11419_3", "11419_5"]
+
+
+def test_reparse_needs_the_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+
+    main.main(cache_dir='', reparse_only=True, processes=1)
+
+    assert "Re-parsing needs the page cache" in capsys.readouterr().out
+    assert not os.path.exists('books.jsonl')
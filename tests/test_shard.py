@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from checkpoint import Checkpoint
+from ledger import DownloadLedger
+from shard import Shard, merge
+from storage import BookStore
+
+HANDLE_URL = "https://repository.kallipos.gr/handle/11419/{}"
+
+
+def _book(title):
+    return {'metadata': {'Title': title}, 'links': {}}
+
+
+def _shard(directory, index, count, by, books, stored_at=None, files=None):
+    """
+    Leave the output of a finished shard in `directory`.
+
+    Args:
+        books (dict): {key: title} of the books it stored.
+        stored_at (dict): {key: time} recorded in its checkpoint.
+        files (dict): {key: (status, time)} recorded in its download ledger.
+    """
+    os.makedirs(directory)
+    with open(os.path.join(directory, 'shard.json'), 'w', encoding='utf-8') as f:
+        json.dump({'index': index, 'count': count, 'by': by, 'block': 1}, f)
+    with BookStore(os.path.join(directory, 'books.jsonl')) as store:
+        for key, title in books.items():
+            store.put(key, _book(title))
+    with Checkpoint(os.path.join(directory, 'checkpoint.db')) as checkpoint:
+        for key, when in (stored_at or {}).items():
+            url = HANDLE_URL.format(key.split('_')[1])
+            checkpoint.mark(url, 'stored')
+            checkpoint.conn.execute("UPDATE handles SET updated_at = ? WHERE url = ?", (when, url))
+    with DownloadLedger(os.path.join(directory, 'downloads.db')) as ledger:
+        for key, (status, when) in (files or {}).items():
+            ledger.record(key, status, url=f"https://example.org/{key}", path=os.path.join('Files', key))
+            ledger.conn.execute("UPDATE downloads SET updated_at = ? WHERE key = ?", (when, key))
+
+
+def _owned_by(index, count):
+    """Book keys that hash to shard `index`."""
+    return [key for key in (f"11419_{item}" for item in range(1, 100))
+            if Shard(index, count, by='handle').owns_key(key)]
+
+
+@pytest.fixture
+def merged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def run(*shards):
+        result = merge([directory for directory, *_ in shards])
+        with open('books.json', encoding='utf-8') as f:
+            books = {key: book['metadata']['Title'] for key, book in json.load(f).items()}
+        with open('manifest.json', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return result, books, manifest
+    return run
+
+
+def test_merge_prefers_the_latest_then_the_owner(merged):
+    # Both owned by the second shard, so only a timestamp can favour the first
+    later, owned = _owned_by(1, 2)[:2]
+    shards = [
+        (os.path.join('shards', '0-of-2'), 0, 2, 'handle', {later: "newer", owned: "not owner"},
+         {later: 2000.0}),
+        (os.path.join('shards', '1-of-2'), 1, 2, 'handle', {later: "older", owned: "owner"},
+         {later: 1000.0}),
+    ]
+    for shard in shards:
+        _shard(*shard)
+
+    (count, conflicts, files), books, _ = merged(*shards)
+
+    # The checkpoint timestamp wins even over the handle's owner
+    assert books[later] == "newer"
+    # Without timestamps the shard that owns the handle wins
+    assert books[owned] == "owner"
+    assert (count, conflicts, files) == (2, 2, 0)
+
+
+def test_merge_falls_back_to_the_lowest_shard(merged):
+    shards = [
+        (os.path.join('shards', f'{index}-of-2'), index, 2, 'page', {"11419_1": f"shard {index}"})
+        for index in (1, 0)
+    ]
+    for shard in shards:
+        _shard(*shard)
+
+    _, books, _ = merged(*shards)
+
+    assert books == {"11419_1": "shard 0"}
+
+
+def test_merge_manifest_prefers_finished_downloads(merged):
+    first, second = os.path.join('shards', '0-of-2'), os.path.join('shards', '1-of-2')
+    _shard(first, 0, 2, 'page', {}, files={'11419_1_Book.pdf': ('done', 1000.0),
+                                            '11419_1_Toc.pdf': ('done', 1000.0)})
+    _shard(second, 1, 2, 'page', {}, files={'11419_1_Book.pdf': ('failed', 2000.0),
+                                             '11419_1_Toc.pdf': ('done', 2000.0)})
+
+    (_, _, files), _, manifest = merged((first,), (second,))
+
+    assert files == 2
+    # A finished download beats a later failure; between two, the later one wins
+    assert manifest['11419_1_Book.pdf']['status'] == 'done'
+    assert manifest['11419_1_Book.pdf']['shard'] == first
+    assert manifest['11419_1_Toc.pdf']['shard'] == second
+    assert manifest['11419_1_Toc.pdf']['path'] == os.path.join(second, 'Files', '11419_1_Toc.pdf')
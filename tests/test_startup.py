@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy optional modules that a plain HTTP run must never import
+LAZY_MODULES = ('selenium', 'webdriver_manager', 'aiohttp')
+
+
+@pytest.mark.parametrize('modules', ['main, pdfs, BookScraper', 'kallipos', 'oai, catalogue, shard'])
+def test_import_leaves_optional_modules_unloaded(modules):
+    # A fresh interpreter, since this one may have imported them already
+    check = (f"import sys; sys.path.insert(0, {ROOT!r}); import {modules}; "
+             f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    loaded = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == ''
+
+
+def test_help_leaves_optional_modules_unloaded():
+    # `kallipos.py crawl --help` imports main through the subcommand table
+    check = (f"import sys, runpy; sys.path.insert(0, {ROOT!r}); sys.argv = ['kallipos.py', 'crawl', '--help']\n"
+             f"try:\n    runpy.run_path({os.path.join(ROOT, 'kallipos.py')!r}, run_name='__main__')\n"
+             f"except SystemExit:\n    pass\n"
+             f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules), file=sys.stderr)")
+    result = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+    assert result.stderr.strip() == ''
@@ -0,0 +1,40 @@
+import json
+
+from storage import BookStore, iter_books
+
+
+def test_delete_hides_book_until_put_again(tmp_path):
+    path = str(tmp_path / 'books.jsonl')
+    with BookStore(path) as store:
+        store.put("11419_1", {'links': {}, 'metadata': {'Title': "A"}})
+        store.put("11419_2", {'links': {}, 'metadata': {'Title': "B"}})
+        store.delete("11419_1")
+        assert "11419_1" not in store and len(store) == 1
+        assert list(store.load()) == ["11419_2"]
+        assert [key for key, _ in iter_books(path)] == ["11419_2"]
+
+        store.export(str(tmp_path / 'books.json'))
+        with open(tmp_path / 'books.json', encoding='utf-8') as f:
+            assert list(json.load(f)) == ["11419_2"]
+
+        store.put("11419_1", {'links': {}, 'metadata': {'Title': "A2"}})
+        assert store.load()["11419_1"]['metadata']['Title'] == "A2"
+        store.delete("11419_2")
+
+    # Reopening and compacting keep the deletions
+    with BookStore(path) as store:
+        assert set(store.load()) == {"11419_1"} and len(store) == 1
+        store.compact()
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['key'] for line in f] == ["11419_1"]
+
+
+def test_clear(tmp_path):
+    path = str(tmp_path / 'changed_books.jsonl')
+    with BookStore(path) as store:
+        store.put("11419_1", {'links': {}, 'metadata': {}})
+        store.clear()
+        assert len(store) == 0
+        store.put("11419_2", {'links': {}, 'metadata': {}})
+    with BookStore(path) as store:
+        assert list(store.load()) == ["11419_2"]